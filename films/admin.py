@@ -1,3 +1,22 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import TranscodeJob
+from .tasks import enqueue_conversion
+
+
+@admin.register(TranscodeJob)
+class TranscodeJobAdmin(admin.ModelAdmin):
+    list_display = ('film', 'status', 'stage', 'percent', 'created_at',
+                    'started_at', 'finished_at', 'encode_fps')
+    list_filter = ('status',)
+    search_fields = ('film__name', 'task_id')
+    actions = ['requeue']
+
+    @admin.action(description='Ponów konwersję wybranych filmów')
+    def requeue(self, request, queryset):
+        """ Nowe zlecenie dla filmów, których konwersja się nie udała """
+        films = {job.film for job in queryset.filter(
+            status=TranscodeJob.STATUS_FAILED).select_related('film')}
+        for film in films:
+            enqueue_conversion(film)
+        self.message_user(request, f"Ponowiono konwersję {len(films)} filmów")
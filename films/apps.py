@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FilmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'films'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Podpina pomiar zapytań do nowych połączeń (także w wątkach widoków async)
+        from . import middleware  # noqa: F401
+        # Indeks pełnotekstowy filmów (GIN / FTS5) po migracji
+        from .search import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
@@ -0,0 +1,115 @@
+""" Klucze i odczyty cache'u dla danych filmów """
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Film, Ratings
+from .previews import thumbnail_srcsets
+
+# Zmiana formatu przechowywanych danych = nowa wersja kluczy
+CACHE_VERSION = 1
+RATINGS_TIMEOUT = 3600
+
+
+def film_ratings_key(film_id):
+    return f"film_ratings:v{CACHE_VERSION}:{film_id}"
+
+
+def _film_ratings_queryset(film_id):
+    return Ratings.objects.filter(film_id=film_id).order_by('id').values(
+        'user__username', 'rating', 'comments')
+
+
+def _ratings_summary(ratings):
+    count = len(ratings)
+    return {
+        'ratings': ratings,
+        'count': count,
+        'average': sum(r['rating'] for r in ratings) / count if count else None,
+    }
+
+
+async def aget_film_ratings(film_id):
+    """ Oceny filmu wraz ze średnią i liczbą - jeden odczyt z cache'u """
+    key = film_ratings_key(film_id)
+    data = await cache.aget(key)
+    if data is None:
+        data = _ratings_summary([r async for r in _film_ratings_queryset(film_id)])
+        await cache.aset(key, data, timeout=RATINGS_TIMEOUT)
+    return data
+
+
+def invalidate_film_ratings(film_id):
+    cache.delete(film_ratings_key(film_id))
+
+
+CATALOGUE_TIMEOUT = 3600
+DEFAULT_CATALOGUE_PAGE_SIZE = 24
+CATALOGUE_GENERATION_KEY = f"catalogue_generation:v{CACHE_VERSION}"
+
+
+FILM_TILE_FIELDS = ('id', 'name', 'thumbnail', 'has_previews', 'thumbnail_variants')
+
+
+def film_tile(row):
+    """ Dane kafelka filmu (katalog, "oglądaj dalej") z wiersza values(*FILM_TILE_FIELDS) """
+    storage = Film._meta.get_field('thumbnail').storage
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'thumbnail_url': storage.url(row['thumbnail']) if row['thumbnail'] else '',
+        'srcsets': (thumbnail_srcsets(row['id'], row['thumbnail_variants'])
+                    if row['has_previews'] else {}),
+    }
+
+
+def catalogue_page_size():
+    return getattr(settings, 'CATALOGUE_PAGE_SIZE', DEFAULT_CATALOGUE_PAGE_SIZE)
+
+
+def _catalogue_generation():
+    """ Numer generacji katalogu - jego zmiana unieważnia wszystkie strony naraz """
+    generation = cache.get(CATALOGUE_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOGUE_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(CATALOGUE_GENERATION_KEY)
+    return generation
+
+
+def catalogue_page_key(generation, cursor):
+    return f"catalogue:v{CACHE_VERSION}:{generation}:{cursor or 'first'}"
+
+
+def get_catalogue_page(cursor=None):
+    """ Strona katalogu od najnowszych filmów, stronicowana po id (keyset)
+
+    Zwraca {'films': [...], 'next_cursor': id|None}; w cache'u trzymamy
+    tylko pola potrzebne kafelkom na stronie startowej.
+    """
+    key = catalogue_page_key(_catalogue_generation(), cursor)
+    page = cache.get(key)
+    if page is None:
+        size = catalogue_page_size()
+        films = Film.objects.order_by('-id')
+        if cursor is not None:
+            films = films.filter(id__lt=cursor)
+        rows = list(films.values(*FILM_TILE_FIELDS)[:size + 1])
+        page = {
+            'films': [film_tile(row) for row in rows[:size]],
+            'next_cursor': rows[size - 1]['id'] if len(rows) > size else None,
+        }
+        cache.set(key, page, timeout=CATALOGUE_TIMEOUT)
+    return page
+
+
+def invalidate_catalogue_first_page():
+    """ Nowy film ma największe id, więc zmienia tylko pierwszą stronę """
+    cache.delete(catalogue_page_key(_catalogue_generation(), None))
+
+
+def invalidate_catalogue():
+    try:
+        cache.incr(CATALOGUE_GENERATION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_GENERATION_KEY, time.time_ns(), timeout=None)
@@ -0,0 +1,141 @@
+""" Sprzątanie plików usuniętych filmów i okresowe usuwanie osieroconych plików
+
+Usunięcie filmu (także QuerySet.delete() i panel admina) zleca zadanie
+Celery, które kasuje źródło, miniaturę, podglądy, katalog HLS i wpisy
+cache'u. Katalog HLS jest wspólny dla filmów o tym samym źródle (films.tasks.hls_key),
+więc znika dopiero razem z ostatnim z nich. Okresowy przegląd porównuje
+pliki w storage z tabelą filmów i usuwa to, czego żaden film nie używa.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import film_ratings_key
+from .models import Film, VideoUpload
+from .storage import (HLS_PREFIX, PREVIEWS_PREFIX, delete_tree, hls_prefix,
+                      media_storage, previews_prefix, walk_files)
+from .tasks import hls_key
+
+logger = logging.getLogger(__name__)
+
+# Pliki młodsze niż tyle sekund nie są usuwane przez przegląd - mogą należeć
+# do filmu, którego transakcja jeszcze trwa (settings.MEDIA_SWEEP_MIN_AGE)
+DEFAULT_SWEEP_MIN_AGE = 24 * 3600
+# Katalogi z plikami źródłowymi i miniaturami (upload_to pól Film)
+SOURCE_PREFIXES = ("videos/before", "thumbnails")
+
+
+def sweep_min_age():
+    return getattr(settings, "MEDIA_SWEEP_MIN_AGE", DEFAULT_SWEEP_MIN_AGE)
+
+
+def film_media(film):
+    """ Nazwy plików filmu zapamiętane przed usunięciem wiersza """
+    return {
+        "film_id": film.id,
+        "link": film.link.name or "",
+        "thumbnail": film.thumbnail.name or "",
+        "hls_key": hls_key(film),
+        "content_hash": film.content_hash,
+        "encoder_profile": film.encoder_profile,
+    }
+
+
+def _delete_if_unused(storage, name, field):
+    if name and not Film.objects.filter(**{field: name}).exists():
+        storage.delete(name)
+        return True
+    return False
+
+
+def cleanup_film_media(media):
+    """ Usuwa pliki i cache usuniętego filmu; zwraca listę usuniętych nazw """
+    storage = media_storage()
+    film_id = media["film_id"]
+    removed = []
+
+    for field in ("link", "thumbnail"):
+        if _delete_if_unused(storage, media[field], field):
+            removed.append(media[field])
+
+    delete_tree(previews_prefix(film_id), storage)
+    removed.append(previews_prefix(film_id))
+
+    # Inny film z tym samym źródłem i profilem nadal odtwarza te segmenty
+    shared = bool(media["content_hash"]) and Film.objects.filter(
+        content_hash=media["content_hash"],
+        encoder_profile=media["encoder_profile"]).exists()
+    if not shared:
+        delete_tree(hls_prefix(media["hls_key"]), storage)
+        removed.append(hls_prefix(media["hls_key"]))
+
+    # Wyniki części konwersji wygasają same (HLS_LOCK_TIMEOUT)
+    cache.delete(film_ratings_key(film_id))
+    return removed
+
+
+def _older_than(storage, name, cutoff):
+    try:
+        return storage.get_modified_time(name) < cutoff
+    except (NotImplementedError, OSError):
+        return False
+
+
+def _top_level(prefix, storage):
+    try:
+        return storage.listdir(prefix)
+    except FileNotFoundError:
+        return [], []
+
+
+def sweep_orphaned_media(dry_run=False, min_age=None):
+    """ Usuwa pliki, których nie używa żaden film; zwraca listę nazw
+
+    Sprawdzane są katalogi HLS i podglądów, pliki źródłowe i miniatury oraz
+    części przerwanych uploadów bez wpisu VideoUpload.
+    """
+    storage = media_storage()
+    min_age = sweep_min_age() if min_age is None else min_age
+    cutoff = timezone.now() - timedelta(seconds=min_age)
+    orphans = []
+
+    films = list(Film.objects.only(
+        "id", "link", "thumbnail", "content_hash", "encoder_profile"))
+    hls_keys = {hls_key(film) for film in films}
+    film_ids = {str(film.id) for film in films}
+    used_files = {film.link.name for film in films} | {film.thumbnail.name for film in films}
+
+    directories = [(HLS_PREFIX, hls_keys), (PREVIEWS_PREFIX, film_ids)]
+    for prefix, used in directories:
+        for directory in _top_level(prefix, storage)[0]:
+            if directory in used:
+                continue
+            orphans += [name for name in walk_files(f"{prefix}/{directory}", storage)
+                        if _older_than(storage, name, cutoff)]
+
+    for prefix in SOURCE_PREFIXES:
+        orphans += [name for name in walk_files(prefix, storage)
+                    if name not in used_files and _older_than(storage, name, cutoff)]
+
+    parts_dir = VideoUpload.parts_dir()
+    uploads = {str(upload_id) for upload_id in VideoUpload.objects.values_list("id", flat=True)}
+    stale_parts = []
+    if os.path.isdir(parts_dir):
+        for name in os.listdir(parts_dir):
+            path = os.path.join(parts_dir, name)
+            if (name.removesuffix(".part") not in uploads
+                    and os.path.getmtime(path) < cutoff.timestamp()):
+                stale_parts.append(path)
+
+    if not dry_run:
+        for name in orphans:
+            storage.delete(name)
+        for path in stale_parts:
+            os.remove(path)
+        if orphans or stale_parts:
+            logger.info(f"🧹 Usunięto osierocone pliki: {len(orphans) + len(stale_parts)}")
+    return orphans + stale_parts
@@ -0,0 +1,28 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+
+def progress_group_name(film_id):
+    """ Nazwa grupy Channels, do której trafia postęp konwersji filmu """
+    return f"film_progress_{film_id}"
+
+
+class FilmProgressConsumer(AsyncJsonWebsocketConsumer):
+    """ Przekazuje administratorom postęp konwersji filmu przez WebSocket """
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_superuser:
+            await self.close()
+            return
+        self.group_name = progress_group_name(
+            self.scope["url_route"]["kwargs"]["film_id"])
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(
+                self.group_name, self.channel_name)
+
+    async def film_progress(self, event):
+        await self.send_json(event["data"])
@@ -1,4 +1,6 @@
 from django import forms
+from .models import Film
+from .hls import encoder_profile_choices
 
 
 class VideoForm(forms.Form):
@@ -7,6 +9,11 @@ class VideoForm(forms.Form):
         label="Video description", max_length=100)
     link = forms.FileField()
     thumbnail = forms.FileField()
+    priority = forms.TypedChoiceField(
+        choices=Film.PRIORITY_CHOICES, coerce=int, required=False,
+        empty_value=Film.PRIORITY_NORMAL, initial=Film.PRIORITY_NORMAL)
+    encoder_profile = forms.ChoiceField(
+        choices=encoder_profile_choices, required=False)
 
 
 class RatingForm(forms.Form):
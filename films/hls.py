@@ -0,0 +1,386 @@
+""" Pomocnicze funkcje FFmpeg używane przy konwersji filmów do HLS """
+import os
+
+import ffmpeg
+from django.conf import settings
+
+
+# Domyślna drabinka jakości, nadpisywana przez settings.HLS_RENDITIONS
+DEFAULT_HLS_RENDITIONS = [
+    {"name": "1080p", "height": 1080, "video_bitrate": "5000k",
+     "maxrate": "5350k", "bufsize": "7500k", "audio_bitrate": "192k"},
+    {"name": "720p", "height": 720, "video_bitrate": "2800k",
+     "maxrate": "2996k", "bufsize": "4200k", "audio_bitrate": "128k"},
+    {"name": "480p", "height": 480, "video_bitrate": "1400k",
+     "maxrate": "1498k", "bufsize": "2100k", "audio_bitrate": "128k"},
+    {"name": "360p", "height": 360, "video_bitrate": "800k",
+     "maxrate": "856k", "bufsize": "1200k", "audio_bitrate": "96k"},
+]
+
+MASTER_PLAYLIST_NAME = "master.m3u8"
+
+# Profile kodowania, wybierane per film (Film.encoder_profile) albo globalnie
+# (settings.HLS_DEFAULT_PROFILE); nadpisywane przez settings.HLS_ENCODER_PROFILES.
+# Brakujące klucze biorą wartości z PROFILE_DEFAULTS. Z "crf" bitrate
+# z drabinki nie jest celem, tylko górnym limitem (maxrate/bufsize).
+PROFILE_DEFAULTS = {
+    "video_codec": "libx264",
+    "preset": "fast",
+    "crf": None,
+    # Odstęp (s) wymuszonych klatek kluczowych, domyślnie długość segmentu
+    "keyframe_interval": None,
+    "segment_time": 10,
+    # 0 - liczbę wątków dobiera FFmpeg
+    "threads": 0,
+    # "fmp4" dla HEVC/AV1 - segmenty .m4s z plikiem init
+    "segment_type": "mpegts",
+    "codec_tag": None,
+    # 8-bitowe 4:2:0 - źródła 10-bitowe i 4:4:4 dałyby profile High10/High444,
+    # których przeglądarki i większość telefonów nie odtworzą
+    "pixel_format": "yuv420p",
+    # Dodatkowe opcje enkodera, np. {"x265-params": "..."}
+    "options": {},
+}
+DEFAULT_ENCODER_PROFILES = {
+    "balanced": {},
+    "fast": {"preset": "veryfast", "segment_time": 4},
+    "quality": {"preset": "slow", "crf": 20},
+    "hevc": {"video_codec": "libx265", "preset": "medium", "crf": 24,
+             "codec_tag": "hvc1", "segment_type": "fmp4",
+             "options": {"x265-params": "log-level=error"}},
+    "av1": {"video_codec": "libsvtav1", "preset": "8", "crf": 32,
+            "segment_type": "fmp4"},
+}
+DEFAULT_ENCODER_PROFILE = "balanced"
+
+# Filmy od tej długości (s) są dzielone na części kodowane równolegle,
+# nadpisywane przez settings.HLS_PARALLEL_MIN_DURATION / HLS_CHUNK_SECONDS
+DEFAULT_PARALLEL_MIN_DURATION = 600
+DEFAULT_CHUNK_SECONDS = 120
+
+# Źródła H.264/AAC z klatkami kluczowymi nie rzadziej niż co tyle sekund
+# są tylko przepakowywane do HLS (settings.HLS_REMUX_MAX_KEYFRAME_INTERVAL)
+DEFAULT_REMUX_MAX_KEYFRAME_INTERVAL = 10
+REMUX_VIDEO_CODECS = {"h264"}
+REMUX_AUDIO_CODECS = {"aac"}
+REMUX_PIXEL_FORMATS = {"yuv420p", "yuvj420p"}
+REMUX_RENDITION_NAME = "source"
+
+
+def get_renditions():
+    """ Zwraca drabinkę jakości z ustawień """
+    return getattr(settings, "HLS_RENDITIONS", DEFAULT_HLS_RENDITIONS)
+
+
+def get_encoder_profiles():
+    return getattr(settings, "HLS_ENCODER_PROFILES", DEFAULT_ENCODER_PROFILES)
+
+
+def get_encoder_profile(name=None):
+    """ Zwraca profil kodowania uzupełniony wartościami domyślnymi
+
+    Pusta albo nieznana nazwa oznacza profil domyślny z ustawień.
+    """
+    profiles = get_encoder_profiles()
+    if not name or name not in profiles:
+        name = getattr(settings, "HLS_DEFAULT_PROFILE", DEFAULT_ENCODER_PROFILE)
+    profile = {**PROFILE_DEFAULTS, **profiles.get(name, {}), "name": name}
+    if not profile["keyframe_interval"]:
+        profile["keyframe_interval"] = profile["segment_time"]
+    return profile
+
+
+def encoder_profile_choices():
+    """ Wybór profilu w formularzach - pusta wartość to profil domyślny """
+    default = getattr(settings, "HLS_DEFAULT_PROFILE", DEFAULT_ENCODER_PROFILE)
+    return [("", f"Default ({default})")] + [
+        (name, name) for name in get_encoder_profiles()]
+
+
+def probe_source(input_file):
+    """ Odczytuje z ffprobe czas trwania, rozdzielczość i obecność audio """
+    info = ffmpeg.probe(input_file)
+    video = next((s for s in info["streams"]
+                  if s.get("codec_type") == "video"), None)
+    audio = next((s for s in info["streams"]
+                  if s.get("codec_type") == "audio"), None)
+    duration = info.get("format", {}).get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "width": int(video["width"]) if video else None,
+        "height": int(video["height"]) if video else None,
+        "video_codec": video.get("codec_name") if video else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+        "has_audio": audio is not None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+    }
+
+
+def select_renditions(renditions, source_height):
+    """ Pomija jakości wyższe od źródła, zostawiając co najmniej najniższą """
+    if not source_height:
+        return list(renditions)
+    selected = [r for r in renditions if r["height"] <= source_height]
+    if not selected:
+        selected = [min(renditions, key=lambda r: r["height"])]
+    return selected
+
+
+def build_hls_command(input_file, output_dir, renditions, has_audio=True,
+                      segment_time=None, prefix="", ts_offset=None,
+                      profile=None):
+    """ Buduje komendę FFmpeg tworzącą wszystkie jakości w jednym przebiegu
+
+    `prefix` i `ts_offset` pozwalają zakodować pojedynczą część filmu tak,
+    żeby jej segmenty dało się później dokleić do wspólnej playlisty.
+    """
+    profile = profile or get_encoder_profile()
+    segment_time = segment_time or profile["segment_time"]
+    fmp4 = profile["segment_type"] == "fmp4"
+    count = len(renditions)
+    filters = ["[0:v]split=%d%s" % (
+        count, "".join(f"[v{i}]" for i in range(count)))]
+    for i, rendition in enumerate(renditions):
+        filters.append(f"[v{i}]scale=-2:{rendition['height']},"
+                       f"format={profile['pixel_format']}[v{i}out]")
+
+    command = [
+        "ffmpeg", "-y",
+        # Postęp jako pary klucz=wartość na stdout zamiast statystyk na stderr
+        "-progress", "pipe:1", "-nostats",
+        "-i", input_file,
+        "-filter_complex", ";".join(filters),
+    ]
+    stream_map = []
+    for i, rendition in enumerate(renditions):
+        command += ["-map", f"[v{i}out]", f"-c:v:{i}", profile["video_codec"]]
+        if profile["crf"] is not None:
+            command += [f"-crf:v:{i}", str(profile["crf"])]
+        else:
+            command += [f"-b:v:{i}", rendition["video_bitrate"]]
+        command += [
+            f"-maxrate:v:{i}", rendition["maxrate"],
+            f"-bufsize:v:{i}", rendition["bufsize"],
+        ]
+        if has_audio:
+            command += [
+                "-map", "0:a:0",
+                f"-c:a:{i}", "aac",
+                f"-b:a:{i}", rendition["audio_bitrate"],
+            ]
+            stream_map.append(f"v:{i},a:{i},name:{rendition['name']}")
+        else:
+            stream_map.append(f"v:{i},name:{rendition['name']}")
+
+    command += ["-preset", str(profile["preset"])]
+    if profile["codec_tag"]:
+        command += ["-tag:v", profile["codec_tag"]]
+    if profile["threads"]:
+        command += ["-threads", str(profile["threads"])]
+    for option, value in profile["options"].items():
+        command += [f"-{option}", str(value)]
+    keyframe_interval = min(profile["keyframe_interval"], segment_time)
+    command += [
+        # Klatki kluczowe w tych samych miejscach we wszystkich jakościach
+        "-force_key_frames", f"expr:gte(t,n_forced*{keyframe_interval})",
+        "-sc_threshold", "0",
+    ]
+    if has_audio:
+        command += ["-ac", "2"]
+    if ts_offset:
+        command += ["-output_ts_offset", f"{ts_offset:.6f}"]
+    command += [
+        "-f", "hls",
+        "-start_number", "0",
+        "-hls_time", str(segment_time),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+    ]
+    if fmp4:
+        command += ["-hls_segment_type", "fmp4",
+                    "-hls_fmp4_init_filename", f"{prefix}init.mp4"]
+    command += [
+        "-hls_segment_filename",
+        os.path.join(output_dir, "%v",
+                     f"{prefix}segment%d.{'m4s' if fmp4 else 'ts'}"),
+        "-master_pl_name", prefix + MASTER_PLAYLIST_NAME,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "%v", f"{prefix}index.m3u8"),
+    ]
+    return command
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def progress_state(block, total_duration=None):
+    """ Przelicza blok `-progress` na procent, prędkość i pozostały czas """
+    out_time_us = _parse_float(block.get("out_time_us"))
+    out_time = out_time_us / 1_000_000 if out_time_us is not None else None
+    speed = _parse_float(block.get("speed", "").rstrip("x"))
+    state = {
+        "out_time": out_time,
+        "fps": _parse_float(block.get("fps")),
+        "speed": speed,
+        "percent": None,
+        "eta": None,
+        "done": block.get("progress") == "end",
+    }
+    if state["done"]:
+        state["percent"] = 100.0
+        state["eta"] = 0.0
+    elif total_duration and out_time is not None:
+        state["percent"] = max(0.0, min(100.0, out_time / total_duration * 100))
+        if speed:
+            state["eta"] = max(0.0, (total_duration - out_time) / speed)
+    return state
+
+
+def iter_progress(stream, total_duration=None):
+    """ Czyta wyjście `-progress pipe:1` linia po linii i zwraca kolejne stany """
+    block = {}
+    for line in stream:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value.strip()
+        # Linia "progress=continue|end" zamyka każdy blok
+        if key == "progress":
+            yield progress_state(block, total_duration)
+            block = {}
+
+
+def codecs_allow_remux(source):
+    """ Sprawdza, czy kodeki źródła są odtwarzalne w HLS bez rekompresji """
+    if source.get("video_codec") not in REMUX_VIDEO_CODECS:
+        return False
+    if source.get("pix_fmt") not in REMUX_PIXEL_FORMATS:
+        return False
+    if source.get("has_audio") and source.get("audio_codec") not in REMUX_AUDIO_CODECS:
+        return False
+    return True
+
+
+def keyframes_allow_remux(keyframes, duration, max_interval):
+    """ Sprawdza, czy odstępy klatek kluczowych dadzą segmenty rozsądnej długości """
+    if not keyframes:
+        return False
+    times = sorted(keyframes)
+    if duration:
+        times.append(duration)
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return max(gaps, default=0) <= max_interval
+
+
+def build_remux_command(input_file, output_dir, has_audio=True,
+                        segment_time=10):
+    """ Buduje komendę FFmpeg przepakowującą źródło do HLS bez rekompresji """
+    stream_map = f"v:0,a:0,name:{REMUX_RENDITION_NAME}" if has_audio \
+        else f"v:0,name:{REMUX_RENDITION_NAME}"
+    command = [
+        "ffmpeg", "-y",
+        "-progress", "pipe:1", "-nostats",
+        "-i", input_file,
+        "-map", "0:v:0",
+    ]
+    if has_audio:
+        command += ["-map", "0:a:0"]
+    command += [
+        "-c", "copy",
+        "-f", "hls",
+        "-start_number", "0",
+        "-hls_time", str(segment_time),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename",
+        os.path.join(output_dir, "%v", "segment%d.ts"),
+        "-master_pl_name", MASTER_PLAYLIST_NAME,
+        "-var_stream_map", stream_map,
+        os.path.join(output_dir, "%v", "index.m3u8"),
+    ]
+    return command
+
+
+def probe_keyframes(input_file):
+    """ Zwraca czasy (s) klatek kluczowych pierwszej ścieżki wideo """
+    info = ffmpeg.probe(input_file, select_streams="v:0",
+                        show_entries="packet=pts_time,flags")
+    return [float(packet["pts_time"]) for packet in info.get("packets", [])
+            if "K" in packet.get("flags", "")
+            and packet.get("pts_time") not in (None, "N/A")]
+
+
+def plan_chunks(keyframes, duration, chunk_seconds):
+    """ Wybiera klatki kluczowe, na których film zostanie pocięty na części
+
+    Każda część trwa co najmniej `chunk_seconds`, a ostatnia nie jest
+    krótsza niż połowa tej wartości.
+    """
+    cut_times = []
+    last_cut = 0.0
+    for time in sorted(keyframes):
+        if time - last_cut < chunk_seconds:
+            continue
+        if duration and duration - time < chunk_seconds / 2:
+            break
+        cut_times.append(time)
+        last_cut = time
+    return cut_times
+
+
+def build_split_command(input_file, chunk_pattern, chunk_list, cut_times):
+    """ Tnie źródło bez rekompresji na części zaczynające się od klatek kluczowych """
+    return [
+        "ffmpeg", "-y",
+        "-i", input_file,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_times", ",".join(f"{t:.6f}" for t in cut_times),
+        "-segment_list", chunk_list,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        chunk_pattern,
+    ]
+
+
+def read_chunk_list(chunk_list):
+    """ Odczytuje listę części (plik, początek) zapisaną przez muxer segment """
+    chunks = []
+    with open(chunk_list) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 2:
+                chunks.append((parts[0], float(parts[1])))
+    return chunks
+
+
+def concat_playlists(playlists):
+    """ Skleja playlisty kolejnych części w jedną playlistę VOD """
+    target_duration = 0
+    entries = []
+    for playlist in playlists:
+        pending = []
+        for line in playlist.splitlines():
+            line = line.strip()
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                target_duration = max(
+                    target_duration, int(line.split(":", 1)[1]))
+            elif line.startswith("#EXTINF:"):
+                pending.append(line)
+            elif line and not line.startswith("#"):
+                entries.extend(pending)
+                entries.append(line)
+                pending = []
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ] + entries + ["#EXT-X-ENDLIST"]
+    return "\n".join(lines) + "\n"
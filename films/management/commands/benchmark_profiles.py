@@ -0,0 +1,93 @@
+""" Porównanie profili kodowania na próbce: fps enkodera i bitrate wyjścia """
+import os
+import subprocess
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+
+from films.hls import (build_hls_command, get_encoder_profile,
+                       get_encoder_profiles, get_renditions, probe_source,
+                       select_renditions)
+from films.storage import tree_size
+from films.tasks import run_ffmpeg
+
+
+def benchmark_profile(clip, output_dir, renditions, source, profile):
+    """ Koduje próbkę jednym profilem, zwraca czas, fps i bitrate każdej jakości """
+    last_state = {}
+
+    def on_progress(state):
+        last_state.update(state)
+
+    command = build_hls_command(clip, output_dir, renditions,
+                                has_audio=source["has_audio"], profile=profile)
+    started = time.monotonic()
+    run_ffmpeg(command, source["duration"], on_progress)
+    wall_time = time.monotonic() - started
+    outputs = FileSystemStorage(location=output_dir)
+    return {
+        "profile": profile["name"],
+        "wall_time": wall_time,
+        "fps": last_state.get("fps"),
+        "speed": source["duration"] / wall_time if wall_time else None,
+        # kbit/s - segmenty, init i playlista danej jakości
+        "bitrates": {
+            r["name"]: tree_size(r["name"], outputs)
+            * 8 / source["duration"] / 1000
+            for r in renditions
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Koduje próbkę każdym profilem i raportuje fps enkodera oraz bitrate wyjścia"
+
+    def add_arguments(self, parser):
+        parser.add_argument("clip", help="plik wideo do zakodowania")
+        parser.add_argument("--profiles", nargs="+",
+                            help="nazwy profili, domyślnie wszystkie")
+        parser.add_argument("--renditions", nargs="+",
+                            help="nazwy jakości, domyślnie drabinka dopasowana do źródła")
+
+    def handle(self, *args, **options):
+        clip = options["clip"]
+        if not os.path.isfile(clip):
+            raise CommandError(f"Plik nie istnieje: {clip}")
+        source = probe_source(clip)
+        if not source["duration"]:
+            raise CommandError("Nie można odczytać czasu trwania próbki")
+
+        if options["renditions"]:
+            renditions = [r for r in get_renditions()
+                          if r["name"] in options["renditions"]]
+        else:
+            renditions = select_renditions(get_renditions(), source["height"])
+        if not renditions:
+            raise CommandError("Żadna z podanych jakości nie istnieje")
+
+        names = options["profiles"] or list(get_encoder_profiles())
+        unknown = set(names) - set(get_encoder_profiles())
+        if unknown:
+            raise CommandError(f"Nieznane profile: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(
+            f"{clip}: {source['duration']:.1f} s, {source['width']}x{source['height']}, "
+            f"jakości {', '.join(r['name'] for r in renditions)}")
+        for name in names:
+            with tempfile.TemporaryDirectory() as output_dir:
+                try:
+                    result = benchmark_profile(
+                        clip, output_dir, renditions, source,
+                        get_encoder_profile(name))
+                except subprocess.CalledProcessError as e:
+                    error = (e.stderr or "").strip().splitlines() or [str(e)]
+                    self.stderr.write(f"{name:<12} błąd FFmpeg: {error[-1]}")
+                    continue
+            bitrates = ", ".join(
+                f"{rendition} {kbps:.0f} kb/s"
+                for rendition, kbps in result["bitrates"].items())
+            self.stdout.write(
+                f"{name:<12} {result['wall_time']:7.1f} s  "
+                f"{result['fps'] or 0:6.1f} fps  {result['speed'] or 0:5.2f}x  {bitrates}")
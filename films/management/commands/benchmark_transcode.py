@@ -0,0 +1,277 @@
+""" Powtarzalny pomiar wydajności konwersji na syntetycznych źródłach (lavfi) """
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+from celery import current_app
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from films.hls import get_encoder_profiles
+from films.models import Film
+from films.tasks import convert_to_hls_task, hls_key, hls_output_dir
+
+
+DEFAULT_RESOLUTIONS = ["640x360", "1280x720", "1920x1080"]
+DEFAULT_DURATIONS = [10]
+DEFAULT_FRAME_RATE = 25
+DEFAULT_OUTPUT = "benchmark_results.json"
+SEGMENT_EXTENSIONS = (".ts", ".m4s")
+
+# Pomiar bez Redisa - blokady i postęp konwersji zostają w procesie
+ISOLATED_SETTINGS = {
+    "CACHES": {"default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "CHANNEL_LAYERS": {"default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    # Wyniki liczone z plików na dysku, nawet gdy media leżą w S3
+    "STORAGES": {**settings.STORAGES, "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage"}},
+}
+
+
+def parse_resolution(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise CommandError(f"Niepoprawna rozdzielczość: {value} (oczekiwano np. 1280x720)")
+    return width, height
+
+
+def build_fixture_command(path, width, height, duration, frame_rate, codec="mpeg4"):
+    """ Źródło testowe z lavfi: plansza testsrc2 i ton sinusoidy
+
+    Domyślny MPEG-4 Part 2 wymusza pełne kodowanie; "h264" sprawdza
+    ścieżkę przepakowania bez rekompresji.
+    """
+    video_codec = ["-c:v", "libx264", "-preset", "ultrafast", "-g", str(frame_rate)] \
+        if codec == "h264" else ["-c:v", "mpeg4", "-q:v", "4"]
+    return [
+        "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i",
+        f"testsrc2=size={width}x{height}:rate={frame_rate}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        *video_codec,
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        "-shortest",
+        path,
+    ]
+
+
+def count_segments(output_dir):
+    """ Liczba segmentów mediów we wszystkich jakościach """
+    return sum(
+        1 for _, _, files in os.walk(output_dir)
+        for name in files if name.endswith(SEGMENT_EXTENSIONS))
+
+
+def conversion_mode(output_dir):
+    """ Która ścieżka konwersji została użyta: remux, chunked albo ladder """
+    names = os.listdir(output_dir) if os.path.isdir(output_dir) else []
+    if "source" in names:
+        return "remux"
+    for root, _, files in os.walk(output_dir):
+        if any(name.startswith("c0000_") for name in files):
+            return "chunked"
+    return "ladder"
+
+
+def resource_usage():
+    """ Czas CPU tego procesu i zakończonych procesów potomnych (FFmpeg) """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu_time": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        # Linux podaje kB - największy z zakończonych procesów potomnych
+        "peak_rss_kb": children.ru_maxrss,
+    }
+
+
+def run_case(fixture, case, profile=None):
+    """ Przepuszcza źródło przez convert_to_hls_task i zwraca metryki
+
+    Film i jego zlecenie powstają w transakcji wycofywanej na końcu,
+    a pliki w tymczasowym MEDIA_ROOT - baza i media zostają nietknięte.
+    """
+    media_root = tempfile.mkdtemp(prefix="hls-benchmark-")
+    try:
+        os.makedirs(os.path.join(media_root, "videos"))
+        link = os.path.join("videos", os.path.basename(fixture))
+        shutil.copy(fixture, os.path.join(media_root, link))
+
+        # Części kodowane równolegle i ich sklejanie też wykonają się w tym procesie
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        try:
+            with override_settings(MEDIA_ROOT=media_root, **ISOLATED_SETTINGS), \
+                    transaction.atomic():
+                film = Film.objects.create(
+                    name=case["name"][:30], description="benchmark", link=link,
+                    encoder_profile=profile or "")
+                before = resource_usage()
+                started = time.monotonic()
+                convert_to_hls_task.apply(args=(film.id,))
+                wall_time = time.monotonic() - started
+                after = resource_usage()
+
+                film.refresh_from_db()
+                job = film.transcode_jobs.order_by("-id").first()
+                output_dir = hls_output_dir(hls_key(film))
+                frames = case["duration"] * case["frame_rate"]
+                result = {
+                    **case,
+                    "status": job.status if job else None,
+                    "error": job.error if job else "",
+                    "profile": job.profile if job else profile,
+                    "mode": conversion_mode(output_dir),
+                    "wall_time": round(wall_time, 3),
+                    "cpu_time": round(after["cpu_time"] - before["cpu_time"], 3),
+                    "peak_rss_kb": after["peak_rss_kb"],
+                    # Klatki źródła na sekundę całej konwersji, niezależnie od ścieżki
+                    "encode_fps": round(frames / wall_time, 2) if wall_time else None,
+                    "ffmpeg_fps": job.encode_fps if job else None,
+                    "realtime_speed": round(case["duration"] / wall_time, 3) if wall_time else None,
+                    "segments": count_segments(output_dir),
+                    "output_bytes": job.output_size if job else None,
+                }
+                transaction.set_rollback(True)
+        finally:
+            current_app.conf.task_always_eager = always_eager
+        return result
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def _run_case_in_child(queue, fixture, case, profile):
+    try:
+        queue.put(run_case(fixture, case, profile))
+    except Exception as e:
+        queue.put({**case, "status": "error", "error": str(e)})
+
+
+def run_case_isolated(fixture, case, profile=None):
+    """ Osobny proces na każdy przypadek - czas CPU i szczytowe RSS nie mieszają się """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return run_case(fixture, case, profile)
+    # Proces potomny otworzy własne połączenie z bazą
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(
+        target=_run_case_in_child, args=(queue, fixture, case, profile))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare_results(results, baseline):
+    """ Zmiana czasu i fps względem poprzedniego pliku wyników (wg nazwy przypadku) """
+    previous = {row["name"]: row for row in baseline.get("results", [])}
+    changes = []
+    for row in results:
+        old = previous.get(row["name"])
+        if not old or not old.get("wall_time") or not row.get("wall_time"):
+            continue
+        changes.append({
+            "name": row["name"],
+            "wall_time_change": round((row["wall_time"] / old["wall_time"] - 1) * 100, 1),
+            "encode_fps_change": round(
+                (row["encode_fps"] / old["encode_fps"] - 1) * 100, 1)
+            if old.get("encode_fps") and row.get("encode_fps") else None,
+        })
+    return changes
+
+
+class Command(BaseCommand):
+    help = ("Generuje syntetyczne źródła (lavfi), konwertuje je do HLS i zapisuje "
+            "czas, CPU, pamięć, fps i liczbę segmentów do pliku JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS,
+                            help="np. 640x360 1280x720")
+        parser.add_argument("--durations", nargs="+", type=int, default=DEFAULT_DURATIONS,
+                            help="długości źródeł w sekundach")
+        parser.add_argument("--frame-rate", type=int, default=DEFAULT_FRAME_RATE)
+        parser.add_argument("--source-codec", choices=["mpeg4", "h264"], default="mpeg4",
+                            help="h264 sprawdza ścieżkę przepakowania")
+        parser.add_argument("--profile", help="profil kodowania, domyślnie z ustawień")
+        parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                            help="plik wyników JSON")
+        parser.add_argument("--compare", help="poprzedni plik wyników do porównania")
+        parser.add_argument("--fixtures-dir",
+                            help="katalog na źródła (ponownie używane między uruchomieniami)")
+        parser.add_argument("--in-process", action="store_true",
+                            help="bez osobnego procesu na przypadek (RSS jest wtedy maksimum z całego przebiegu)")
+
+    def handle(self, *args, **options):
+        if shutil.which("ffmpeg") is None:
+            raise CommandError("Brak ffmpeg w PATH")
+        profile = options["profile"]
+        if profile and profile not in get_encoder_profiles():
+            raise CommandError(f"Nieznany profil: {profile}")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        fixtures_dir = options["fixtures_dir"] or tempfile.mkdtemp(prefix="hls-fixtures-")
+        os.makedirs(fixtures_dir, exist_ok=True)
+        frame_rate = options["frame_rate"]
+        run = run_case if options["in_process"] else run_case_isolated
+
+        results = []
+        try:
+            for resolution in options["resolutions"]:
+                width, height = parse_resolution(resolution)
+                for duration in options["durations"]:
+                    case = {
+                        "name": f"{options['source_codec']}_{width}x{height}_{duration}s",
+                        "width": width, "height": height,
+                        "duration": duration, "frame_rate": frame_rate,
+                        "source_codec": options["source_codec"],
+                    }
+                    fixture = os.path.join(fixtures_dir, f"{case['name']}.mp4")
+                    if not os.path.exists(fixture):
+                        subprocess.run(build_fixture_command(
+                            fixture, width, height, duration, frame_rate,
+                            options["source_codec"]), check=True)
+                    result = run(fixture, case, profile)
+                    results.append(result)
+                    self.write_row(result)
+        finally:
+            if not options["fixtures_dir"]:
+                shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "profile": profile,
+            "results": results,
+        }
+        if baseline is not None:
+            report["comparison"] = compare_results(results, baseline)
+            for change in report["comparison"]:
+                self.stdout.write(
+                    f"{change['name']:<28} czas {change['wall_time_change']:+.1f}%  "
+                    f"fps {change['encode_fps_change'] if change['encode_fps_change'] is not None else '-'}%")
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Wyniki zapisane w {options['output']}")
+
+    def write_row(self, result):
+        if result.get("status") != "done":
+            self.stderr.write(f"{result['name']:<28} {result.get('status')}: {result.get('error')}")
+            return
+        self.stdout.write(
+            f"{result['name']:<28} {result['mode']:<8} {result['wall_time']:7.2f} s  "
+            f"CPU {result['cpu_time']:7.2f} s  RSS {result['peak_rss_kb'] / 1024:6.0f} MB  "
+            f"{result['encode_fps']:7.1f} fps  {result['segments']:3d} segm.")
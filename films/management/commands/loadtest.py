@@ -0,0 +1,234 @@
+""" Test obciążeniowy: wirtualni widzowie przeglądają katalog, oglądają i oceniają filmy """
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import (HTTPCookieProcessor, HTTPRedirectHandler, Request,
+                            build_opener)
+
+from django.core.management.base import BaseCommand, CommandError
+
+from films.management.commands.seed_loadtest import (DEFAULT_PASSWORD,
+                                                     user_email)
+
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """ Percentyl metodą najbliższej rangi (values posortowane rosnąco) """
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def queries_from_server_timing(header):
+    """ Liczba zapytań z nagłówka Server-Timing (films.middleware) """
+    match = SERVER_TIMING_QUERIES_RE.search(header or "")
+    return int(match.group(1)) if match else None
+
+
+class Stats:
+    """ Czasy odpowiedzi, błędy i liczby zapytań per endpoint, współdzielone przez wątki """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, latency, ok, queries=None):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if queries is not None:
+                self.queries[endpoint].append(queries)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            queries = self.queries[endpoint]
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "queries_avg": round(sum(queries) / len(queries), 1) if queries else None,
+                "queries_max": max(queries) if queries else None,
+            })
+        return rows
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """ Przekierowanie jest wynikiem żądania, nie kolejnym żądaniem do zmierzenia """
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """ Jedna sesja przeglądarki z własnymi ciasteczkami """
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+
+    def request(self, endpoint, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urlencode({**data, "csrfmiddlewaretoken": self.csrf_token()}).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["Referer"] = self.base_url + path
+        request = Request(self.base_url + path, data=body, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content = response.read()
+                status, server_timing = response.status, response.headers.get("Server-Timing")
+        except HTTPError as e:
+            content = e.read()
+            status, server_timing = e.code, e.headers.get("Server-Timing")
+        except (URLError, OSError):
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            return None, b""
+        self.stats.record(endpoint, time.perf_counter() - started, status < 400,
+                          queries_from_server_timing(server_timing))
+        return status, content
+
+    def login(self, email, password):
+        self.request("login_page", "/login")
+        status, _ = self.request("login", "/login", data={
+            "email": email, "password": password})
+        return status == 302
+
+
+def film_ids(base_url, timeout, limit):
+    """ Identyfikatory filmów z API katalogu (kolejne strony kursora) """
+    user = VirtualUser(base_url, Stats(), timeout)
+    ids, cursor = [], None
+    while len(ids) < limit:
+        path = "/api/films" + (f"?cursor={cursor}" if cursor else "")
+        status, content = user.request("catalogue_api", path)
+        if status != 200:
+            break
+        page = json.loads(content)
+        ids += [film["id"] for film in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    return ids[:limit]
+
+
+def viewer_session(user, films, deadline, options, rng):
+    """ Przegląda katalog, ogląda losowy film wysyłając postęp, czasem ocenia """
+    while time.monotonic() < deadline:
+        user.request("catalogue", "/start")
+        if rng.random() < 0.3:
+            user.request("catalogue_api", "/api/films")
+        film_id = rng.choice(films)
+        user.request("watch", f"/watch/{film_id}")
+        position = rng.uniform(0, 600)
+        for _ in range(options["heartbeats"]):
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(options["think_time"])
+            position += options["think_time"] or 5
+            user.request("progress", "/watch/save-video-progress/",
+                         json_body={"currentTime": round(position, 2)})
+        if rng.random() < options["rate_probability"]:
+            user.request("rate", f"/watch/{film_id}", data={"comments": "loadtest"})
+
+
+class Command(BaseCommand):
+    help = ("Obciąża działający serwer ruchem widzów (katalog, odtwarzacz, postęp, "
+            "oceny) i raportuje p50/p95/p99, RPS i liczbę zapytań per endpoint. "
+            "Dane przygotowuje seed_loadtest.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+        parser.add_argument("--users", type=int, default=20,
+                            help="liczba równoczesnych widzów")
+        parser.add_argument("--accounts", type=int, default=None,
+                            help="liczba kont z seed_loadtest, domyślnie --users")
+        parser.add_argument("--password", default=DEFAULT_PASSWORD)
+        parser.add_argument("--duration", type=float, default=60, help="sekundy")
+        parser.add_argument("--heartbeats", type=int, default=6,
+                            help="zapisy postępu na jedno obejrzenie")
+        parser.add_argument("--think-time", type=float, default=0.0,
+                            help="przerwa (s) między zapisami postępu; 0 - maksymalne obciążenie")
+        parser.add_argument("--rate-probability", type=float, default=0.1)
+        parser.add_argument("--max-films", type=int, default=500)
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--json", dest="json_output", help="zapis wyników do pliku")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        films = film_ids(options["base_url"], options["timeout"], options["max_films"])
+        if not films:
+            raise CommandError(
+                f"Brak filmów pod {options['base_url']}/api/films - uruchom seed_loadtest "
+                f"i serwer")
+
+        stats = Stats()
+        accounts = options["accounts"] or options["users"]
+        users = []
+        for index in range(options["users"]):
+            user = VirtualUser(options["base_url"], stats, options["timeout"])
+            if not user.login(user_email(index % accounts), options["password"]):
+                raise CommandError(f"Nie udało się zalogować jako {user_email(index % accounts)}")
+            users.append(user)
+
+        started = time.monotonic()
+        deadline = started + options["duration"]
+        threads = [
+            threading.Thread(target=viewer_session, args=(
+                user, films, deadline, options, random.Random(options["seed"] + index)))
+            for index, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        # Logowanie było rozgrzewką - nie wchodzi do raportu
+        for endpoint in ("login_page", "login"):
+            stats.latencies.pop(endpoint, None)
+        rows = stats.summary(elapsed)
+        self.stdout.write(
+            f"{'endpoint':<14}{'req':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'db q':>7}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<14}{row['requests']:>7}{row['errors']:>6}{row['rps']:>8.1f}"
+                f"{row['p50_ms']:>8.1f}ms{row['p95_ms']:>7.1f}ms{row['p99_ms']:>7.1f}ms"
+                f"{row['queries_avg'] if row['queries_avg'] is not None else '-':>7}")
+        total = sum(row["requests"] for row in rows)
+        self.stdout.write(f"Razem {total} żądań w {elapsed:.1f} s ({total / elapsed:.1f} rps)")
+
+        if options["json_output"]:
+            with open(options["json_output"], "w") as f:
+                json.dump({"users": options["users"], "duration": elapsed,
+                           "endpoints": rows}, f, indent=2)
@@ -0,0 +1,17 @@
+""" Przebudowa indeksów wyszukiwania filmów """
+from django.core.management.base import BaseCommand
+
+from films.search import (create_search_index, invalidate_search,
+                          rebuild_prefix_index, search_backend)
+
+
+class Command(BaseCommand):
+    help = ("Odtwarza indeks pełnotekstowy (PostgreSQL/SQLite FTS5) i zbiór "
+            "podpowiedzi tytułów w Redisie")
+
+    def handle(self, *args, **options):
+        create_search_index()
+        invalidate_search()
+        self.stdout.write(f"Indeks pełnotekstowy: {search_backend()}")
+        count = rebuild_prefix_index()
+        self.stdout.write(f"Podpowiedzi tytułów: {count} filmów")
@@ -0,0 +1,21 @@
+""" Uzupełnienie i kontrola zagregowanych ocen filmów """
+from django.core.management.base import BaseCommand
+
+from films.ratings import reconcile_film_ratings
+
+
+class Command(BaseCommand):
+    help = ("Przelicza rating_sum/rating_count/rating_average filmów z tabeli Ratings "
+            "(pierwsze wypełnienie albo naprawa rozbieżności)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="tylko wypisuje rozbieżności")
+
+    def handle(self, *args, **options):
+        changes = reconcile_film_ratings(dry_run=options["dry_run"])
+        for film_id, (old_sum, old_count), (new_sum, new_count) in changes:
+            self.stdout.write(
+                f"Film {film_id}: suma {old_sum} -> {new_sum}, liczba {old_count} -> {new_count}")
+        action = "Do poprawienia" if options["dry_run"] else "Poprawiono"
+        self.stdout.write(f"{action}: {len(changes)} filmów")
@@ -0,0 +1,79 @@
+""" Dane do testów obciążeniowych: filmy, użytkownicy, oceny i postęp oglądania """
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from films.caching import invalidate_catalogue
+from films.models import Film, Ratings, VideoProgress
+from films.ratings import reconcile_film_ratings
+
+
+FILM_PREFIX = "loadtest"
+USER_PREFIX = "loadtest_"
+DEFAULT_PASSWORD = "loadtest-password"
+
+
+def user_email(index):
+    return f"{USER_PREFIX}{index}@example.com"
+
+
+def clear_seeded():
+    """ Usuwa wyłącznie obiekty utworzone przez tę komendę """
+    Film.objects.filter(name__startswith=FILM_PREFIX, description="loadtest").delete()
+    User.objects.filter(username__startswith=USER_PREFIX).delete()
+
+
+class Command(BaseCommand):
+    help = "Tworzy N filmów i M użytkowników dla komendy loadtest"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--films", type=int, default=200)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--password", default=DEFAULT_PASSWORD)
+        parser.add_argument("--ratings", type=float, default=0.5,
+                            help="część użytkowników, którzy ocenili film")
+        parser.add_argument("--progress", type=int, default=5,
+                            help="zapisane pozycje oglądania na użytkownika")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            clear_seeded()
+            # bulk_create pomija Film.save i sygnały - katalog czyścimy niżej
+            films = Film.objects.bulk_create([
+                Film(name=f"{FILM_PREFIX} {index}", description="loadtest",
+                     link=f"videos/{FILM_PREFIX}.mp4",
+                     thumbnail=f"thumbnails/{FILM_PREFIX}.jpg",
+                     hls_playlist=f"/media/videos/hls/{FILM_PREFIX}/master.m3u8")
+                for index in range(options["films"])])
+            # Jeden hash dla wszystkich - haszowanie hasła kosztuje ~100 ms
+            password = make_password(options["password"])
+            User.objects.bulk_create([
+                User(username=f"{USER_PREFIX}{index}", email=user_email(index),
+                     password=password, is_active=True)
+                for index in range(options["users"])])
+            users = list(User.objects.filter(username__startswith=USER_PREFIX))
+            films = list(Film.objects.filter(
+                name__startswith=FILM_PREFIX, description="loadtest"))
+
+            raters = rng.sample(users, int(len(users) * options["ratings"])) if films else []
+            Ratings.objects.bulk_create([
+                Ratings(user=user, film=rng.choice(films),
+                        rating=rng.randint(1, 5), comments="loadtest")
+                for user in raters])
+            # bulk_create pomija sygnały - agregaty ocen liczymy od nowa
+            reconcile_film_ratings()
+            VideoProgress.objects.bulk_create([
+                VideoProgress(user=user, film=film,
+                              last_watched=rng.uniform(0, 3600))
+                for user in users
+                for film in rng.sample(films, min(options["progress"], len(films)))])
+        invalidate_catalogue()
+
+        self.stdout.write(
+            f"Utworzono {len(films)} filmów, {len(users)} użytkowników "
+            f"(hasło: {options['password']}), {len(raters)} ocen")
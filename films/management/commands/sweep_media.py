@@ -0,0 +1,22 @@
+""" Usuwanie plików multimedialnych, których nie używa żaden film """
+from django.core.management.base import BaseCommand
+
+from films.cleanup import sweep_orphaned_media
+
+
+class Command(BaseCommand):
+    help = ("Porównuje pliki w storage (HLS, podglądy, źródła, miniatury) i części "
+            "uploadów z bazą i usuwa osierocone")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="tylko wypisuje osierocone pliki")
+        parser.add_argument("--min-age", type=int, default=None,
+                            help="pomija pliki młodsze niż tyle sekund")
+
+    def handle(self, *args, **options):
+        orphans = sweep_orphaned_media(dry_run=options["dry_run"], min_age=options["min_age"])
+        for name in orphans:
+            self.stdout.write(name)
+        action = "Do usunięcia" if options["dry_run"] else "Usunięto"
+        self.stdout.write(f"{action}: {len(orphans)} plików")
@@ -0,0 +1,171 @@
+""" Serwowanie plików z MEDIA_ROOT z obsługą Range, ETag i cache przeglądarki """
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".vtt": "text/vtt",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+# Segmenty i obrazy nigdy się nie zmieniają pod tą samą nazwą
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLAYLIST_CACHE_CONTROL = "public, max-age=5"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+IMMUTABLE_EXTENSIONS = {".ts", ".m4s", ".jpg", ".jpeg", ".png", ".webp", ".avif"}
+
+# Katalogi, których nie wystawiamy publicznie (np. niedokończone uploady)
+PRIVATE_PREFIXES = ("videos/uploads/",)
+PRIVATE_PATHS = tuple(os.path.normcase(prefix.replace("/", os.sep))
+                      for prefix in PRIVATE_PREFIXES)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def cache_control_for(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".m3u8":
+        return PLAYLIST_CACHE_CONTROL
+    if extension in IMMUTABLE_EXTENSIONS:
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+def content_type_for(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in CONTENT_TYPES:
+        return CONTENT_TYPES[extension]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def parse_range(header, size):
+    """ Zwraca (start, koniec) pojedynczego zakresu bajtów, None dla braku/wielu
+    zakresów albo False, gdy zakres nie mieści się w pliku """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # "bytes=-N" - ostatnie N bajtów
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def range_is_current(request, etag, last_modified):
+    """ If-Range: zakres obowiązuje tylko, gdy plik się nie zmienił """
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_file_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """ Zwraca plik z MEDIA_ROOT lub przekazuje go serwerowi www (X-Accel-Redirect/X-Sendfile) """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Nie znaleziono pliku")
+    # Sprawdzamy ścieżkę po normalizacji - "videos//uploads", "./videos/uploads"
+    # czy "videos/hls/../uploads" prowadzą do tego samego katalogu
+    relative = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT))
+    if os.path.normcase(relative).startswith(PRIVATE_PATHS):
+        raise Http404("Nie znaleziono pliku")
+    path = relative.replace(os.sep, "/")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Nie znaleziono pliku")
+    if not os.path.isfile(full_path):
+        raise Http404("Nie znaleziono pliku")
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": cache_control_for(path),
+        "Accept-Ranges": "bytes",
+    }
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = content_type_for(path)
+
+    # Przekazanie pliku do nginx/Apache - Python nie czyta ani bajtu
+    accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT", None)
+    if accel_prefix or getattr(settings, "MEDIA_X_SENDFILE", False):
+        response = HttpResponse(content_type=content_type)
+        if accel_prefix:
+            response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + path
+        else:
+            response["X-Sendfile"] = full_path
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if range_is_current(request, etag, last_modified):
+        byte_range = parse_range(request.headers.get("Range"), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_file_range(full_path, start, length), status=206,
+            content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(length)
+    for header, value in headers.items():
+        response[header] = value
+    return response
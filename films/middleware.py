@@ -0,0 +1,298 @@
+""" Pomiar zapytań do bazy, cache'u i czasu odpowiedzi
+
+Wyniki żądania trafiają do nagłówka Server-Timing, zbiorczo do metryk
+w formacie Prometheusa (widok /metrics), a wolne żądania do logu razem
+z wykonanym SQL-em.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_REQUEST_THRESHOLD = 1.0  # sekundy
+SLOW_REQUEST_LOGGED_QUERIES = 10
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Operacje cache'u, których czas mierzymy; trafienia liczą tylko get i get_many
+CACHE_METHODS = ("get", "get_many", "set", "set_many", "add", "delete",
+                 "delete_many", "incr", "decr", "touch", "has_key")
+
+_current = ContextVar("request_stats", default=None)
+_MISSING = object()
+
+
+class QueryStats:
+    """ Liczba zapytań i ich łączny czas w jednym żądaniu """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def add(self, sql, duration):
+        self.duration += duration
+        self.count += 1
+        # Bez parametrów - do logu nie trafiają dane użytkowników
+        self.queries.append((sql, duration))
+
+
+class CacheStats:
+    """ Trafienia, chybienia i czas operacji na cache'u w jednym żądaniu """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.calls = 0
+        self.duration = 0.0
+        # Metody bazowe wołają się nawzajem (incr -> get/set) - mierzymy tylko zewnętrzne
+        self.depth = 0
+
+
+class RequestStats:
+    def __init__(self):
+        self.db = QueryStats()
+        self.cache = CacheStats()
+
+
+def record_query(execute, sql, params, many, context):
+    """ execute_wrapper każdego połączenia - zapisuje zapytanie do statystyk żądania
+
+    Statystyki żądania są w ContextVar, więc trafiają tu także zapytania
+    z wątków sync_to_async widoków asynchronicznych.
+    """
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db.add(sql, time.perf_counter() - started)
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        # Na początek listy - execute_wrapper() innych zdejmuje ostatni element
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+def _timed_cache_method(name, method):
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return method(*args, **kwargs)
+        cache = stats.cache
+        cache.depth += 1
+        started = time.perf_counter()
+        try:
+            if name == "get":
+                key, *rest = args
+                default = rest[0] if rest else kwargs.pop("default", None)
+                result = method(key, _MISSING, *rest[1:], **kwargs)
+                hit = result is not _MISSING
+                if cache.depth == 1:
+                    cache.hits += hit
+                    cache.misses += not hit
+                return result if hit else default
+            if name == "get_many":
+                keys = list(args[0] if args else kwargs.pop("keys"))
+                result = method(keys, *args[1:], **kwargs)
+            else:
+                result = method(*args, **kwargs)
+            if name == "get_many" and cache.depth == 1:
+                cache.hits += len(result)
+                cache.misses += len(keys) - len(result)
+            return result
+        finally:
+            cache.depth -= 1
+            if cache.depth == 0:
+                cache.calls += 1
+                cache.duration += time.perf_counter() - started
+    return wrapper
+
+
+def instrument_cache(backend):
+    """ Podmienia metody instancji backendu na mierzące (raz na instancję)
+
+    Instancje cache'u są osobne dla każdego wątku, więc sprawdzamy to
+    przy każdym żądaniu; poza żądaniem opakowanie tylko przekazuje wywołanie.
+    """
+    if getattr(backend, "_timing_instrumented", False):
+        return
+    for name in CACHE_METHODS:
+        setattr(backend, name, _timed_cache_method(name, getattr(backend, name)))
+    backend._timing_instrumented = True
+
+
+class RequestMetrics:
+    """ Zbiorcze metryki żądań w procesie, w formacie tekstowym Prometheusa
+
+    Każdy proces (worker gunicorna/uvicorna) ma własne liczniki -
+    Prometheus odpytuje je osobno i sumuje po etykietach.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.latency_buckets = Counter()
+            self.latency_sum = Counter()
+            self.latency_count = Counter()
+            self.db_queries = Counter()
+            self.db_seconds = Counter()
+            self.cache_hits = Counter()
+            self.cache_misses = Counter()
+            self.cache_seconds = Counter()
+
+    def observe(self, view, method, status, latency, stats):
+        with self.lock:
+            self.requests[(view, method, str(status))] += 1
+            for bucket in self.buckets:
+                if latency <= bucket:
+                    self.latency_buckets[(view, bucket)] += 1
+            self.latency_sum[view] += latency
+            self.latency_count[view] += 1
+            self.db_queries[view] += stats.db.count
+            self.db_seconds[view] += stats.db.duration
+            self.cache_hits[view] += stats.cache.hits
+            self.cache_misses[view] += stats.cache.misses
+            self.cache_seconds[view] += stats.cache.duration
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self.lock:
+            family("http_requests_total", "counter", "Liczba żądań HTTP",
+                   [f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}'
+                    for (view, method, status), count in sorted(self.requests.items())])
+            samples = []
+            for view in sorted(self.latency_count):
+                for bucket in self.buckets:
+                    samples.append(
+                        f'http_request_duration_seconds_bucket{{view="{view}",le="{bucket}"}} '
+                        f'{self.latency_buckets[(view, bucket)]}')
+                samples += [
+                    f'http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {self.latency_count[view]}',
+                    f'http_request_duration_seconds_sum{{view="{view}"}} {self.latency_sum[view]:.6f}',
+                    f'http_request_duration_seconds_count{{view="{view}"}} {self.latency_count[view]}',
+                ]
+            family("http_request_duration_seconds", "histogram",
+                   "Czas obsługi żądania", samples)
+            for name, kind, help_text, values, fmt in (
+                ("db_queries_total", "counter", "Zapytania SQL", self.db_queries, "d"),
+                ("db_query_seconds_total", "counter", "Łączny czas zapytań SQL", self.db_seconds, ".6f"),
+                ("cache_hits_total", "counter", "Trafienia w cache", self.cache_hits, "d"),
+                ("cache_misses_total", "counter", "Chybienia w cache", self.cache_misses, "d"),
+                ("cache_seconds_total", "counter", "Łączny czas operacji na cache'u", self.cache_seconds, ".6f"),
+            ):
+                family(name, kind, help_text,
+                       [f'{name}{{view="{view}"}} {value:{fmt}}'
+                        for view, value in sorted(values.items())])
+        return "\n".join(lines) + "\n"
+
+
+metrics = RequestMetrics()
+
+
+def view_label(request):
+    """ Nazwa widoku zamiast ścieżki - liczba serii w Prometheusie pozostaje stała """
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unmatched"
+
+
+def log_slow_request(request, status, latency, stats):
+    queries = stats.db.queries
+    slowest = sorted(queries, key=lambda query: query[1], reverse=True)
+    repeated = [(sql, count) for sql, count in Counter(sql for sql, _ in queries).most_common()
+                if count > 1]
+    lines = [
+        f"🐢 Wolne żądanie {request.method} {request.path} ({status}): "
+        f"{latency * 1000:.0f} ms, {stats.db.count} zapytań ({stats.db.duration * 1000:.0f} ms), "
+        f"cache {stats.cache.hits}/{stats.cache.hits + stats.cache.misses} trafień "
+        f"({stats.cache.duration * 1000:.0f} ms)"]
+    lines += [f"  {duration * 1000:7.1f} ms  {sql}"
+              for sql, duration in slowest[:SLOW_REQUEST_LOGGED_QUERIES]]
+    # To samo zapytanie wiele razy to zwykle N+1
+    lines += [f"  powtórzone {count}x: {sql}" for sql, count in repeated[:SLOW_REQUEST_LOGGED_QUERIES]]
+    logger.warning("\n".join(lines))
+
+
+class ServerTimingMiddleware:
+    """ Dodaje do odpowiedzi `Server-Timing: db;.., cache;.., total;..` i zbiera metryki
+
+    Działa synchronicznie i asynchronicznie - pod ASGI nie przenosi
+    widoków asynchronicznych z powrotem do wątku.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all():
+            instrument_connection(connection)
+        stats, token, started = self.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish_request(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish_request(request, response, stats, started)
+
+    def start_request(self):
+        stats = RequestStats()
+        token = _current.set(stats)
+        # Instancje cache'u są per wątek (per zadanie asyncio pod ASGI)
+        for backend in caches.all():
+            instrument_cache(backend)
+        return stats, token, time.perf_counter()
+
+    def finish_request(self, request, response, stats, started):
+        latency = time.perf_counter() - started
+        response["Server-Timing"] = (
+            f'db;dur={stats.db.duration * 1000:.1f};desc="{stats.db.count} queries", '
+            f'cache;dur={stats.cache.duration * 1000:.1f};'
+            f'desc="{stats.cache.hits} hits, {stats.cache.misses} misses", '
+            f'total;dur={latency * 1000:.1f}')
+        metrics.observe(view_label(request), request.method, response.status_code,
+                        latency, stats)
+        threshold = getattr(settings, "SLOW_REQUEST_THRESHOLD", DEFAULT_SLOW_REQUEST_THRESHOLD)
+        if threshold is not None and latency >= threshold:
+            log_slow_request(request, response.status_code, latency, stats)
+        return response
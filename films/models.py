@@ -4,24 +4,49 @@ from django.conf import settings
 from django.dispatch import receiver
 
 import os
+import uuid
 
 
 class Film(models.Model):
+    # Priorytety Celery na Redisie: mniejsza liczba = wcześniej w kolejce
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_LOW = 9
+    PRIORITY_CHOICES = [
+        (PRIORITY_HIGH, 'New release'),
+        (PRIORITY_NORMAL, 'Normal'),
+        (PRIORITY_LOW, 'Back catalogue'),
+    ]
+
     name = models.CharField(max_length=30)
     description = models.CharField(max_length=255)
-    link = models.FileField(upload_to='videos\\before')
+    link = models.FileField(upload_to='videos/before')
     hls_playlist = models.CharField(
         max_length=255, blank=True, null=True)
+    # SHA-256 źródła - identyczne pliki dzielą jeden zestaw plików HLS
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
 
     thumbnail = models.ImageField(upload_to='thumbnails/')
+    # Warianty miniatury i arkusz podglądu przewijania (films.previews)
+    has_previews = models.BooleanField(default=False)
+    # Zapisane warianty {format: [szerokości]} - srcset opisuje tylko to, co
+    # worker naprawdę wygenerował (jego Pillow decyduje o AVIF)
+    thumbnail_variants = models.JSONField(default=dict, blank=True)
+    priority = models.PositiveSmallIntegerField(
+        choices=PRIORITY_CHOICES, default=PRIORITY_NORMAL)
+    # Nazwa profilu z films.hls; pusta - profil domyślny z ustawień
+    encoder_profile = models.CharField(max_length=32, blank=True)
+    # Zagregowane oceny (films.ratings), zmieniane wyrażeniami F() razem z Ratings
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        # Katalog według ocen bez GROUP BY po całej tabeli Ratings
+        indexes = [models.Index(fields=['-rating_average', '-id'])]
 
-    def delete(self, *args, **kwargs):
-        """ Usuwa plik przed usunięciem obiektu z bazy """
-        if self.link:
-            file_path = os.path.join(settings.MEDIA_ROOT, str(self.link))
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        super().delete(*args, **kwargs)
+    # Pliki filmu usuwa zadanie Celery zlecane przez sygnał post_delete
+    # (films.cleanup) - działa też dla QuerySet.delete() i panelu admina
 
 
 class Ratings(models.Model):
@@ -39,12 +64,100 @@ class VideoProgress(models.Model):
     film = models.ForeignKey(
         Film, on_delete=models.CASCADE)
     last_watched = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'film'], name='unique_user_film_progress')
         ]
+        # Ostatnio oglądane filmy użytkownika ("oglądaj dalej") bez sortowania
+        indexes = [models.Index(fields=['user', '-updated_at'])]
 
     def __str__(self):
         return f'Postęp użytkownika {self.user.username} w filmie {self.film.name}'
+
+
+class VideoUpload(models.Model):
+    """ Stan wznawialnego wysyłania pliku wideo w częściach """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=30)
+    description = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    priority = models.PositiveSmallIntegerField(
+        choices=Film.PRIORITY_CHOICES, default=Film.PRIORITY_NORMAL)
+    encoder_profile = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def parts_dir():
+        """ Części uploadów leżą na dysku serwera www, nie w storage """
+        return os.path.join(settings.MEDIA_ROOT, "videos", "uploads")
+
+    @property
+    def part_path(self):
+        return os.path.join(self.parts_dir(), f"{self.id}.part")
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+
+class TranscodeJob(models.Model):
+    """ Trwały stan jednej konwersji filmu do HLS wraz z metrykami """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_SKIPPED, 'Skipped'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    film = models.ForeignKey(
+        Film, on_delete=models.CASCADE, related_name='transcode_jobs')
+    task_id = models.CharField(max_length=255, blank=True, db_index=True)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=32, blank=True)
+    profile = models.CharField(max_length=32, blank=True)
+    percent = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    source_duration = models.FloatField(null=True, blank=True)
+    # Średnia prędkość kodowania raportowana przez FFmpeg
+    encode_fps = models.FloatField(null=True, blank=True)
+    input_size = models.BigIntegerField(null=True, blank=True)
+    output_size = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f'Konwersja filmu {self.film_id}: {self.status}'
+
+    @property
+    def elapsed(self):
+        """ Czas trwania konwersji w sekundach """
+        if not self.started_at or not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    @property
+    def speed(self):
+        """ Ile sekund filmu przetworzono na sekundę pracy """
+        elapsed = self.elapsed
+        if not elapsed or not self.source_duration:
+            return None
+        return self.source_duration / elapsed
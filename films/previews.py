@@ -0,0 +1,141 @@
+""" Miniatury w kilku szerokościach i arkusz klatek do podglądu przewijania """
+import math
+import os
+
+from django.conf import settings
+from PIL import Image, features
+
+from .storage import media_storage, previews_prefix
+
+
+# Szerokości wariantów miniatury (settings.THUMBNAIL_WIDTHS)
+DEFAULT_THUMBNAIL_WIDTHS = [160, 320, 640]
+# Liczba klatek w podglądzie przewijania i ich układ w arkuszu
+DEFAULT_SPRITE_FRAMES = 100
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_TILE_WIDTH = 160
+SPRITE_VTT_NAME = "sprite.vtt"
+
+
+def previews_url(film_id):
+    return media_storage().url(f"{previews_prefix(film_id)}/")
+
+
+def thumbnail_widths():
+    return getattr(settings, "THUMBNAIL_WIDTHS", DEFAULT_THUMBNAIL_WIDTHS)
+
+
+def thumbnail_formats():
+    """ WebP zawsze, AVIF tylko gdy Pillow workera ma jego obsługę """
+    formats = ["webp"]
+    if features.check("avif"):
+        formats.append("avif")
+    return formats
+
+
+def thumbnail_name(width, image_format):
+    return f"thumb_{width}.{image_format}"
+
+
+def thumbnail_srcsets(film_id, variants):
+    """ Wartości atrybutu srcset dla zapisanych wariantów (Film.thumbnail_variants) """
+    base = previews_url(film_id)
+    return {
+        image_format: ", ".join(
+            f"{base}{thumbnail_name(width, image_format)} {width}w"
+            for width in widths)
+        for image_format, widths in variants.items() if widths
+    }
+
+
+def poster_url(film_id, variants):
+    """ Największy wariant WebP jako plakat odtwarzacza (None - brak wariantów) """
+    widths = variants.get("webp")
+    if not widths:
+        return None
+    return f"{previews_url(film_id)}{thumbnail_name(max(widths), 'webp')}"
+
+
+def make_thumbnail_variants(source_path, output_dir):
+    """ Zapisuje pomniejszone kopie miniatury; zwraca {format: [szerokości]}
+
+    Szerokości większe niż źródło zastępuje szerokość źródła - nie
+    powiększamy obrazów, a nazwa pliku zawsze podaje prawdziwą szerokość.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    formats = thumbnail_formats()
+    variants = {image_format: [] for image_format in formats}
+    with Image.open(source_path) as image:
+        image = image.convert("RGB")
+        for width in sorted({min(width, image.width) for width in thumbnail_widths()}):
+            height = max(1, round(image.height * width / image.width))
+            variant = image.resize((width, height), Image.LANCZOS)
+            for image_format in formats:
+                path = os.path.join(output_dir, thumbnail_name(width, image_format))
+                variant.save(path, image_format.upper(), quality=80)
+                variants[image_format].append(width)
+    return variants
+
+
+def sprite_layout(duration, source_width, source_height, frames=None):
+    """ Oblicza odstęp między klatkami i rozmiar kafelka arkusza podglądu """
+    frames = frames or getattr(settings, "SPRITE_FRAMES", DEFAULT_SPRITE_FRAMES)
+    interval = max(1.0, duration / frames)
+    count = max(1, math.ceil(duration / interval))
+    tile_height = SPRITE_TILE_WIDTH * source_height / source_width
+    tile_height = max(2, int(round(tile_height / 2)) * 2)
+    return {
+        "interval": interval,
+        "count": count,
+        "tile_width": SPRITE_TILE_WIDTH,
+        "tile_height": tile_height,
+        "columns": SPRITE_COLUMNS,
+        "rows": SPRITE_ROWS,
+    }
+
+
+def build_sprite_command(input_file, output_dir, layout):
+    """ Wybiera klatki w równych odstępach i skleja je w arkusze JPEG """
+    filters = ",".join([
+        f"fps=1/{layout['interval']:.6f}",
+        f"scale={layout['tile_width']}:{layout['tile_height']}",
+        f"tile={layout['columns']}x{layout['rows']}",
+    ])
+    return [
+        "ffmpeg", "-y",
+        "-i", input_file,
+        "-an",
+        "-vf", filters,
+        "-q:v", "5",
+        "-start_number", "0",
+        os.path.join(output_dir, "sprite_%03d.jpg"),
+    ]
+
+
+def _vtt_time(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+
+
+def build_sprite_vtt(duration, layout):
+    """ Indeks WebVTT: przedział czasu -> fragment arkusza (#xywh) """
+    per_sheet = layout["columns"] * layout["rows"]
+    lines = ["WEBVTT", ""]
+    for index in range(layout["count"]):
+        start = index * layout["interval"]
+        end = min(duration, start + layout["interval"])
+        sheet, position = divmod(index, per_sheet)
+        row, column = divmod(position, layout["columns"])
+        x = column * layout["tile_width"]
+        y = row * layout["tile_height"]
+        lines += [
+            f"{_vtt_time(start)} --> {_vtt_time(end)}",
+            f"sprite_{sheet:03d}.jpg#xywh={x},{y},"
+            f"{layout['tile_width']},{layout['tile_height']}",
+            "",
+        ]
+    return "\n".join(lines)
@@ -0,0 +1,234 @@
+""" Buforowanie postępu oglądania w Redisie, zbiorczy zapis do bazy i "oglądaj dalej" """
+import asyncio
+import json
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from mysite.redis_connection import redis_connection
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from .caching import FILM_TILE_FIELDS, film_tile
+from .models import Film, VideoProgress
+
+# Hash "user_id:film_id" -> ostatnia pozycja; późniejszy zapis nadpisuje wcześniejszy
+PENDING_KEY = "video_progress:pending"
+FLUSH_BATCH_SIZE = 1000
+
+DEFAULT_CONTINUE_WATCHING_SIZE = 20
+CONTINUE_WATCHING_TTL = 30 * 24 * 3600
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _aredis():
+    """ Klient asyncio do tego samego Redisa co cache albo None
+
+    Połączenia asyncio są związane z pętlą zdarzeń, więc klient jest osobny
+    dla każdej pętli (pod serwerem ASGI - jeden na proces).
+    """
+    if redis_connection() is None:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        config = settings.CACHES["default"]
+        location = config["LOCATION"]
+        # django_redis przyjmuje listę lub adresy po przecinku - pierwszy to master
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        location = location.split(",")[0]
+        password = config.get("OPTIONS", {}).get("PASSWORD")
+        client = aioredis.from_url(location, **({"password": password} if password else {}))
+        _async_clients[loop] = client
+    return client
+
+
+def continue_watching_size():
+    return getattr(settings, 'CONTINUE_WATCHING_SIZE', DEFAULT_CONTINUE_WATCHING_SIZE)
+
+
+def continue_watching_keys(user_id):
+    """ Zbiór sortowany film -> czas oglądania oraz hashe pozycji i kafelków filmów """
+    key = f"continue_watching:{user_id}"
+    return key, f"{key}:positions", f"{key}:films"
+
+
+def _touch_continue_watching(pipe, user_id, film_id, now):
+    recent, positions, films = continue_watching_keys(user_id)
+    pipe.zadd(recent, {film_id: now})
+    # Najstarsze poza limitem wypadają; wpisy w hashach wygasają razem z kluczami
+    pipe.zremrangebyrank(recent, 0, -continue_watching_size() - 1)
+    for key in (recent, positions, films):
+        pipe.expire(key, CONTINUE_WATCHING_TTL)
+
+
+def _queue_progress(pipe, user_id, film_id, last_watched):
+    pipe.hset(PENDING_KEY, f"{user_id}:{film_id}", last_watched)
+    pipe.hset(continue_watching_keys(user_id)[1], film_id, last_watched)
+    _touch_continue_watching(pipe, user_id, film_id, time.time())
+
+
+def _progress_defaults(last_watched):
+    return {'last_watched': last_watched, 'updated_at': timezone.now()}
+
+
+async def abuffer_progress(user_id, film_id, last_watched):
+    """ Zapamiętuje pozycję do najbliższego zrzutu zamiast pisać od razu do bazy """
+    conn = _aredis()
+    if conn is None:
+        await VideoProgress.objects.aupdate_or_create(
+            film_id=film_id, user_id=user_id, defaults=_progress_defaults(last_watched))
+        return
+    pipe = conn.pipeline(transaction=False)
+    _queue_progress(pipe, user_id, film_id, last_watched)
+    await pipe.execute()
+
+
+async def aget_progress(user_id, film_id):
+    """ Pozycja wznowienia: ostatni zapis z Redisa, a gdy go nie ma - z bazy """
+    conn = _aredis()
+    if conn is not None:
+        position = await conn.hget(continue_watching_keys(user_id)[1], film_id)
+        if position is not None:
+            return float(position)
+    return await VideoProgress.objects.filter(
+        user_id=user_id, film_id=film_id).values_list(
+        'last_watched', flat=True).afirst()
+
+
+async def aremember_watching(user_id, film, position=None):
+    """ Otwarcie odtwarzacza - film trafia na początek "oglądaj dalej" z kafelkiem """
+    conn = _aredis()
+    if conn is None:
+        return
+    recent, positions, films = continue_watching_keys(user_id)
+    pipe = conn.pipeline(transaction=False)
+    pipe.hset(films, film.id, json.dumps(film_tile({
+        'id': film.id, 'name': film.name, 'thumbnail': film.thumbnail.name,
+        'has_previews': film.has_previews,
+        'thumbnail_variants': film.thumbnail_variants})))
+    if position is not None:
+        pipe.hset(positions, film.id, position)
+    _touch_continue_watching(pipe, user_id, film.id, time.time())
+    await pipe.execute()
+
+
+def _continue_watching_from_db(user_id):
+    """ Ostatnio oglądane z bazy - jedno zapytanie po indeksie (user, -updated_at) """
+    rows = VideoProgress.objects.filter(user_id=user_id).order_by('-updated_at').values(
+        'last_watched', 'updated_at',
+        *(f'film__{field}' for field in FILM_TILE_FIELDS))[:continue_watching_size()]
+    return [{
+        **film_tile({field: row[f'film__{field}'] for field in FILM_TILE_FIELDS}),
+        'position': row['last_watched'],
+        'watched_at': row['updated_at'].timestamp(),
+    } for row in rows]
+
+
+def _tile_of(entry):
+    return {key: entry[key] for key in ('id', 'name', 'thumbnail_url', 'srcsets')}
+
+
+def continue_watching(user_id):
+    """ Rząd "oglądaj dalej": kafelki filmów od ostatnio oglądanego, z pozycjami
+
+    Z Redisa jednym przesłaniem (zbiór sortowany i dwa hashe); pusty zbiór
+    (np. po wygaśnięciu) jest odtwarzany z bazy.
+    """
+    conn = redis_connection()
+    if conn is None:
+        return _continue_watching_from_db(user_id)
+    recent_key, positions_key, films_key = continue_watching_keys(user_id)
+    pipe = conn.pipeline(transaction=False)
+    pipe.zrevrange(recent_key, 0, continue_watching_size() - 1, withscores=True)
+    pipe.hgetall(positions_key)
+    pipe.hgetall(films_key)
+    recent, positions, films = pipe.execute()
+
+    if not recent:
+        entries = _continue_watching_from_db(user_id)
+        if entries:
+            pipe = conn.pipeline(transaction=False)
+            pipe.zadd(recent_key, {entry['id']: entry['watched_at'] for entry in entries})
+            pipe.hset(positions_key, mapping={entry['id']: entry['position'] for entry in entries})
+            pipe.hset(films_key, mapping={
+                entry['id']: json.dumps(_tile_of(entry)) for entry in entries})
+            for key in (recent_key, positions_key, films_key):
+                pipe.expire(key, CONTINUE_WATCHING_TTL)
+            pipe.execute()
+        return entries
+
+    entries = []
+    for film_id, watched_at in recent:
+        tile = films.get(film_id)
+        if tile is None:
+            continue  # postęp sprzed pierwszego otwarcia odtwarzacza
+        entries.append({
+            **json.loads(tile),
+            'position': float(positions.get(film_id, 0)),
+            'watched_at': watched_at,
+        })
+    return entries
+
+
+def forget_film(user_ids, film_id):
+    """ Usuwa film z "oglądaj dalej" podanych użytkowników (np. po usunięciu filmu) """
+    conn = redis_connection()
+    if conn is None or not user_ids:
+        return
+    pipe = conn.pipeline(transaction=False)
+    for user_id in user_ids:
+        recent, positions, films = continue_watching_keys(user_id)
+        pipe.zrem(recent, film_id)
+        pipe.hdel(positions, film_id)
+        pipe.hdel(films, film_id)
+    pipe.execute()
+
+
+def flush_progress():
+    """ Zapisuje cały bufor jednym bulk upsertem, zwraca liczbę zapisanych wierszy """
+    conn = redis_connection()
+    if conn is None:
+        return 0
+
+    # Atomowe przejęcie bufora - nowe zapisy trafiają już do świeżego hasha
+    flushing_key = f"{PENDING_KEY}:flushing:{uuid.uuid4().hex}"
+    try:
+        conn.rename(PENDING_KEY, flushing_key)
+    except ResponseError:
+        return 0  # pusty bufor
+
+    rows = conn.hgetall(flushing_key)
+    try:
+        progress = {}
+        for field, value in rows.items():
+            user_id, film_id = (int(part) for part in field.decode().split(":"))
+            progress[(user_id, film_id)] = float(value)
+
+        # Pomijamy wpisy filmów/użytkowników usuniętych w międzyczasie
+        film_ids = set(Film.objects.filter(
+            id__in={film_id for _, film_id in progress}).values_list('id', flat=True))
+        user_ids = set(User.objects.filter(
+            id__in={user_id for user_id, _ in progress}).values_list('id', flat=True))
+        objects = [
+            VideoProgress(user_id=user_id, film_id=film_id, last_watched=last_watched)
+            for (user_id, film_id), last_watched in progress.items()
+            if user_id in user_ids and film_id in film_ids
+        ]
+        VideoProgress.objects.bulk_create(
+            objects, batch_size=FLUSH_BATCH_SIZE, update_conflicts=True,
+            unique_fields=['user', 'film'], update_fields=['last_watched', 'updated_at'])
+    except Exception:
+        # Oddajemy wpisy do bufora, nie nadpisując nowszych pozycji
+        for field, value in rows.items():
+            conn.hsetnx(PENDING_KEY, field, value)
+        raise
+    finally:
+        conn.delete(flushing_key)
+    return len(objects)
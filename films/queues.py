@@ -0,0 +1,48 @@
+""" Kolejki Celery dla konwersji i kontrola przyjmowania nowych filmów """
+import logging
+
+from celery import current_app
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Nazwy kolejek - trasy zadań są w settings.CELERY_TASK_ROUTES
+TRANSCODE_HEAVY_QUEUE = "transcode_heavy"
+# Części długich filmów - osobno, żeby jedna konwersja rozbita na kilkadziesiąt
+# części nie zapełniała limitu przyjmowania nowych filmów
+TRANSCODE_CHUNKS_QUEUE = "transcode_chunks"
+TRANSCODE_LIGHT_QUEUE = "transcode_light"
+IO_QUEUE = "io"
+
+# Maksymalna liczba oczekujących zadań kodowania, powyżej której
+# nowe filmy są odrzucane (settings.TRANSCODE_BACKLOG_LIMIT)
+DEFAULT_TRANSCODE_BACKLOG_LIMIT = 20
+
+
+def queue_length(name):
+    """ Liczba wiadomości czekających w kolejce brokera (0, gdy kolejki nie ma) """
+    try:
+        with current_app.connection_for_write() as connection:
+            return connection.default_channel.queue_declare(
+                queue=name, passive=True).message_count
+    except Exception as e:
+        # Pusta kolejka w Redisie nie istnieje; niedostępny broker nie blokuje uploadu
+        logger.debug(f"Nie można odczytać długości kolejki {name}: {e}")
+        return 0
+
+
+def transcode_backlog():
+    """ Oczekujące konwersje filmów (bez części już rozpoczętych konwersji) """
+    return queue_length(TRANSCODE_HEAVY_QUEUE)
+
+
+def transcode_admission_open():
+    """ Czy kolejka kodowania ma jeszcze miejsce na nowy film """
+    limit = getattr(settings, "TRANSCODE_BACKLOG_LIMIT",
+                    DEFAULT_TRANSCODE_BACKLOG_LIMIT)
+    backlog = transcode_backlog()
+    if backlog >= limit:
+        logger.warning(
+            f"⛔ Kolejka kodowania pełna ({backlog}/{limit}), odrzucam nowy film")
+        return False
+    return True
@@ -0,0 +1,69 @@
+""" Zagregowane oceny filmów: suma, liczba i średnia trzymane w wierszu Film """
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import Film, Ratings
+
+AGGREGATE_FIELDS = ['rating_sum', 'rating_count', 'rating_average']
+
+
+def _average_expression():
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast('rating_sum', FloatField()) / F('rating_count'),
+        output_field=FloatField())
+
+
+def adjust_film_rating(film_id, delta_sum, delta_count):
+    """ Zmienia agregaty w bazie (SET x = x + d) - równoczesne oceny się nie nadpisują """
+    films = Film.objects.filter(id=film_id)
+    films.update(rating_sum=F('rating_sum') + delta_sum,
+                 rating_count=F('rating_count') + delta_count)
+    # Średnia osobnym UPDATE: MySQL w tym samym widziałby już nowe wartości
+    # sumy i liczby, pozostałe bazy - stare
+    films.update(rating_average=_average_expression())
+
+
+def add_rating(user_id, film_id, rating, comments):
+    """ Zapis oceny i agregatów filmu (sygnał post_save) w jednej transakcji """
+    with transaction.atomic():
+        return Ratings.objects.create(
+            user_id=user_id, film_id=film_id, rating=rating, comments=comments)
+
+
+def reconcile_film_ratings(dry_run=False):
+    """ Porównuje agregaty z tabelą Ratings i poprawia rozbieżne filmy
+
+    Rozbieżności szuka jednym GROUP BY, a każdy film poprawia pod blokadą
+    wiersza (select_for_update) - ocena dodana w trakcie nie zostanie
+    ani zgubiona, ani policzona dwa razy. Zwraca listę
+    (film_id, (suma, liczba) przed, (suma, liczba) po).
+    """
+    actual = {
+        row['film_id']: (row['total'], row['count'])
+        for row in Ratings.objects.order_by().values('film_id').annotate(
+            total=Sum('rating'), count=Count('id'))}
+    candidates = [
+        film_id for film_id, rating_sum, rating_count in
+        Film.objects.values_list('id', 'rating_sum', 'rating_count').iterator()
+        if (rating_sum, rating_count) != actual.get(film_id, (0, 0))]
+
+    changes = []
+    for film_id in candidates:
+        with transaction.atomic():
+            film = Film.objects.select_for_update().only(*AGGREGATE_FIELDS).filter(
+                id=film_id).first()
+            if film is None:
+                continue
+            totals = Ratings.objects.filter(film_id=film_id).aggregate(
+                total=Sum('rating'), count=Count('id'))
+            total, count = totals['total'] or 0, totals['count']
+            if (film.rating_sum, film.rating_count) == (total, count):
+                continue
+            changes.append((film_id, (film.rating_sum, film.rating_count), (total, count)))
+            if not dry_run:
+                Film.objects.filter(id=film_id).update(
+                    rating_sum=total, rating_count=count,
+                    rating_average=total / count if count else 0.0)
+    return changes
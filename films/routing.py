@@ -0,0 +1,7 @@
+from django.urls import path
+from .consumers import FilmProgressConsumer
+
+websocket_urlpatterns = [
+    path('ws/film_progress/<int:film_id>/',
+         FilmProgressConsumer.as_asgi()),
+]
@@ -0,0 +1,367 @@
+""" Wyszukiwanie filmów: pełnotekstowe po nazwie i opisie oraz podpowiedzi po prefiksie
+
+Pełny tekst korzysta z indeksu bazy: GIN na tsvector w PostgreSQL, FTS5
+w SQLite. Na innych bazach (albo SQLite bez FTS5) działa odwrócony indeks
+w pamięci procesu. Podpowiedzi (typeahead) pochodzą ze zbioru sortowanego
+w Redisie (ZRANGEBYLEX), a bez Redisa - z posortowanej listy w pamięci.
+Indeksy w pamięci są przebudowywane po zmianie numeru generacji w cache'u.
+"""
+import bisect
+import logging
+import re
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections
+from mysite.redis_connection import redis_connection
+
+from .caching import FILM_TILE_FIELDS, film_tile
+from .models import Film
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_RESULTS = 20
+DEFAULT_SUGGESTIONS = 10
+NAME_WEIGHT = 4
+# Najwięcej słów dopasowanych do prefiksu ostatniego słowa (indeks w pamięci)
+PREFIX_EXPANSIONS = 50
+
+SEARCH_GENERATION_KEY = "search_generation:v1"
+PREFIX_KEY = "search:prefix:v1"
+TITLES_KEY = "search:titles:v1"
+PREFIX_BUILT_KEY = "search:prefix:v1:built"
+PREFIX_BUILD_LOCK_KEY = "search:prefix:v1:building"
+
+FTS_TABLE = f"{Film._meta.db_table}_fts"
+PG_INDEX = f"{Film._meta.db_table}_search_idx"
+# To samo wyrażenie w indeksie i w zapytaniu - inaczej PostgreSQL nie użyje indeksu
+PG_VECTOR = ("setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+             "setweight(to_tsvector('simple', coalesce(description, '')), 'B')")
+
+WORD_RE = re.compile(r"\w+")
+# Litery, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+FOLD = str.maketrans({"ł": "l", "ø": "o", "đ": "d", "ß": "ss", "æ": "ae", "œ": "oe"})
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or "").lower())
+
+
+def fold(text):
+    """ Małe litery bez znaków diakrytycznych: "Łódź" -> "lodz" """
+    text = unicodedata.normalize("NFKD", (text or "").lower().translate(FOLD))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def search_results_limit():
+    return getattr(settings, "SEARCH_RESULTS", DEFAULT_SEARCH_RESULTS)
+
+
+def suggestions_limit():
+    return getattr(settings, "SEARCH_SUGGESTIONS", DEFAULT_SUGGESTIONS)
+
+
+# Indeksy bazy danych
+
+def create_search_index(sender=None, using="default", **kwargs):
+    """ Tworzy indeks pełnotekstowy (post_migrate) - tabele filmów nie mają migracji """
+    db = connections[using]
+    table = Film._meta.db_table
+    try:
+        with db.cursor() as cursor:
+            if db.vendor == "postgresql":
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {table} USING gin (({PG_VECTOR}))")
+            elif db.vendor == "sqlite":
+                # Tabela z zewnętrzną treścią - wyzwalacze utrzymują ją zgodną z filmami
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    f"name, description, content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')")
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+                    f"VALUES (new.id, new.name, new.description); END")
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+                    f"VALUES ('delete', old.id, old.name, old.description); END")
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description "
+                    f"ON {table} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+                    f"VALUES ('delete', old.id, old.name, old.description); "
+                    f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+                    f"VALUES (new.id, new.name, new.description); END")
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except DatabaseError as e:
+        # Np. SQLite skompilowane bez FTS5 - zostaje indeks w pamięci
+        logger.warning(f"⚠️ Nie utworzono indeksu wyszukiwania: {e}")
+    _fts_available.pop(db.settings_dict["NAME"], None)
+
+
+_fts_available = {}
+
+
+def search_backend():
+    """ "postgresql", "fts5" albo "memory" - zależnie od bazy """
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        name = connection.settings_dict["NAME"]
+        if name not in _fts_available:
+            _fts_available[name] = FTS_TABLE in connection.introspection.table_names()
+        if _fts_available[name]:
+            return "fts5"
+    return "memory"
+
+
+def _search_postgresql(terms, limit):
+    # Wszystkie słowa, ostatnie jako prefiks; \w+ nie zawiera operatorów tsquery
+    query = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM {Film._meta.db_table}, to_tsquery('simple', %s) query "
+            f"WHERE {PG_VECTOR} @@ query "
+            f"ORDER BY ts_rank({PG_VECTOR}, query) DESC, id DESC LIMIT %s", [query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fts5(terms, limit):
+    query = " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {NAME_WEIGHT}.0, 1.0), rowid DESC LIMIT %s",
+            [query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Indeksy w pamięci procesu
+
+class InvertedIndex:
+    """ Słowo -> {film_id: waga}; ostatnie słowo zapytania dopasowywane jako prefiks """
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        for film_id, name, description in rows:
+            for weight, text in ((NAME_WEIGHT, name), (1, description)):
+                for term in tokenize(fold(text)):
+                    postings = self.postings[term]
+                    postings[film_id] = postings.get(film_id, 0) + weight
+        self.vocabulary = sorted(self.postings)
+
+    def prefix_terms(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, terms, limit):
+        scores = None
+        for index, term in enumerate(terms):
+            matched = self.prefix_terms(term) if index == len(terms) - 1 else [term]
+            term_scores = defaultdict(int)
+            for word in matched:
+                for film_id, weight in self.postings.get(word, {}).items():
+                    term_scores[film_id] += weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {film_id: score + term_scores[film_id]
+                          for film_id, score in scores.items() if film_id in term_scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda film_id: (-scores[film_id], -film_id))[:limit]
+
+
+class PrefixIndex:
+    """ Posortowane klucze "słowa tytułu od i-tego" - prefiks to wyszukiwanie binarne """
+
+    def __init__(self, rows):
+        self.entries = sorted(
+            (key, film_id, name) for film_id, name in rows
+            for key in title_keys(name))
+        self.keys = [entry[0] for entry in self.entries]
+
+    def suggest(self, prefix, limit):
+        results, seen = [], set()
+        for index in range(bisect.bisect_left(self.keys, prefix), len(self.entries)):
+            key, film_id, name = self.entries[index]
+            if not key.startswith(prefix) or len(results) == limit:
+                break
+            if film_id not in seen:
+                seen.add(film_id)
+                results.append({"id": film_id, "name": name})
+        return results
+
+
+def title_keys(name):
+    """ Tytuł od każdego słowa: "Gwiezdne wojny" -> "gwiezdne wojny", "wojny" """
+    words = tokenize(fold(name))
+    return [" ".join(words[index:]) for index in range(len(words))]
+
+
+def search_generation():
+    generation = cache.get(SEARCH_GENERATION_KEY)
+    if generation is None:
+        cache.add(SEARCH_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(SEARCH_GENERATION_KEY)
+    return generation
+
+
+_local_indexes = {}
+
+
+def _local_index(kind, build):
+    """ Indeks w pamięci procesu, przebudowywany po zmianie generacji """
+    generation = search_generation()
+    cached = _local_indexes.get(kind)
+    if cached is None or cached[0] != generation:
+        cached = _local_indexes[kind] = (generation, build())
+    return cached[1]
+
+
+def _search_memory(terms, limit):
+    index = _local_index("fulltext", lambda: InvertedIndex(
+        Film.objects.values_list("id", "name", "description").iterator()))
+    return index.search([fold(term) for term in terms], limit)
+
+
+def search_films(query, limit=None):
+    """ Kafelki filmów pasujących do wszystkich słów zapytania, od najlepiej pasujących """
+    terms = tokenize(query)
+    if not terms:
+        return []
+    limit = limit or search_results_limit()
+    backend = search_backend()
+    if backend == "postgresql":
+        ids = _search_postgresql(terms, limit)
+    elif backend == "fts5":
+        ids = _search_fts5(terms, limit)
+    else:
+        ids = _search_memory(terms, limit)
+    rows = {row["id"]: row for row in Film.objects.filter(id__in=ids).values(*FILM_TILE_FIELDS)}
+    return [film_tile(rows[film_id]) for film_id in ids if film_id in rows]
+
+
+# Podpowiedzi w Redisie
+
+def _member(key, film_id, name):
+    # Jeden ZRANGEBYLEX zwraca od razu id i tytuł
+    return f"{key}\x00{film_id}\x00{name}"
+
+
+def rebuild_prefix_index(conn=None):
+    """ Buduje zbiór podpowiedzi od zera i podmienia go atomowo (RENAME) """
+    conn = conn or redis_connection()
+    if conn is None:
+        return 0
+    building_key, titles_key = f"{PREFIX_KEY}:new", f"{TITLES_KEY}:new"
+    conn.delete(building_key, titles_key)
+    count = 0
+    pipe = conn.pipeline(transaction=False)
+    for film_id, name in Film.objects.values_list("id", "name").iterator(chunk_size=2000):
+        members = {_member(key, film_id, name): 0 for key in title_keys(name)}
+        if members:
+            pipe.zadd(building_key, members)
+        pipe.hset(titles_key, film_id, name)
+        count += 1
+        if count % 2000 == 0:
+            pipe.execute()
+    pipe.execute()
+
+    pipe = conn.pipeline(transaction=True)
+    pipe.delete(PREFIX_KEY, TITLES_KEY)
+    if conn.exists(building_key):
+        pipe.rename(building_key, PREFIX_KEY)
+    if conn.exists(titles_key):
+        pipe.rename(titles_key, TITLES_KEY)
+    pipe.set(PREFIX_BUILT_KEY, 1)
+    pipe.execute()
+    return count
+
+
+def _redis_suggest(conn, prefix, limit):
+    if not conn.exists(PREFIX_BUILT_KEY):
+        # Tylko jeden proces buduje zbiór; pozostałe w tym czasie pytają bazę
+        if not conn.set(PREFIX_BUILD_LOCK_KEY, 1, nx=True, ex=300):
+            return None
+        try:
+            rebuild_prefix_index(conn)
+        finally:
+            conn.delete(PREFIX_BUILD_LOCK_KEY)
+    # Kilka kluczy może należeć do jednego filmu - bierzemy z zapasem.
+    # Granice porównujemy bajtowo: 0xff nie występuje w UTF-8, więc zamyka
+    # zakres także dla cyrylicy czy CJK (a "\xff".encode() to już 0xc3 0xbf)
+    start = b"[" + prefix.encode()
+    members = conn.zrangebylex(PREFIX_KEY, start, start + b"\xff", start=0, num=limit * 3)
+    results, seen = [], set()
+    for member in members:
+        _, film_id, name = member.decode().split("\x00", 2)
+        if film_id not in seen and len(results) < limit:
+            seen.add(film_id)
+            results.append({"id": int(film_id), "name": name})
+    return results
+
+
+def suggest_titles(query, limit=None):
+    """ Podpowiedzi tytułów dla wpisanego początku (dowolnego słowa tytułu) """
+    prefix = " ".join(tokenize(fold(query)))
+    if not prefix:
+        return []
+    limit = limit or suggestions_limit()
+    conn = redis_connection()
+    if conn is not None:
+        results = _redis_suggest(conn, prefix, limit)
+        if results is not None:
+            return results
+        return [{"id": film_id, "name": name} for film_id, name in
+                Film.objects.filter(name__istartswith=query.strip()).order_by(
+                    "name").values_list("id", "name")[:limit]]
+    index = _local_index("prefix", lambda: PrefixIndex(
+        Film.objects.values_list("id", "name").iterator()))
+    return index.suggest(prefix, limit)
+
+
+def film_title_changed(film_id, name=None):
+    """ Aktualizuje podpowiedzi jednego filmu (name=None - film usunięty) """
+    conn = redis_connection()
+    if conn is None or not conn.exists(PREFIX_BUILT_KEY):
+        return  # zbiór zbuduje się przy pierwszym zapytaniu
+    old_name = conn.hget(TITLES_KEY, film_id)
+    old_name = old_name.decode() if old_name is not None else None
+    if old_name == name:
+        return
+    pipe = conn.pipeline(transaction=True)
+    if old_name is not None:
+        pipe.zrem(PREFIX_KEY, *[_member(key, film_id, old_name) for key in title_keys(old_name)]
+                  or [_member("", film_id, old_name)])
+    if name is None:
+        pipe.hdel(TITLES_KEY, film_id)
+    else:
+        members = {_member(key, film_id, name): 0 for key in title_keys(name)}
+        if members:
+            pipe.zadd(PREFIX_KEY, members)
+        pipe.hset(TITLES_KEY, film_id, name)
+    pipe.execute()
+
+
+def invalidate_search():
+    """ Indeksy w pamięci procesów przebudują się przy następnym zapytaniu """
+    try:
+        cache.incr(SEARCH_GENERATION_KEY)
+    except ValueError:
+        cache.set(SEARCH_GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def film_search_changed(film_id, name=None):
+    """ Po zapisie (name - nowy tytuł) albo usunięciu filmu (name=None) """
+    film_title_changed(film_id, name)
+    invalidate_search()
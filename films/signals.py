@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import (FILM_TILE_FIELDS, invalidate_catalogue,
+                      invalidate_catalogue_first_page, invalidate_film_ratings)
+from .cleanup import film_media
+from .models import Film, Ratings, VideoProgress
+from .progress_buffer import forget_film
+from .ratings import adjust_film_rating
+from .search import film_search_changed
+from .tasks import cleanup_film_media_task
+
+
+@receiver([post_save, post_delete], sender=Ratings)
+def ratings_changed(sender, instance, **kwargs):
+    """ Unieważnia cache ocen filmu po zatwierdzeniu transakcji """
+    film_id = instance.film_id
+    transaction.on_commit(lambda: invalidate_film_ratings(film_id))
+
+
+@receiver(pre_save, sender=Ratings)
+def rating_saving(sender, instance, raw=False, **kwargs):
+    """ Przy edycji (np. w panelu admina) zapamiętuje poprzednią ocenę """
+    instance._previous_rating = None
+    if instance.pk is not None and not raw:
+        instance._previous_rating = Ratings.objects.filter(
+            pk=instance.pk).values_list('film_id', 'rating').first()
+
+
+@receiver(post_save, sender=Ratings)
+def rating_saved(sender, instance, raw=False, **kwargs):
+    """ Agregaty filmu w tej samej transakcji co zapis oceny """
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None:
+        adjust_film_rating(previous[0], -previous[1], -1)
+    adjust_film_rating(instance.film_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Ratings)
+def rating_deleted(sender, instance, origin=None, **kwargs):
+    # Kaskada przy usuwaniu filmu - nie ma już czego aktualizować
+    if isinstance(origin, Film) or getattr(origin, 'model', None) is Film:
+        return
+    adjust_film_rating(instance.film_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Film)
+def film_saved(sender, instance, created, update_fields=None, **kwargs):
+    """ Nowy film odświeża tylko pierwszą stronę katalogu, zmiana - cały katalog
+
+    Zapisy pól, których nie ma na kafelkach (playlista, hash źródła),
+    nie ruszają cache'u katalogu.
+    """
+    if update_fields and not set(FILM_TILE_FIELDS) & set(update_fields):
+        return
+    if created:
+        transaction.on_commit(invalidate_catalogue_first_page)
+    else:
+        transaction.on_commit(invalidate_catalogue)
+
+
+@receiver(post_save, sender=Film)
+def film_search_fields_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    """ Indeksy wyszukiwania tylko gdy mogła się zmienić nazwa albo opis """
+    if raw or (update_fields and not {'name', 'description'} & set(update_fields)):
+        return
+    film_id, name = instance.id, instance.name
+    transaction.on_commit(lambda: film_search_changed(film_id, name))
+
+
+@receiver(post_delete, sender=Film)
+def film_deleted(sender, instance, **kwargs):
+    film_id = instance.id
+    transaction.on_commit(invalidate_catalogue)
+    transaction.on_commit(lambda: film_search_changed(film_id))
+    # Pliki usuwa worker - usuwanie w panelu admina nie czeka na storage
+    media = film_media(instance)
+    transaction.on_commit(lambda: cleanup_film_media_task.delay(media))
+
+
+@receiver(pre_delete, sender=Film)
+def film_deleting(sender, instance, **kwargs):
+    """ Film znika z "oglądaj dalej" widzów z zapisanym postępem (przed kaskadą) """
+    film_id = instance.id
+    user_ids = list(VideoProgress.objects.filter(
+        film_id=film_id).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: forget_film(user_ids, film_id))
@@ -0,0 +1,264 @@
+""" Pliki multimedialne przez API storage Django: dysk lokalny albo S3
+
+Źródła, miniatury, segmenty HLS i podglądy są zapisywane w default_storage
+(settings.STORAGES). Na FileSystemStorage FFmpeg czyta i pisze bezpośrednio
+w MEDIA_ROOT, tak jak wcześniej. Na storage bez ścieżek lokalnych (S3,
+MinIO) źródło jest pobierane do pliku tymczasowego, a wyniki powstają
+w katalogu roboczym i są wysyłane równolegle już w trakcie kodowania -
+serwery www i workery kodujące nie potrzebują wspólnego dysku.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+
+logger = logging.getLogger(__name__)
+
+HLS_PREFIX = "videos/hls"
+PREVIEWS_PREFIX = "videos/previews"
+PLAYLIST_EXTENSION = ".m3u8"
+# Liczba równoległych wysyłek do storage (settings.MEDIA_UPLOAD_WORKERS)
+DEFAULT_UPLOAD_WORKERS = 8
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def media_storage():
+    return default_storage
+
+
+def upload_workers():
+    return getattr(settings, "MEDIA_UPLOAD_WORKERS", DEFAULT_UPLOAD_WORKERS)
+
+
+def hls_prefix(key):
+    return f"{HLS_PREFIX}/{key}"
+
+
+def previews_prefix(film_id):
+    return f"{PREVIEWS_PREFIX}/{film_id}"
+
+
+def local_path(name, storage=None):
+    """ Ścieżka na dysku albo None, gdy storage nie jest lokalny
+
+    Sprawdzamy klasę, a nie samo path() - InMemoryStorage też je ma.
+    """
+    storage = storage or media_storage()
+    if not isinstance(storage, FileSystemStorage):
+        return None
+    return storage.path(name)
+
+
+@contextmanager
+def local_copy(name, storage=None):
+    """ Plik ze storage jako ścieżka dla FFmpeg i Pillow
+
+    Lokalny storage daje ścieżkę bez kopiowania, zdalny - kopię tymczasową
+    usuwaną po wyjściu z bloku.
+    """
+    storage = storage or media_storage()
+    path = local_path(name, storage)
+    if path is not None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Plik nie istnieje: {path}")
+        yield path
+        return
+
+    if not storage.exists(name):
+        raise FileNotFoundError(f"Plik nie istnieje: {name}")
+    with tempfile.NamedTemporaryFile(
+            suffix=os.path.splitext(name)[1], delete=False) as copy:
+        with storage.open(name, "rb") as source:
+            shutil.copyfileobj(source, copy, COPY_BUFFER_SIZE)
+    try:
+        yield copy.name
+    finally:
+        os.remove(copy.name)
+
+
+def save_file(name, content, storage=None):
+    """ Zapis pod dokładnie tą nazwą - FileSystemStorage dodałby sufiks """
+    storage = storage or media_storage()
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+def move_into_storage(path, name, storage=None):
+    """ Przenosi plik z dysku do storage; zwraca nadaną nazwę """
+    storage = storage or media_storage()
+    name = storage.get_available_name(name)
+    destination = local_path(name, storage)
+    if destination is not None:
+        # Lokalnie wystarczy zmienić nazwę, bez kopiowania
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(path, destination)
+        return name
+    with open(path, "rb") as f:
+        name = storage.save(name, File(f))
+    os.remove(path)
+    return name
+
+
+def walk_files(prefix, storage=None):
+    """ Nazwy wszystkich plików pod prefiksem (rekurencyjnie) """
+    storage = storage or media_storage()
+    try:
+        directories, files = storage.listdir(prefix)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f"{prefix}/{name}"
+    for directory in directories:
+        yield from walk_files(f"{prefix}/{directory}", storage)
+
+
+def tree_size(prefix, storage=None):
+    """ Łączny rozmiar plików pod prefiksem (bajty) """
+    storage = storage or media_storage()
+    path = local_path(prefix, storage)
+    if path is not None:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return sum(storage.size(name) for name in walk_files(prefix, storage))
+
+
+def delete_tree(prefix, storage=None):
+    """ Usuwa wszystkie pliki pod prefiksem """
+    storage = storage or media_storage()
+    path = local_path(prefix, storage)
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    for name in list(walk_files(prefix, storage)):
+        storage.delete(name)
+
+
+class OutputDirectory:
+    """ Katalog, w którym FFmpeg zapisuje pliki trafiające pod `prefix` w storage
+
+    Na lokalnym storage to po prostu katalog docelowy. Na zdalnym pliki
+    powstają w katalogu tymczasowym: `sync()` (wołane przy każdej porcji
+    postępu FFmpeg) wysyła w tle segmenty, których FFmpeg już nie pisze,
+    a `finish()` resztę - playlisty na końcu, master jako ostatnią, żeby
+    odtwarzacz nigdy nie zobaczył playlisty z brakującymi segmentami.
+    """
+
+    def __init__(self, prefix, storage=None, workers=None):
+        self.storage = storage or media_storage()
+        self.prefix = prefix
+        self.is_local = local_path(prefix, self.storage) is not None
+        if self.is_local:
+            self.directory = local_path(prefix, self.storage)
+            os.makedirs(self.directory, exist_ok=True)
+        else:
+            self.directory = tempfile.mkdtemp(prefix="media-")
+        self.workers = workers or upload_workers()
+        self.executor = None
+        self.futures = []
+        self.uploaded = set()
+        self.uploaded_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.finish()
+        finally:
+            self.close()
+
+    def path(self, relative):
+        return os.path.join(self.directory, relative)
+
+    def _files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                yield os.path.relpath(os.path.join(root, name), self.directory)
+
+    def _ready_segments(self):
+        """ Pliki poza playlistami z pominięciem najnowszego w każdym katalogu
+
+        Segmenty jednej jakości powstają po kolei, więc najnowszy może być
+        jeszcze zapisywany.
+        """
+        newest = {}
+        candidates = []
+        for relative in self._files():
+            if relative in self.uploaded or relative.endswith(PLAYLIST_EXTENSION):
+                continue
+            try:
+                mtime = os.path.getmtime(self.path(relative))
+            except OSError:
+                continue
+            directory = os.path.dirname(relative)
+            if directory not in newest or mtime >= newest[directory][0]:
+                newest[directory] = (mtime, relative)
+            candidates.append(relative)
+        in_progress = {relative for _, relative in newest.values()}
+        return [relative for relative in candidates if relative not in in_progress]
+
+    def _upload(self, relative):
+        path = self.path(relative)
+        with open(path, "rb") as f:
+            save_file(f"{self.prefix}/{relative.replace(os.sep, '/')}", File(f), self.storage)
+        return os.path.getsize(path)
+
+    def _submit(self, relative):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.uploaded.add(relative)
+        self.futures.append(self.executor.submit(self._upload, relative))
+
+    def wait(self):
+        """ Czeka na wysłane pliki; błąd wysyłki przerywa konwersję """
+        futures, self.futures = self.futures, []
+        for future in futures:
+            self.uploaded_size += future.result()
+
+    def sync(self):
+        if self.is_local:
+            return
+        for relative in self._ready_segments():
+            self._submit(relative)
+
+    def finish(self):
+        if self.is_local:
+            return
+        remaining = [relative for relative in self._files() if relative not in self.uploaded]
+        playlists = [relative for relative in remaining if relative.endswith(PLAYLIST_EXTENSION)]
+        for relative in remaining:
+            if relative not in playlists:
+                self._submit(relative)
+        self.wait()
+        # Playlisty jakości przed playlistami master, które leżą płycej
+        for depth in sorted({r.count(os.sep) for r in playlists}, reverse=True):
+            for relative in playlists:
+                if relative.count(os.sep) == depth:
+                    self._submit(relative)
+            self.wait()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if not self.is_local:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    @property
+    def size(self):
+        """ Rozmiar wyników (wysłanych albo na dysku lokalnym) """
+        return tree_size(self.prefix, self.storage) if self.is_local else self.uploaded_size
@@ -1,101 +1,664 @@
 from celery import shared_task
+from celery.utils import uuid
 import os
 import subprocess
 import logging
 from django.conf import settings
-from .models import Film
-import re
+from .models import Film, TranscodeJob
+from django.core.cache import cache
+from .hls import (DEFAULT_CHUNK_SECONDS, DEFAULT_PARALLEL_MIN_DURATION,
+                  DEFAULT_REMUX_MAX_KEYFRAME_INTERVAL, MASTER_PLAYLIST_NAME,
+                  build_hls_command, build_remux_command, build_split_command,
+                  codecs_allow_remux, concat_playlists, get_encoder_profile,
+                  get_renditions,
+                  iter_progress, keyframes_allow_remux, plan_chunks,
+                  probe_keyframes, probe_source, read_chunk_list,
+                  select_renditions)
+import tempfile
 import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .consumers import progress_group_name
+from .progress_buffer import flush_progress
+from .uploads import file_sha256
+from .previews import (SPRITE_VTT_NAME, build_sprite_command, build_sprite_vtt,
+                       make_thumbnail_variants, sprite_layout)
+from .storage import (OutputDirectory, delete_tree, hls_prefix, local_copy,
+                      local_path, media_storage, previews_prefix, save_file,
+                      tree_size)
+from django.core.files.base import ContentFile
 from django.db import models
+from django.utils import timezone
 logger = logging.getLogger(__name__)
 
+# Co ile procent logować postęp konwersji
+PROGRESS_LOG_STEP = 5
+# Minimalny odstęp (s) między wiadomościami o postępie wysyłanymi przez WebSocket
+PROGRESS_PUSH_INTERVAL = 1.0
+# Minimalny odstęp (s) między zapisami postępu do TranscodeJob
+JOB_SAVE_INTERVAL = 5.0
+# Maksymalny czas (s) blokady konwersji jednego źródła (settings.HLS_LOCK_TIMEOUT)
+DEFAULT_HLS_LOCK_TIMEOUT = 6 * 3600
+
+
+class ProgressPublisher:
+    """ Wysyła postęp konwersji do grupy Channels danego filmu z ograniczeniem częstotliwości """
+
+    def __init__(self, film_id, interval=PROGRESS_PUSH_INTERVAL, job=None):
+        self.group_name = progress_group_name(film_id)
+        self.interval = interval
+        self.channel_layer = get_channel_layer()
+        self.last_sent = None
+        self.last_stage = None
+        self.job = job
+        self.job_saved_at = None
+        self.last_fps = None
+
+    def publish(self, stage, state=None, force=False):
+        now = time.monotonic()
+        # Zmiana etapu jest wysyłana zawsze, postęp w trakcie etapu co `interval`
+        if (not force and stage == self.last_stage and self.last_sent is not None
+                and now - self.last_sent < self.interval):
+            return
+        state = state or {}
+        data = {
+            "stage": stage,
+            "percent": state.get("percent"),
+            "fps": state.get("fps"),
+            "speed": state.get("speed"),
+            "eta": state.get("eta"),
+        }
+        if data["fps"]:
+            self.last_fps = data["fps"]
+        self.save_job(stage, data, now)
+        if self.channel_layer is None:
+            return
+        try:
+            async_to_sync(self.channel_layer.group_send)(
+                self.group_name, {"type": "film.progress", "data": data})
+        except Exception as e:
+            # Brak Redisa nie może przerwać konwersji
+            logger.warning(f"⚠️ Nie udało się wysłać postępu: {e}")
+            return
+        self.last_sent = now
+        self.last_stage = stage
+
+    def save_job(self, stage, data, now):
+        """ Zapisuje etap i postęp w zleceniu - rzadziej niż wysyłka przez WebSocket """
+        if self.job is None:
+            return
+        if (stage == self.job.stage and self.job_saved_at is not None
+                and now - self.job_saved_at < JOB_SAVE_INTERVAL):
+            return
+        fields = {"stage": stage}
+        if data["percent"] is not None:
+            fields["percent"] = data["percent"]
+        if data["fps"]:
+            fields["encode_fps"] = data["fps"]
+        update_job(self.job, **fields)
+        self.job_saved_at = now
+
+    def fail(self, error):
+        """ Ogłasza błąd konwersji i zapisuje jego treść w zleceniu """
+        update_job(self.job, status=TranscodeJob.STATUS_FAILED,
+                   finished_at=timezone.now(), error=str(error)[-2000:])
+        self.publish("error", force=True)
+
+
+def update_job(job, **fields):
+    """ Zapisuje tylko podane pola zlecenia (None - brak zlecenia) """
+    if job is None:
+        return
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save(update_fields=list(fields))
+
+
+def job_for_task(task_id, film):
+    """ Zlecenie założone przy kolejkowaniu albo nowe przy ręcznym wywołaniu zadania """
+    job = TranscodeJob.objects.filter(task_id=task_id).first() if task_id else None
+    return job or TranscodeJob.objects.create(film=film, task_id=task_id or "")
+
+
+def run_ffmpeg(command, duration=None, on_progress=None, outputs=None):
+    """ Uruchamia FFmpeg, przekazując kolejne stany postępu do `on_progress`
+
+    `outputs` (OutputDirectory) przy każdym stanie wysyła gotowe już segmenty.
+    """
+    # stderr do pliku tymczasowego, żeby pełny bufor nie zablokował FFmpeg
+    with tempfile.TemporaryFile(mode="w+") as stderr_file:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+
+        # Monitorowanie postępu - readline czeka na dane bez zużywania CPU
+        for state in iter_progress(process.stdout, duration):
+            if outputs is not None:
+                outputs.sync()
+            if on_progress:
+                on_progress(state)
+
+        returncode = process.wait()
+        if returncode != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(
+                returncode, command, stderr=stderr_file.read()[-2000:])
+
+
+def progress_reporter(film_id, stage, publisher):
+    """ Zwraca callback logujący postęp co PROGRESS_LOG_STEP % i wysyłający go do Channels """
+    last_logged = -PROGRESS_LOG_STEP
+
+    def on_progress(state):
+        nonlocal last_logged
+        publisher.publish(stage, state)
+        percent = state["percent"]
+        if percent is not None and percent - last_logged >= PROGRESS_LOG_STEP:
+            last_logged = percent
+            logger.info(
+                f"⏳ Film {film_id}: {percent:.1f}%, "
+                f"prędkość {state['speed'] or 0:.2f}x, "
+                f"pozostało {format_eta(state['eta'])}")
+
+    return on_progress
+
+
+def hls_key(film):
+    """ Nazwa katalogu HLS - skrót źródła, wspólny dla identycznych plików
+
+    Film z jawnie wybranym profilem kodowania dostaje osobny katalog.
+    """
+    if not film.content_hash:
+        return str(film.id)
+    if film.encoder_profile:
+        return f"{film.content_hash}-{film.encoder_profile}"
+    return film.content_hash
+
+
+def hls_output_dir(key):
+    """ Katalog HLS na dysku (tylko lokalny storage, np. benchmark) """
+    return local_path(hls_prefix(key))
+
+
+def conversion_lock_key(key):
+    return f"hls_lock_{key}"
+
+
+def conversion_lock_timeout():
+    return getattr(settings, "HLS_LOCK_TIMEOUT", DEFAULT_HLS_LOCK_TIMEOUT)
+
+
+def acquire_conversion_lock(key, film_id):
+    """ Atomowe SET NX - drugie zadanie dla tego samego źródła dostaje False """
+    return cache.add(conversion_lock_key(key), film_id, timeout=conversion_lock_timeout())
+
+
+def release_conversion_lock(key):
+    cache.delete(conversion_lock_key(key))
+
+
+def converted_duplicate(film):
+    """ Inny film z tym samym źródłem, który ma już gotową playlistę """
+    if not film.content_hash:
+        return None
+    return Film.objects.filter(
+        content_hash=film.content_hash,
+        encoder_profile=film.encoder_profile).exclude(
+        id=film.id).exclude(hls_playlist__isnull=True).exclude(
+        hls_playlist="").first()
+
+
+def waiting_duplicates(film):
+    """ Filmy z tym samym źródłem i profilem, które nie mają jeszcze playlisty """
+    return Film.objects.filter(
+        content_hash=film.content_hash,
+        encoder_profile=film.encoder_profile).filter(
+        models.Q(hls_playlist__isnull=True) | models.Q(hls_playlist="")).exclude(
+        id=film.id)
+
+
+def requeue_waiting_duplicates(film_id):
+    """ Ponownie zleca konwersję duplikatom, które ustąpiły nieudanemu zadaniu
+
+    Tylko filmom, których ostatnie zlecenie pominięto z powodu blokady -
+    film, którego konwersja sama się nie udała, nie wraca do kolejki.
+    """
+    film = Film.objects.filter(id=film_id).first()
+    if film is None or not film.content_hash:
+        return []
+    requeued = []
+    for duplicate in waiting_duplicates(film):
+        job = duplicate.transcode_jobs.order_by("-created_at", "-id").first()
+        if job and job.status == TranscodeJob.STATUS_SKIPPED and job.stage == "locked":
+            enqueue_conversion(duplicate)
+            requeued.append(duplicate.id)
+    if requeued:
+        logger.info(f"🔁 Ponownie zlecono konwersję filmów: {requeued}")
+    return requeued
+
+
+def abandon_conversion(key, film_id):
+    """ Zwalnia blokadę nieudanej konwersji i przekazuje źródło czekającym """
+    release_conversion_lock(key)
+    requeue_waiting_duplicates(film_id)
+
+
+def finish_conversion(film, publisher, output_size=None):
+    """ Zapisuje adres playlisty master i ogłasza koniec konwersji """
+    prefix = hls_prefix(hls_key(film))
+    film.hls_playlist = media_storage().url(f"{prefix}/{MASTER_PLAYLIST_NAME}")
+
+    # Tylko to pole - równolegle działa zadanie podglądów
+    film.save(update_fields=["hls_playlist"])
+
+    # Duplikaty, których zadania ustąpiły temu, dostają tę samą playlistę
+    if film.content_hash:
+        waiting_ids = list(waiting_duplicates(film).values_list("id", flat=True))
+        if waiting_ids:
+            Film.objects.filter(id__in=waiting_ids).update(
+                hls_playlist=film.hls_playlist)
+            for waiting_id in waiting_ids:
+                ProgressPublisher(waiting_id).publish(
+                    "done", {"percent": 100.0, "eta": 0.0}, force=True)
+
+    fields = {}
+    if publisher.last_fps:
+        fields["encode_fps"] = publisher.last_fps
+    update_job(publisher.job, status=TranscodeJob.STATUS_DONE,
+               finished_at=timezone.now(),
+               output_size=output_size if output_size is not None else tree_size(prefix),
+               **fields)
+    logger.info(f"✅ Konwersja zakończona: {film.hls_playlist}")
+    publisher.publish("done", {"percent": 100.0, "eta": 0.0}, force=True)
+    return film.hls_playlist
+
 
 @shared_task(bind=True)
 def convert_to_hls_task(self, film_id):
     """ Konwersja MP4 do HLS w Celery z monitorowaniem czasu pozostałego """
+    publisher = ProgressPublisher(film_id)
     try:
         # Inicjalizacja
         film = Film.objects.get(id=film_id)
+        publisher.job = job_for_task(self.request.id, film)
         if not film.link:
             raise ValueError("Brak pliku w bazie danych!")
         if film.hls_playlist:
             logger.info(
                 f"Film {film_id} już został skonwertowany. Pomijam konwersję.")
+            update_job(publisher.job, status=TranscodeJob.STATUS_SKIPPED,
+                       finished_at=timezone.now())
             return film.hls_playlist
 
-        input_file = os.path.join(settings.MEDIA_ROOT, str(film.link))
-        output_dir = os.path.join(
-            settings.MEDIA_ROOT, "videos", "hls", str(film.id))
-        os.makedirs(output_dir, exist_ok=True)
-        output_playlist = os.path.join(output_dir, "output.m3u8")
-
-        if not os.path.exists(input_file):
-            raise FileNotFoundError(f"Plik nie istnieje: {input_file}")
-
-        # Uruchomienie FFmpeg
-        logger.info(f"🎬 Konwertuję: {input_file} ➝ {output_playlist}")
-
-        # Komenda do FFmpeg
-        command = [
-            "ffmpeg",
-            "-i", input_file,
-            "-preset", "fast",  # Dodaj opcje konwersji
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            "-f", "hls",
-            "-start_number", "0",
-            "-hls_time", "10",
-            "-hls_list_size", "0",
-            output_playlist
-        ]
+        # Na storage zdalnym (S3) źródło jest pobierane do pliku tymczasowego
+        with local_copy(film.link.name) as input_file:
+            update_job(publisher.job, status=TranscodeJob.STATUS_RUNNING,
+                       started_at=timezone.now(),
+                       input_size=os.path.getsize(input_file))
 
-        process = subprocess.Popen(
-            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            # Pliki złożone z części uploadu nie mają jeszcze skrótu
+            if not film.content_hash:
+                film.content_hash = file_sha256(input_file)
+                film.save(update_fields=["content_hash"])
 
-        # Monitorowanie postępu
-        total_duration = None
-        current_duration = 0
+            key = hls_key(film)
+            if not acquire_conversion_lock(key, film.id):
+                # Playlistę dostanie od zadania, które trzyma blokadę, a jeśli
+                # tamto się nie uda - nowe zlecenie (requeue_waiting_duplicates)
+                logger.info(
+                    f"🔒 Źródło filmu {film_id} jest już konwertowane. Pomijam.")
+                update_job(publisher.job, status=TranscodeJob.STATUS_SKIPPED,
+                           stage="locked", finished_at=timezone.now())
+                return None
+            try:
+                playlist = convert_source(film, input_file, key, publisher)
+            except Exception:
+                abandon_conversion(key, film.id)
+                raise
+        # None - części kodują workery, blokadę zwolni finalize_chunks_task
+        if playlist is not None:
+            release_conversion_lock(key)
+        return playlist
+
+    except Film.DoesNotExist:
+        logger.error(f"❌ Film o ID {film_id} nie istnieje!")
+        publisher.publish("error", force=True)
+        return None
+    except FileNotFoundError as e:
+        logger.error(f"❌ Plik nie znaleziony: {e}")
+        publisher.fail(e)
+        return None
+    except subprocess.CalledProcessError as e:
+        logger.error(f"❌ Błąd FFmpeg: {e}\n{e.stderr}")
+        publisher.fail(f"{e}\n{e.stderr}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Błąd konwersji: {e}")
+        publisher.fail(e)
+        return None
 
-        while True:
-            # Pobieranie stanu z wyjścia ffmpeg
-            stderr = process.stderr.read()
-            remaining_time = extract_remaining_time(stderr)
 
-            if remaining_time:
-                remaining_minutes, remaining_seconds = map(
-                    int, remaining_time.split(":"))
-                logger.info(
-                    f"⏳ Pozostały czas: {remaining_minutes}:{remaining_seconds}")
+def convert_source(film, input_file, key, publisher):
+    """ Tworzy pliki HLS źródła: ponowne użycie, przepakowanie, części albo drabinka """
+    # Identyczne źródło już skonwertowane - wystarczy wskazać jego playlistę
+    duplicate = converted_duplicate(film)
+    if duplicate is not None:
+        logger.info(
+            f"♻️ Film {film.id} ma to samo źródło co film {duplicate.id}, "
+            f"używam gotowego HLS")
+        return finish_conversion(film, publisher)
+
+    film_id = film.id
+    output_playlist = f"{hls_prefix(key)}/{MASTER_PLAYLIST_NAME}"
+
+    # Dobór jakości do rozdzielczości źródła
+    publisher.publish("probing")
+    source = probe_source(input_file)
+    renditions = select_renditions(get_renditions(), source["height"])
+    profile = get_encoder_profile(film.encoder_profile)
+    update_job(publisher.job, source_duration=source["duration"],
+               profile=profile["name"])
 
-            if process.poll() is not None:
-                break
+    keyframes = None
 
-        # Zakończenie konwersji
-        film.hls_playlist = film.hls_playlist = f"{settings.MEDIA_URL}videos/hls/{film.id}/output.m3u8"
+    # H.264/AAC z gęstymi klatkami kluczowymi wystarczy przepakować - chyba
+    # że użytkownik wybrał profil, wtedy kodujemy tak, jak zażądał
+    if (getattr(settings, "HLS_REMUX", True) and not film.encoder_profile
+            and codecs_allow_remux(source)):
+        keyframes = probe_keyframes(input_file)
+        max_interval = getattr(settings, "HLS_REMUX_MAX_KEYFRAME_INTERVAL",
+                               DEFAULT_REMUX_MAX_KEYFRAME_INTERVAL)
+        if keyframes_allow_remux(keyframes, source["duration"], max_interval):
+            logger.info(
+                f"📦 Przepakowuję bez rekompresji: {input_file} ➝ {output_playlist}")
+            with OutputDirectory(hls_prefix(key)) as outputs:
+                command = build_remux_command(
+                    input_file, outputs.directory, has_audio=source["has_audio"],
+                    segment_time=profile["segment_time"])
+                publisher.publish("remuxing")
+                run_ffmpeg(command, source["duration"],
+                           progress_reporter(film_id, "remuxing", publisher), outputs)
+            return finish_conversion(film, publisher, outputs.size)
+
+    # Długie filmy dzielimy na części kodowane równolegle przez workery;
+    # playlist fMP4 (osobny plik init w każdej części) nie sklejamy
+    min_duration = getattr(settings, "HLS_PARALLEL_MIN_DURATION",
+                           DEFAULT_PARALLEL_MIN_DURATION)
+    if (source["duration"] and source["duration"] >= min_duration
+            and profile["segment_type"] != "fmp4"):
+        if keyframes is None:
+            keyframes = probe_keyframes(input_file)
+        cut_times = plan_chunks(
+            keyframes, source["duration"],
+            getattr(settings, "HLS_CHUNK_SECONDS", DEFAULT_CHUNK_SECONDS))
+        if cut_times:
+            return split_and_dispatch(
+                film, input_file, renditions, source, cut_times, publisher,
+                profile)
+
+    # Uruchomienie FFmpeg
+    logger.info(
+        f"🎬 Konwertuję: {input_file} ➝ {output_playlist} "
+        f"({', '.join(r['name'] for r in renditions)}, profil {profile['name']})")
+
+    # Komenda do FFmpeg - wszystkie jakości w jednym przebiegu; segmenty
+    # trafiają do storage już w trakcie kodowania
+    with OutputDirectory(hls_prefix(key)) as outputs:
+        command = build_hls_command(
+            input_file, outputs.directory, renditions, has_audio=source["has_audio"],
+            profile=profile)
+
+        publisher.publish("encoding")
+        run_ffmpeg(command, source["duration"],
+                   progress_reporter(film_id, "encoding", publisher), outputs)
+
+    # Zakończenie konwersji
+    return finish_conversion(film, publisher, outputs.size)
+
+
+def chunk_prefix(index):
+    return f"c{index:04d}_"
+
+
+def split_and_dispatch(film, input_file, renditions, source, cut_times, publisher,
+                       profile=None):
+    """ Tnie źródło na części i rozsyła ich kodowanie do workerów
+
+    Części trafiają do storage, więc mogą je kodować workery na innych maszynach.
+    Sklejanie zleca ostatnia zakończona część (wyniki części w cache'u) - chord
+    Celery wymagałby backendu wyników.
+    """
+    key = hls_key(film)
+    chunks_prefix = f"{hls_prefix(key)}/chunks"
+
+    publisher.publish("splitting", force=True)
+    with OutputDirectory(chunks_prefix) as outputs:
+        chunk_list = outputs.path("chunks.csv")
+        run_ffmpeg(build_split_command(
+            input_file, outputs.path("chunk%04d.mp4"), chunk_list, cut_times),
+            outputs=outputs)
+        chunks = read_chunk_list(chunk_list)
+
+    logger.info(
+        f"🧩 Film {film.id} podzielony na {len(chunks)} części "
+        f"({', '.join(r['name'] for r in renditions)})")
+    # Wyniki poprzedniej konwersji tego filmu nie mogą się doliczyć
+    cache.delete_many(chunk_state_keys(film.id, len(chunks)) + [chunks_finalize_key(film.id)])
+    publisher.publish("encoding", {"percent": 0.0}, force=True)
+
+    # Części dziedziczą priorytet filmu
+    job_id = publisher.job.id if publisher.job else None
+    for index, (name, start) in enumerate(chunks):
+        transcode_chunk_task.apply_async(
+            (film.id, index, f"{chunks_prefix}/{name}", start, renditions,
+             source["has_audio"], len(chunks), key, job_id, profile, film.priority),
+            priority=film.priority)
+    return None
+
+
+CHUNK_DONE = "done"
+CHUNK_FAILED = "failed"
 
-        film.is_converted = True
-        film.save()
 
-        logger.info(f"✅ Konwersja zakończona: {film.hls_playlist}")
-        return film.hls_playlist
+def chunk_state_keys(film_id, total_chunks):
+    """ Klucze wyników części, po jednym na część
+
+    Zadanie dostarczone ponownie (acks_late) nadpisuje swój klucz zamiast
+    liczyć się drugi raz.
+    """
+    return [f"film_chunk_{film_id}_{index}" for index in range(total_chunks)]
+
+
+def chunk_states(film_id, total_chunks):
+    """ Wyniki zakończonych części: {klucz: CHUNK_DONE | CHUNK_FAILED} """
+    return cache.get_many(chunk_state_keys(film_id, total_chunks))
+
+
+def chunks_finalize_key(film_id):
+    """ Znacznik zlecenia sklejania - zleca je tylko jedna część """
+    return f"film_chunks_finalize_{film_id}"
+
+
+@shared_task(bind=True)
+def transcode_chunk_task(self, film_id, index, chunk_file, start, renditions,
+                         has_audio, total_chunks, key, job_id=None, profile=None,
+                         priority=Film.PRIORITY_NORMAL):
+    """ Koduje jedną część filmu (`chunk_file` - nazwa w storage) do wszystkich jakości HLS
+
+    Ostatnia zakończona część zleca sklejanie playlist.
+    """
+    result = index
+    try:
+        with local_copy(chunk_file) as input_file, \
+                OutputDirectory(hls_prefix(key)) as outputs:
+            run_ffmpeg(build_hls_command(
+                input_file, outputs.directory, renditions,
+                has_audio=has_audio, prefix=chunk_prefix(index), ts_offset=start,
+                profile=profile), outputs=outputs)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"❌ Błąd FFmpeg (część {index} filmu {film_id}): {e}\n{e.stderr}")
+        result = None
+    except Exception as e:
+        logger.error(f"❌ Błąd kodowania części {index} filmu {film_id}: {e}")
+        result = None
+
+    job = TranscodeJob.objects.filter(id=job_id).first() if job_id else None
+    publisher = ProgressPublisher(film_id, job=job)
+    timeout = conversion_lock_timeout()
+    cache.set(chunk_state_keys(film_id, total_chunks)[index],
+              CHUNK_DONE if result is not None else CHUNK_FAILED, timeout=timeout)
+    done = len(chunk_states(film_id, total_chunks))
+
+    publisher.publish(
+        "encoding", {"percent": min(100.0, done / total_chunks * 100)}, force=True)
+    # Dwie ostatnie części kończące równocześnie mogą obie zobaczyć komplet
+    if done == total_chunks and cache.add(chunks_finalize_key(film_id), 1, timeout=timeout):
+        finalize_chunks_task.apply_async(
+            (film_id, total_chunks, [r["name"] for r in renditions], key, job_id),
+            priority=priority)
+    return result
+
+
+@shared_task(bind=True)
+def finalize_chunks_task(self, film_id, total_chunks, rendition_names, key, job_id=None):
+    """ Skleja playlisty części w playlisty jakości i playlistę master """
+    job = TranscodeJob.objects.filter(id=job_id).first() if job_id else None
+    publisher = ProgressPublisher(film_id, job=job)
+    states = chunk_states(film_id, total_chunks)
+    # Wynik, który wygasł albo wypadł z cache'u, też oznacza brakującą część
+    failed = list(states.values()).count(CHUNK_FAILED) + total_chunks - len(states)
+    cache.delete_many(list(states) + [chunks_finalize_key(film_id)])
+    storage = media_storage()
+    prefix = hls_prefix(key)
+    try:
+        if failed:
+            raise RuntimeError(f"nie udało się zakodować {failed} części")
+        film = Film.objects.get(id=film_id)
+
+        chunk_prefixes = [chunk_prefix(index) for index in range(total_chunks)]
+        for name in rendition_names:
+            playlists = []
+            for chunk in chunk_prefixes:
+                path = f"{prefix}/{name}/{chunk}index.m3u8"
+                with storage.open(path) as f:
+                    playlists.append(read_text(f))
+                storage.delete(path)
+            save_file(f"{prefix}/{name}/index.m3u8",
+                      ContentFile(concat_playlists(playlists).encode()), storage)
+
+        # Playlista master pierwszej części wskazuje już na właściwe katalogi
+        with storage.open(f"{prefix}/{chunk_prefixes[0]}{MASTER_PLAYLIST_NAME}") as f:
+            master = read_text(f).replace(f"{chunk_prefixes[0]}index.m3u8", "index.m3u8")
+        save_file(f"{prefix}/{MASTER_PLAYLIST_NAME}", ContentFile(master.encode()), storage)
+        for chunk in chunk_prefixes:
+            path = f"{prefix}/{chunk}{MASTER_PLAYLIST_NAME}"
+            if storage.exists(path):
+                storage.delete(path)
+        delete_tree(f"{prefix}/chunks", storage)
+
+        playlist = finish_conversion(film, publisher)
 
     except Film.DoesNotExist:
         logger.error(f"❌ Film o ID {film_id} nie istnieje!")
+        publisher.publish("error", force=True)
+        release_conversion_lock(key)
         return None
-    except FileNotFoundError as e:
-        logger.error(f"❌ Plik nie znaleziony: {e}")
+    except Exception as e:
+        logger.error(f"❌ Błąd sklejania części filmu {film_id}: {e}")
+        publisher.fail(e)
+        # Bez finally - ponowione zlecenie mogło już wziąć nową blokadę
+        abandon_conversion(key, film_id)
+        return None
+    release_conversion_lock(key)
+    return playlist
+
+
+@shared_task(bind=True)
+def generate_previews_task(self, film_id):
+    """ Warianty miniatury (WebP/AVIF) i arkusz klatek z indeksem WebVTT """
+    try:
+        film = Film.objects.get(id=film_id)
+        variants = {}
+        with OutputDirectory(previews_prefix(film.id)) as outputs:
+            if film.thumbnail:
+                with local_copy(film.thumbnail.name) as thumbnail:
+                    variants = make_thumbnail_variants(thumbnail, outputs.directory)
+
+            with local_copy(film.link.name) as input_file:
+                source = probe_source(input_file)
+                if source["duration"] and source["width"] and source["height"]:
+                    layout = sprite_layout(
+                        source["duration"], source["width"], source["height"])
+                    run_ffmpeg(build_sprite_command(input_file, outputs.directory, layout),
+                               outputs=outputs)
+                    with open(outputs.path(SPRITE_VTT_NAME), "w") as f:
+                        f.write(build_sprite_vtt(source["duration"], layout))
+
+        film.has_previews = True
+        film.thumbnail_variants = variants
+        film.save(update_fields=["has_previews", "thumbnail_variants"])
+        logger.info(f"🖼️ Podglądy filmu {film_id} gotowe")
+        return True
+
+    except Film.DoesNotExist:
+        logger.error(f"❌ Film o ID {film_id} nie istnieje!")
         return None
     except subprocess.CalledProcessError as e:
-        logger.error(f"❌ Błąd FFmpeg: {e}")
+        logger.error(f"❌ Błąd FFmpeg (podglądy filmu {film_id}): {e}\n{e.stderr}")
         return None
     except Exception as e:
-        logger.error(f"❌ Błąd konwersji: {e}")
+        logger.error(f"❌ Błąd generowania podglądów filmu {film_id}: {e}")
         return None
 
 
-def extract_remaining_time(stderr):
-    """ Ekstrakcja pozostałego czasu z stderr ffmpeg """
-    match = re.search(r'(\d{2}):(\d{2}):(\d{2})', stderr)
-    if match:
-        return f"{match.group(2)}:{match.group(3)}"
-    return None
+def read_text(f):
+    """ Treść pliku ze storage jako tekst (S3 otwiera pliki binarnie) """
+    content = f.read()
+    return content.decode() if isinstance(content, bytes) else content
+
+
+def enqueue_conversion(film):
+    """ Zakłada zlecenie konwersji i kolejkuje zadanie o tym samym id """
+    task_id = uuid()
+    TranscodeJob.objects.create(film=film, task_id=task_id)
+    return convert_to_hls_task.apply_async(
+        (film.id,), priority=film.priority, task_id=task_id)
+
+
+def enqueue_film_processing(film):
+    """ Zleca konwersję i podglądy nowego filmu z jego priorytetem """
+    task = enqueue_conversion(film)
+    generate_previews_task.apply_async((film.id,), priority=film.priority)
+    return task
+
+
+@shared_task
+def cleanup_film_media_task(media):
+    """ Pliki i cache usuniętego filmu (zlecane przez sygnał post_delete) """
+    from .cleanup import cleanup_film_media
+    removed = cleanup_film_media(media)
+    logger.info(f"🗑️ Posprzątano po filmie {media['film_id']}: {', '.join(removed)}")
+    return removed
+
+
+@shared_task
+def sweep_orphaned_media_task():
+    """ Okresowe usuwanie plików, których nie używa żaden film (Celery beat) """
+    from .cleanup import sweep_orphaned_media
+    return len(sweep_orphaned_media())
+
+
+@shared_task
+def flush_video_progress_task():
+    """ Okresowy zrzut zbuforowanego postępu oglądania do bazy (Celery beat) """
+    saved = flush_progress()
+    if saved:
+        logger.info(f"💾 Zapisano postęp oglądania: {saved} wpisów")
+    return saved
+
+
+def format_eta(seconds):
+    """ Formatuje pozostały czas jako HH:MM:SS """
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,72 @@
+from ..management.commands.benchmark_transcode import (
+    build_fixture_command, compare_results, conversion_mode, count_segments)
+from django.test import SimpleTestCase, TestCase
+from django.core.management import call_command
+from unittest import skipUnless
+import io
+import json
+import os
+import tempfile
+import shutil
+
+
+class FixtureTests(SimpleTestCase):
+    def test_fixture_uses_lavfi_sources(self):
+        command = build_fixture_command("out.mp4", 640, 360, 10, 25)
+        self.assertIn("testsrc2=size=640x360:rate=25:duration=10", command)
+        self.assertIn("sine=frequency=440:duration=10", command)
+        self.assertEqual(command[command.index("-c:v") + 1], "mpeg4")
+
+    def test_h264_fixture_for_remux_path(self):
+        command = build_fixture_command("out.mp4", 640, 360, 10, 25, codec="h264")
+        self.assertEqual(command[command.index("-c:v") + 1], "libx264")
+        self.assertEqual(command[command.index("-g") + 1], "25")
+
+
+class ResultTests(SimpleTestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+
+    def touch(self, *parts):
+        path = os.path.join(self.output_dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+    def test_counts_segments_in_every_rendition(self):
+        for rendition in ("720p", "360p"):
+            self.touch(rendition, "segment0.ts")
+            self.touch(rendition, "segment1.ts")
+            self.touch(rendition, "index.m3u8")
+        self.assertEqual(count_segments(self.output_dir), 4)
+        self.assertEqual(conversion_mode(self.output_dir), "ladder")
+
+    def test_detects_chunked_and_remux_output(self):
+        self.touch("360p", "c0000_segment0.ts")
+        self.assertEqual(conversion_mode(self.output_dir), "chunked")
+        self.touch("source", "segment0.ts")
+        self.assertEqual(conversion_mode(self.output_dir), "remux")
+
+    def test_compare_with_baseline(self):
+        baseline = {"results": [{"name": "a", "wall_time": 10.0, "encode_fps": 50.0}]}
+        results = [{"name": "a", "wall_time": 8.0, "encode_fps": 62.5},
+                   {"name": "b", "wall_time": 1.0, "encode_fps": 1.0}]
+        self.assertEqual(compare_results(results, baseline), [
+            {"name": "a", "wall_time_change": -20.0, "encode_fps_change": 25.0}])
+
+
+@skipUnless(shutil.which("ffmpeg") and shutil.which("ffprobe"), "wymaga ffmpeg i ffprobe")
+class BenchmarkCommandTests(TestCase):
+    def test_end_to_end_writes_results(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        output = os.path.join(output_dir, "results.json")
+        call_command("benchmark_transcode", "--resolutions", "320x240",
+                     "--durations", "2", "--in-process", "--output", output,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        with open(output) as f:
+            [result] = json.load(f)["results"]
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(result["mode"], "ladder")
+        self.assertGreater(result["segments"], 0)
+        self.assertGreater(result["cpu_time"], 0)
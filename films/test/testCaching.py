@@ -0,0 +1,136 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from asgiref.sync import async_to_sync
+from ..caching import aget_film_ratings, film_ratings_key, get_catalogue_page
+from ..models import Film, Ratings
+
+film_ratings = async_to_sync(aget_film_ratings)
+
+
+class FilmRatingsCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser", password="password")
+        self.other = User.objects.create_user(
+            username="other", password="password")
+        self.film = Film.objects.create(
+            name="test film", description="test description",
+            link="test.mp4", thumbnail='thumbnail.jpg')
+        self.second_film = Film.objects.create(
+            name="second film", description="test description",
+            link="test2.mp4", thumbnail='thumbnail.jpg')
+
+    def test_ratings_are_cached_per_film(self):
+        Ratings.objects.create(
+            user=self.user, film=self.film, rating=4, comments="good")
+        first = film_ratings(self.film.id)
+        second = film_ratings(self.second_film.id)
+        self.assertEqual(first['count'], 1)
+        self.assertEqual(first['average'], 4)
+        # the first film does not leak into the second film's entry
+        self.assertEqual(second['count'], 0)
+        self.assertIsNone(second['average'])
+
+    def test_single_cache_hit_without_queries(self):
+        film_ratings(self.film.id)
+        with self.assertNumQueries(0):
+            film_ratings(self.film.id)
+
+    def test_save_and_delete_invalidate(self):
+        film_ratings(self.film.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            rating = Ratings.objects.create(
+                user=self.user, film=self.film, rating=2, comments="meh")
+        self.assertIsNone(cache.get(film_ratings_key(self.film.id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            Ratings.objects.create(
+                user=self.other, film=self.film, rating=4, comments="ok")
+        self.assertEqual(film_ratings(self.film.id)['average'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rating.delete()
+        self.assertEqual(film_ratings(self.film.id)['count'], 1)
+
+    def test_viewer_context(self):
+        Ratings.objects.create(
+            user=self.user, film=self.film, rating=5, comments="great")
+        self.client.login(username="testuser", password="password")
+        response = self.client.get(reverse('watch', args=[self.film.id]))
+        self.assertEqual(response.context['rating_count'], 1)
+        self.assertContains(response, "great")
+
+
+@override_settings(CATALOGUE_PAGE_SIZE=2)
+class CataloguePageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.films = [Film.objects.create(
+            name=f"film {i}", description="test description",
+            link=f"test{i}.mp4", thumbnail=f'thumbnails/{i}.jpg') for i in range(5)]
+
+    def test_keyset_pages_newest_first(self):
+        first = get_catalogue_page()
+        self.assertEqual([f['name'] for f in first['films']], ["film 4", "film 3"])
+        self.assertEqual(first['films'][0]['thumbnail_url'], "/media/thumbnails/4.jpg")
+        second = get_catalogue_page(first['next_cursor'])
+        self.assertEqual([f['name'] for f in second['films']], ["film 2", "film 1"])
+        last = get_catalogue_page(second['next_cursor'])
+        self.assertEqual([f['name'] for f in last['films']], ["film 0"])
+        self.assertIsNone(last['next_cursor'])
+
+    def test_pages_are_cached(self):
+        cursor = get_catalogue_page()['next_cursor']
+        get_catalogue_page(cursor)
+        with self.assertNumQueries(0):
+            get_catalogue_page()
+            get_catalogue_page(cursor)
+
+    def test_new_film_invalidates_only_first_page(self):
+        cursor = get_catalogue_page()['next_cursor']
+        get_catalogue_page(cursor)
+        with self.captureOnCommitCallbacks(execute=True):
+            Film.objects.create(name="new", description="d",
+                                link="new.mp4", thumbnail='thumbnails/new.jpg')
+        with self.assertNumQueries(0):
+            get_catalogue_page(cursor)
+        self.assertEqual(get_catalogue_page()['films'][0]['name'], "new")
+
+    def test_deleted_film_invalidates_all_pages(self):
+        cursor = get_catalogue_page()['next_cursor']
+        get_catalogue_page(cursor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.films[2].delete()
+        self.assertEqual([f['name'] for f in get_catalogue_page(cursor)['films']],
+                         ["film 1", "film 0"])
+
+    def test_only_tile_fields_invalidate_catalogue(self):
+        get_catalogue_page()
+        film = self.films[4]
+        film.hls_playlist = 'videos/hls/4/master.m3u8'
+        with self.captureOnCommitCallbacks(execute=True):
+            film.save(update_fields=['hls_playlist'])
+        with self.assertNumQueries(0):
+            get_catalogue_page()
+
+        film.has_previews = True
+        with self.captureOnCommitCallbacks(execute=True):
+            film.save(update_fields=['has_previews'])
+        with self.assertNumQueries(1):
+            get_catalogue_page()
+
+    def test_catalogue_api(self):
+        response = self.client.get(reverse('film_catalogue'))
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        response = self.client.get(reverse('film_catalogue'), {'cursor': data['next_cursor']})
+        self.assertEqual(response.json()['results'][0]['name'], "film 2")
+        self.assertEqual(self.client.get(
+            reverse('film_catalogue'), {'cursor': 'x'}).status_code, 400)
+
+    def test_start_page_links_next_page(self):
+        response = self.client.get(reverse('start'))
+        self.assertEqual(len(response.context['all']), 2)
+        self.assertContains(response, f"?cursor={response.context['next_cursor']}")
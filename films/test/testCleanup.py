@@ -0,0 +1,104 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from unittest.mock import patch
+from ..cleanup import cleanup_film_media, film_media, sweep_orphaned_media
+from ..models import Film, VideoUpload
+import io
+import os
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASH = "a" * 64
+
+
+def write(*parts):
+    path = os.path.join(MEDIA_ROOT, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    return path
+
+
+def exists(*parts):
+    return os.path.exists(os.path.join(MEDIA_ROOT, *parts))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FilmCleanupTest(TestCase):
+    def setUp(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+
+    def film(self, name, **fields):
+        write("videos", "before", f"{name}.mp4")
+        write("thumbnails", f"{name}.jpg")
+        return Film.objects.create(
+            name=name, description="opis", link=f"videos/before/{name}.mp4",
+            thumbnail=f"thumbnails/{name}.jpg", **fields)
+
+    @patch("films.signals.cleanup_film_media_task.delay")
+    def test_delete_enqueues_cleanup_for_every_film(self, mock_delay):
+        first, second = self.film("first"), self.film("second", content_hash=HASH)
+        with self.captureOnCommitCallbacks(execute=True):
+            Film.objects.all().delete()
+        self.assertEqual(sorted(call.args[0]["hls_key"] for call in mock_delay.call_args_list),
+                         sorted([str(first.id), HASH]))
+        # Usunięcie wiersza nie czeka na pliki
+        self.assertTrue(exists("videos", "before", "first.mp4"))
+
+    def test_cleanup_removes_files_and_keeps_shared_hls(self):
+        first = self.film("first", content_hash=HASH)
+        second = self.film("second", content_hash=HASH)
+        write("videos", "hls", HASH, "360p", "segment0.ts")
+        write("videos", "previews", str(first.id), "sprite.vtt")
+
+        media = film_media(first)
+        first.delete()
+        cleanup_film_media(media)
+        self.assertFalse(exists("videos", "before", "first.mp4"))
+        self.assertFalse(exists("thumbnails", "first.jpg"))
+        self.assertFalse(exists("videos", "previews", str(first.id)))
+        self.assertTrue(exists("videos", "hls", HASH, "360p", "segment0.ts"))
+
+        media = film_media(second)
+        second.delete()
+        cleanup_film_media(media)
+        self.assertFalse(exists("videos", "hls", HASH))
+
+    def test_sweeper_removes_only_old_orphans(self):
+        film = self.film("kept", content_hash=HASH)
+        write("videos", "hls", HASH, "master.m3u8")
+        write("videos", "hls", "gone", "master.m3u8")
+        write("videos", "previews", "999", "sprite.vtt")
+        write("videos", "before", "orphan.mp4")
+        write("videos", "uploads", "stale.part")
+        upload_part = write("videos", "uploads", f"{self.upload().id}.part")
+
+        # Świeże pliki mogą należeć do filmu, którego transakcja jeszcze trwa
+        self.assertEqual(sweep_orphaned_media(), [])
+        orphans = sweep_orphaned_media(dry_run=True, min_age=0)
+        self.assertEqual(len(orphans), 4)
+        self.assertTrue(exists("videos", "before", "orphan.mp4"))
+
+        sweep_orphaned_media(min_age=0)
+        self.assertFalse(exists("videos", "hls", "gone", "master.m3u8"))
+        self.assertFalse(exists("videos", "previews", "999", "sprite.vtt"))
+        self.assertFalse(exists("videos", "before", "orphan.mp4"))
+        self.assertFalse(exists("videos", "uploads", "stale.part"))
+        self.assertTrue(exists("videos", "hls", HASH, "master.m3u8"))
+        self.assertTrue(exists(film.link.name))
+        self.assertTrue(exists(film.thumbnail.name))
+        self.assertTrue(os.path.exists(upload_part))
+
+    def test_command(self):
+        write("videos", "before", "orphan.mp4")
+        out = io.StringIO()
+        call_command("sweep_media", "--min-age", "0", stdout=out)
+        self.assertIn("Usunięto: 1 plików", out.getvalue())
+
+    def upload(self):
+        user = User.objects.create_user(username="admin", password="password")
+        return VideoUpload.objects.create(
+            user=user, name="film", description="opis", filename="film.mp4", size=10)
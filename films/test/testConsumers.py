@@ -0,0 +1,64 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from ..consumers import progress_group_name
+from ..routing import websocket_urlpatterns
+from ..tasks import ProgressPublisher
+
+IN_MEMORY_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class FilmProgressConsumerTest(TransactionTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', password='adminpassword')
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), '/ws/film_progress/7/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def test_admin_receives_group_events(self):
+        async def scenario():
+            communicator, connected = await self._connect(self.admin)
+            self.assertTrue(connected)
+            await get_channel_layer().group_send(
+                progress_group_name(7),
+                {'type': 'film.progress', 'data': {'stage': 'encoding', 'percent': 50.0}})
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['percent'], 50.0)
+            await communicator.disconnect()
+        async_to_sync(scenario)()
+
+    def test_non_admin_is_rejected(self):
+        async def scenario():
+            communicator, connected = await self._connect(self.user)
+            self.assertFalse(connected)
+        async_to_sync(scenario)()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ProgressPublisherTest(TransactionTestCase):
+    def test_throttles_events_within_stage(self):
+        publisher = ProgressPublisher(3, interval=60)
+        layer = publisher.channel_layer
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(progress_group_name(3), channel)
+
+        publisher.publish("encoding", {"percent": 1.0})
+        publisher.publish("encoding", {"percent": 2.0})  # throttled
+        publisher.publish("done", {"percent": 100.0}, force=True)
+
+        first = async_to_sync(layer.receive)(channel)
+        second = async_to_sync(layer.receive)(channel)
+        self.assertEqual(first["data"]["percent"], 1.0)
+        self.assertEqual(second["data"]["stage"], "done")
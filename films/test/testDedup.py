@@ -0,0 +1,119 @@
+from ..models import Film, TranscodeJob
+from ..tasks import (acquire_conversion_lock, convert_to_hls_task,
+                     release_conversion_lock)
+from ..uploads import file_sha256
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+import hashlib
+import subprocess
+import os
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASH = hashlib.sha256(b"video").hexdigest()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentHashTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @patch('films.views.transcode_admission_open', return_value=True)
+    @patch('films.views.enqueue_film_processing')
+    def test_upload_is_hashed_while_saved(self, mock_enqueue, mock_open):
+        mock_enqueue.return_value.id = 'task-id'
+        User.objects.create_superuser(username='admin', password='adminpassword')
+        client = Client()
+        client.login(username='admin', password='adminpassword')
+        client.post(reverse('add_video'), {
+            'video_name': 'Test Video',
+            'video_description': 'Test Description',
+            'link': SimpleUploadedFile("video.mp4", b"video", content_type="video/mp4"),
+            'thumbnail': SimpleUploadedFile("thumb.jpg", b"img", content_type="image/jpeg"),
+        })
+        self.assertEqual(Film.objects.get().content_hash, HASH)
+
+    def test_file_sha256(self):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        path = os.path.join(MEDIA_ROOT, "source.mp4")
+        with open(path, "wb") as f:
+            f.write(b"video")
+        self.assertEqual(file_sha256(path), HASH)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DeduplicatedConversionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        os.makedirs(os.path.join(MEDIA_ROOT, "videos"), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, "videos", "source.mp4"), "wb") as f:
+            f.write(b"video")
+
+    def film(self, **fields):
+        return Film.objects.create(
+            name='Film', description='Opis', link='videos/source.mp4',
+            thumbnail='thumbnails/film.jpg', content_hash=HASH, **fields)
+
+    @patch('films.tasks.probe_source')
+    def test_identical_source_reuses_hls(self, mock_probe):
+        original = self.film(hls_playlist=f"/media/videos/hls/{HASH}/master.m3u8")
+        duplicate = self.film()
+        result = convert_to_hls_task(duplicate.id)
+        self.assertEqual(result, original.hls_playlist)
+        mock_probe.assert_not_called()
+
+    @patch('films.tasks.probe_source')
+    def test_locked_source_is_skipped(self, mock_probe):
+        film = self.film()
+        self.assertTrue(acquire_conversion_lock(HASH, 0))
+        self.assertIsNone(convert_to_hls_task(film.id))
+        mock_probe.assert_not_called()
+        release_conversion_lock(HASH)
+
+    @patch('films.tasks.run_ffmpeg')
+    @patch('films.tasks.probe_source', return_value={
+        'duration': 5.0, 'width': 640, 'height': 360, 'has_audio': False,
+        'video_codec': 'mpeg4', 'pix_fmt': 'yuv420p', 'audio_codec': None})
+    def test_waiting_duplicates_get_playlist_and_lock_is_released(self, mock_probe, mock_ffmpeg):
+        first, waiting = self.film(), self.film()
+        result = convert_to_hls_task(first.id)
+        self.assertEqual(result, f"/media/videos/hls/{HASH}/master.m3u8")
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.hls_playlist, result)
+        self.assertTrue(acquire_conversion_lock(HASH, first.id))
+
+    @patch('films.tasks.enqueue_conversion')
+    @patch('films.tasks.run_ffmpeg', side_effect=subprocess.CalledProcessError(1, ['ffmpeg']))
+    @patch('films.tasks.probe_source', return_value={
+        'duration': 5.0, 'width': 640, 'height': 360, 'has_audio': False,
+        'video_codec': 'mpeg4', 'pix_fmt': 'yuv420p', 'audio_codec': None})
+    def test_failed_conversion_requeues_skipped_duplicates(
+            self, mock_probe, mock_ffmpeg, mock_enqueue):
+        first, skipped, failed = self.film(), self.film(), self.film()
+        TranscodeJob.objects.create(film=skipped, status=TranscodeJob.STATUS_SKIPPED,
+                                    stage="locked")
+        TranscodeJob.objects.create(film=failed, status=TranscodeJob.STATUS_FAILED)
+        # Ponowione zlecenie musi móc wziąć blokadę
+        locked = []
+        mock_enqueue.side_effect = lambda film: locked.append(
+            acquire_conversion_lock(HASH, film.id))
+        self.assertIsNone(convert_to_hls_task(first.id))
+        # Tylko film czekający na blokadę - ten po własnym błędzie już nie
+        self.assertEqual([call.args[0] for call in mock_enqueue.call_args_list], [skipped])
+        self.assertEqual(locked, [True])
+
+    def test_missing_hash_is_computed_from_file(self):
+        film = Film.objects.create(
+            name='Film', description='Opis', link='videos/source.mp4',
+            thumbnail='thumbnails/film.jpg')
+        with patch('films.tasks.convert_source', return_value="playlist"):
+            convert_to_hls_task(film.id)
+        film.refresh_from_db()
+        self.assertEqual(film.content_hash, HASH)
@@ -0,0 +1,211 @@
+from django.test import SimpleTestCase, override_settings
+import io
+from django.core.management import call_command
+from unittest.mock import patch
+import os
+from ..hls import (DEFAULT_HLS_RENDITIONS, MASTER_PLAYLIST_NAME,
+                   build_hls_command, build_remux_command, codecs_allow_remux,
+                   concat_playlists, get_encoder_profile, get_renditions,
+                   iter_progress, keyframes_allow_remux, plan_chunks,
+                   select_renditions)
+
+
+class SelectRenditionsTest(SimpleTestCase):
+    def test_skips_renditions_above_source(self):
+        selected = select_renditions(DEFAULT_HLS_RENDITIONS, 720)
+        self.assertEqual([r["name"] for r in selected],
+                         ["720p", "480p", "360p"])
+
+    def test_keeps_lowest_rendition_for_small_source(self):
+        selected = select_renditions(DEFAULT_HLS_RENDITIONS, 240)
+        self.assertEqual([r["name"] for r in selected], ["360p"])
+
+    def test_unknown_height_keeps_whole_ladder(self):
+        selected = select_renditions(DEFAULT_HLS_RENDITIONS, None)
+        self.assertEqual(len(selected), len(DEFAULT_HLS_RENDITIONS))
+
+    @override_settings(HLS_RENDITIONS=[DEFAULT_HLS_RENDITIONS[-1]])
+    def test_ladder_from_settings(self):
+        self.assertEqual(get_renditions(), [DEFAULT_HLS_RENDITIONS[-1]])
+
+
+class BuildHlsCommandTest(SimpleTestCase):
+    def test_single_pass_with_master_playlist(self):
+        renditions = DEFAULT_HLS_RENDITIONS[1:]
+        command = build_hls_command("in.mp4", "out", renditions)
+        # one input, one filter graph splitting video for every rendition
+        self.assertEqual(command.count("-i"), 1)
+        graph = command[command.index("-filter_complex") + 1]
+        self.assertIn("split=3", graph)
+        self.assertEqual(
+            command[command.index("-master_pl_name") + 1], MASTER_PLAYLIST_NAME)
+        self.assertEqual(
+            command[command.index("-var_stream_map") + 1],
+            "v:0,a:0,name:720p v:1,a:1,name:480p v:2,a:2,name:360p")
+
+    def test_every_rendition_is_8bit_420(self):
+        renditions = DEFAULT_HLS_RENDITIONS[1:]
+        command = build_hls_command("in.mp4", "out", renditions)
+        graph = command[command.index("-filter_complex") + 1].split(";")
+        for i, rendition in enumerate(renditions):
+            self.assertIn(
+                f"[v{i}]scale=-2:{rendition['height']},format=yuv420p[v{i}out]", graph)
+
+    def test_video_only_source(self):
+        command = build_hls_command(
+            "in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:], has_audio=False)
+        self.assertNotIn("0:a:0", command)
+        self.assertEqual(
+            command[command.index("-var_stream_map") + 1], "v:0,name:360p")
+
+
+class IterProgressTest(SimpleTestCase):
+    def test_percent_speed_and_eta(self):
+        output = io.StringIO(
+            "frame=250\nfps=50.00\nout_time_us=10000000\n"
+            "out_time=00:00:10.000000\nspeed=2.0x\nprogress=continue\n"
+            "frame=500\nfps=50.00\nout_time_us=N/A\nspeed=N/A\n"
+            "progress=continue\n"
+            "out_time_us=40000000\nspeed=2.0x\nprogress=end\n")
+        states = list(iter_progress(output, total_duration=40))
+        self.assertEqual(len(states), 3)
+        self.assertAlmostEqual(states[0]["percent"], 25.0)
+        self.assertAlmostEqual(states[0]["eta"], 15.0)
+        self.assertEqual(states[0]["fps"], 50.0)
+        # N/A values do not break the parser
+        self.assertIsNone(states[1]["percent"])
+        self.assertTrue(states[2]["done"])
+        self.assertEqual(states[2]["percent"], 100.0)
+
+    def test_without_duration(self):
+        output = io.StringIO("out_time_us=5000000\nspeed=1x\nprogress=continue\n")
+        state = next(iter_progress(output))
+        self.assertEqual(state["out_time"], 5.0)
+        self.assertIsNone(state["percent"])
+
+
+class PlanChunksTest(SimpleTestCase):
+    def test_cuts_on_keyframes_after_chunk_length(self):
+        keyframes = [0, 4, 8, 12, 16, 20, 24, 28, 32, 36]
+        self.assertEqual(plan_chunks(keyframes, 40, 10), [12, 24])
+
+    def test_no_short_tail_chunk(self):
+        # cutting at 24 would leave a 2 s tail
+        self.assertEqual(plan_chunks([0, 12, 24], 26, 10), [12])
+
+    def test_short_film_is_not_split(self):
+        self.assertEqual(plan_chunks([0, 2, 4], 6, 10), [])
+
+
+class ConcatPlaylistsTest(SimpleTestCase):
+    def test_joins_segments_in_order(self):
+        first = ("#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n"
+                 "#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:10.0,\nc0000_segment0.ts\n"
+                 "#EXT-X-ENDLIST\n")
+        second = ("#EXTM3U\n#EXT-X-TARGETDURATION:11\n#EXTINF:10.5,\n"
+                  "c0001_segment0.ts\n#EXTINF:2.0,\nc0001_segment1.ts\n"
+                  "#EXT-X-ENDLIST\n")
+        playlist = concat_playlists([first, second]).splitlines()
+        self.assertIn("#EXT-X-TARGETDURATION:11", playlist)
+        self.assertEqual(
+            [line for line in playlist if line.endswith(".ts")],
+            ["c0000_segment0.ts", "c0001_segment0.ts", "c0001_segment1.ts"])
+        self.assertEqual(playlist.count("#EXT-X-ENDLIST"), 1)
+        self.assertEqual(playlist[-1], "#EXT-X-ENDLIST")
+
+
+class RemuxDecisionTest(SimpleTestCase):
+    source = {"video_codec": "h264", "pix_fmt": "yuv420p",
+              "has_audio": True, "audio_codec": "aac"}
+
+    def test_h264_aac_can_be_remuxed(self):
+        self.assertTrue(codecs_allow_remux(self.source))
+
+    def test_other_codecs_need_encoding(self):
+        self.assertFalse(codecs_allow_remux({**self.source, "video_codec": "hevc"}))
+        self.assertFalse(codecs_allow_remux({**self.source, "audio_codec": "mp3"}))
+        self.assertFalse(codecs_allow_remux({**self.source, "pix_fmt": "yuv420p10le"}))
+
+    def test_video_only_source(self):
+        self.assertTrue(codecs_allow_remux(
+            {**self.source, "has_audio": False, "audio_codec": None}))
+
+    def test_keyframe_spacing(self):
+        self.assertTrue(keyframes_allow_remux([0, 4, 8, 12], 16, 10))
+        self.assertFalse(keyframes_allow_remux([0, 4, 20], 24, 10))
+        # the tail after the last keyframe counts as well
+        self.assertFalse(keyframes_allow_remux([0, 4, 8], 30, 10))
+        self.assertFalse(keyframes_allow_remux([], 30, 10))
+
+    def test_remux_command_copies_streams(self):
+        command = build_remux_command("in.mp4", "out")
+        self.assertEqual(command[command.index("-c") + 1], "copy")
+        self.assertNotIn("-filter_complex", command)
+
+
+class EncoderProfileTest(SimpleTestCase):
+    def test_default_profile_keeps_bitrate_ladder(self):
+        command = build_hls_command("in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:])
+        self.assertEqual(command[command.index("-c:v:0") + 1], "libx264")
+        self.assertEqual(command[command.index("-b:v:0") + 1], "800k")
+        self.assertEqual(command[command.index("-preset") + 1], "fast")
+        self.assertEqual(command[command.index("-hls_time") + 1], "10")
+
+    def test_crf_profile_caps_with_vbv(self):
+        command = build_hls_command(
+            "in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:],
+            profile=get_encoder_profile("quality"))
+        self.assertEqual(command[command.index("-crf:v:0") + 1], "20")
+        self.assertNotIn("-b:v:0", command)
+        self.assertEqual(command[command.index("-maxrate:v:0") + 1], "856k")
+
+    def test_hevc_profile_uses_fmp4_segments(self):
+        command = build_hls_command(
+            "in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:],
+            profile=get_encoder_profile("hevc"))
+        self.assertEqual(command[command.index("-c:v:0") + 1], "libx265")
+        self.assertEqual(command[command.index("-hls_segment_type") + 1], "fmp4")
+        self.assertTrue(command[command.index("-hls_segment_filename") + 1]
+                        .endswith("segment%d.m4s"))
+        self.assertEqual(command[command.index("-x265-params") + 1], "log-level=error")
+
+    def test_segment_time_sets_keyframe_interval(self):
+        command = build_hls_command(
+            "in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:],
+            profile=get_encoder_profile("fast"))
+        self.assertEqual(command[command.index("-hls_time") + 1], "4")
+        self.assertEqual(command[command.index("-force_key_frames") + 1],
+                         "expr:gte(t,n_forced*4)")
+
+    @override_settings(HLS_ENCODER_PROFILES={"tiny": {"preset": "ultrafast", "threads": 2}},
+                       HLS_DEFAULT_PROFILE="tiny")
+    def test_profiles_from_settings(self):
+        profile = get_encoder_profile("unknown")
+        self.assertEqual(profile["name"], "tiny")
+        self.assertEqual(profile["video_codec"], "libx264")
+        command = build_hls_command("in.mp4", "out", DEFAULT_HLS_RENDITIONS[-1:],
+                                    profile=profile)
+        self.assertEqual(command[command.index("-threads") + 1], "2")
+
+
+class BenchmarkProfilesCommandTest(SimpleTestCase):
+    def fake_ffmpeg(self, command, duration=None, on_progress=None):
+        playlist = command[-1].replace("%v", "360p")
+        os.makedirs(os.path.dirname(playlist), exist_ok=True)
+        with open(playlist.replace("index.m3u8", "segment0.ts"), "wb") as f:
+            f.write(b"x" * 12500)
+        on_progress({"fps": 50.0, "percent": 100.0})
+
+    @patch("films.management.commands.benchmark_profiles.run_ffmpeg")
+    @patch("films.management.commands.benchmark_profiles.probe_source",
+           return_value={"duration": 10.0, "width": 640, "height": 360,
+                         "has_audio": False})
+    def test_reports_fps_and_bitrate_per_profile(self, mock_probe, mock_ffmpeg):
+        mock_ffmpeg.side_effect = self.fake_ffmpeg
+        out = io.StringIO()
+        call_command("benchmark_profiles", __file__,
+                     "--profiles", "fast", "quality", stdout=out)
+        lines = out.getvalue().splitlines()[1:]
+        self.assertEqual([line.split()[0] for line in lines], ["fast", "quality"])
+        self.assertIn("50.0 fps", lines[0])
+        self.assertIn("360p 10 kb/s", lines[0])
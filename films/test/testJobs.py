@@ -0,0 +1,154 @@
+from ..hls import get_renditions
+from ..models import Film, TranscodeJob
+from ..tasks import (CHUNK_FAILED, ProgressPublisher, chunk_states, convert_to_hls_task,
+                     enqueue_conversion, split_and_dispatch, transcode_chunk_task)
+from celery import current_app
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.core.cache import cache
+from unittest.mock import patch
+import subprocess
+import os
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SOURCE = {'duration': 5.0, 'width': 640, 'height': 360, 'has_audio': False,
+          'video_codec': 'mpeg4', 'pix_fmt': 'yuv420p', 'audio_codec': None}
+H264_SOURCE = {**SOURCE, 'video_codec': 'h264'}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TranscodeJobTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        os.makedirs(os.path.join(MEDIA_ROOT, "videos"), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, "videos", "source.mp4"), "wb") as f:
+            f.write(b"video")
+        self.film = Film.objects.create(
+            name='Film', description='Opis', link='videos/source.mp4',
+            thumbnail='thumbnails/film.jpg')
+
+    @patch('films.tasks.convert_to_hls_task.apply_async')
+    def test_enqueue_creates_queued_job(self, mock_apply):
+        enqueue_conversion(self.film)
+        job = TranscodeJob.objects.get()
+        self.assertEqual(job.status, TranscodeJob.STATUS_QUEUED)
+        self.assertEqual(mock_apply.call_args.kwargs['task_id'], job.task_id)
+
+    @patch('films.tasks.run_ffmpeg')
+    @patch('films.tasks.probe_source', return_value=SOURCE)
+    def test_successful_conversion_records_metrics(self, mock_probe, mock_ffmpeg):
+        convert_to_hls_task(self.film.id)
+        job = TranscodeJob.objects.get(film=self.film)
+        self.assertEqual(job.status, TranscodeJob.STATUS_DONE)
+        self.assertEqual(job.stage, 'done')
+        self.assertEqual(job.input_size, len(b"video"))
+        self.assertEqual(job.source_duration, 5.0)
+        self.assertIsNotNone(job.started_at)
+        self.assertGreaterEqual(job.finished_at, job.started_at)
+        self.assertIsNotNone(job.speed)
+
+    @patch('films.tasks.run_ffmpeg', side_effect=subprocess.CalledProcessError(
+        1, ['ffmpeg'], stderr="Invalid data found"))
+    @patch('films.tasks.probe_source', return_value=SOURCE)
+    def test_failure_records_error(self, mock_probe, mock_ffmpeg):
+        self.assertIsNone(convert_to_hls_task(self.film.id))
+        job = TranscodeJob.objects.get(film=self.film)
+        self.assertEqual(job.status, TranscodeJob.STATUS_FAILED)
+        self.assertIn("Invalid data found", job.error)
+
+    @patch('films.tasks.run_ffmpeg')
+    @patch('films.tasks.probe_keyframes', return_value=[0.0, 2.0, 4.0])
+    @patch('films.tasks.probe_source', return_value=H264_SOURCE)
+    def test_h264_source_is_remuxed(self, mock_probe, mock_keyframes, mock_ffmpeg):
+        convert_to_hls_task(self.film.id)
+        self.assertIn("copy", mock_ffmpeg.call_args.args[0])
+
+    @patch('films.tasks.run_ffmpeg')
+    @patch('films.tasks.probe_keyframes', return_value=[0.0, 2.0, 4.0])
+    @patch('films.tasks.probe_source', return_value=H264_SOURCE)
+    def test_explicit_profile_is_never_remuxed(self, mock_probe, mock_keyframes, mock_ffmpeg):
+        Film.objects.filter(id=self.film.id).update(encoder_profile="quality")
+        convert_to_hls_task(self.film.id)
+        command = mock_ffmpeg.call_args.args[0]
+        self.assertNotIn("copy", command)
+        self.assertEqual(command[command.index("-crf:v:0") + 1], "20")
+        mock_keyframes.assert_not_called()
+
+    def test_add_video_lists_active_jobs(self):
+        TranscodeJob.objects.create(film=self.film, status=TranscodeJob.STATUS_RUNNING)
+        TranscodeJob.objects.create(film=self.film, status=TranscodeJob.STATUS_DONE)
+        User.objects.create_superuser(username='admin', password='adminpassword')
+        client = Client()
+        client.login(username='admin', password='adminpassword')
+        response = client.get(reverse('add_video'))
+        self.assertEqual(
+            [job.status for job in response.context['active_jobs']],
+            [TranscodeJob.STATUS_RUNNING])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkDispatchTests(TestCase):
+    CHUNKS = [("chunk0000.mp4", 0.0), ("chunk0001.mp4", 120.0)]
+
+    def setUp(self):
+        cache.clear()
+        self.film = Film.objects.create(
+            name='Film', description='Opis', link='videos/source.mp4',
+            thumbnail='thumbnails/film.jpg')
+        self.key = str(self.film.id)
+        for name, _ in self.CHUNKS:
+            path = os.path.join(MEDIA_ROOT, "videos", "hls", self.key, "chunks", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"chunk")
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = False
+        self.addCleanup(setattr, current_app.conf, "task_always_eager", always_eager)
+
+    @patch('films.tasks.finalize_chunks_task.apply_async')
+    @patch('films.tasks.transcode_chunk_task.apply_async')
+    @patch('films.tasks.read_chunk_list', return_value=CHUNKS)
+    @patch('films.tasks.run_ffmpeg')
+    def test_last_chunk_starts_finalize_without_result_backend(
+            self, mock_ffmpeg, mock_chunks, mock_chunk_async, mock_finalize):
+        renditions = get_renditions()[-1:]
+        split_and_dispatch(self.film, "source.mp4", renditions, {"has_audio": False},
+                           [120.0], ProgressPublisher(self.film.id))
+        self.assertEqual(mock_chunk_async.call_count, 2)
+
+        # Zadania części wykonane tak, jak zrobiłby to worker
+        mock_ffmpeg.side_effect = [None, subprocess.CalledProcessError(1, ['ffmpeg'])]
+        calls = mock_chunk_async.call_args_list
+        transcode_chunk_task(*calls[0].args[0])
+        mock_finalize.assert_not_called()
+        transcode_chunk_task(*calls[1].args[0])
+        mock_finalize.assert_called_once()
+        self.assertEqual(mock_finalize.call_args.args[0],
+                         (self.film.id, 2, [renditions[0]["name"]], self.key, None))
+        self.assertEqual(list(chunk_states(self.film.id, 2).values()).count(CHUNK_FAILED), 1)
+
+    @patch('films.tasks.finalize_chunks_task.apply_async')
+    @patch('films.tasks.transcode_chunk_task.apply_async')
+    @patch('films.tasks.read_chunk_list', return_value=CHUNKS)
+    @patch('films.tasks.run_ffmpeg')
+    def test_redelivered_chunk_is_counted_once(
+            self, mock_ffmpeg, mock_chunks, mock_chunk_async, mock_finalize):
+        split_and_dispatch(self.film, "source.mp4", get_renditions()[-1:],
+                           {"has_audio": False}, [120.0], ProgressPublisher(self.film.id))
+        first, second = (call.args[0] for call in mock_chunk_async.call_args_list)
+
+        # acks_late: worker zginął po zakodowaniu, broker oddał część jeszcze raz
+        transcode_chunk_task(*first)
+        transcode_chunk_task(*first)
+        mock_finalize.assert_not_called()
+        transcode_chunk_task(*second)
+        transcode_chunk_task(*second)
+        mock_finalize.assert_called_once()
@@ -0,0 +1,92 @@
+from ..management.commands.loadtest import (
+    Stats, percentile, queries_from_server_timing)
+from ..management.commands.seed_loadtest import DEFAULT_PASSWORD, user_email
+from ..models import Film, Ratings, VideoProgress
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase
+from django.urls import reverse
+import io
+import json
+import os
+import shutil
+import tempfile
+
+
+class ServerTimingMiddlewareTest(TestCase):
+    def test_reports_query_count_and_duration(self):
+        Film.objects.create(name="film", description="opis")
+        response = self.client.get(reverse("film_catalogue"))
+        header = response["Server-Timing"]
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="\d+ queries", '
+                                 r'cache;dur=[\d.]+;desc="\d+ hits, \d+ misses", '
+                                 r'total;dur=[\d.]+$')
+        self.assertGreaterEqual(queries_from_server_timing(header), 1)
+
+
+class SeedLoadtestCommandTest(TestCase):
+    def test_creates_films_users_ratings_and_progress(self):
+        call_command("seed_loadtest", "--films", "5", "--users", "4",
+                     "--ratings", "0.5", "--progress", "2", stdout=io.StringIO())
+        self.assertEqual(Film.objects.filter(description="loadtest").count(), 5)
+        self.assertEqual(User.objects.filter(username__startswith="loadtest_").count(), 4)
+        self.assertEqual(Ratings.objects.count(), 2)
+        self.assertEqual(VideoProgress.objects.count(), 8)
+        self.assertTrue(User.objects.get(email=user_email(0)).check_password(DEFAULT_PASSWORD))
+
+    def test_reseeding_replaces_only_seeded_objects(self):
+        Film.objects.create(name="loadtest własny", description="prawdziwy film")
+        call_command("seed_loadtest", "--films", "3", "--users", "2", stdout=io.StringIO())
+        call_command("seed_loadtest", "--films", "2", "--users", "1", stdout=io.StringIO())
+        self.assertEqual(Film.objects.filter(description="loadtest").count(), 2)
+        self.assertEqual(User.objects.filter(username__startswith="loadtest_").count(), 1)
+        self.assertTrue(Film.objects.filter(description="prawdziwy film").exists())
+
+
+class StatsTest(SimpleTestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_parses_server_timing(self):
+        self.assertEqual(queries_from_server_timing(
+            'db;dur=1.5;desc="12 queries", total;dur=9.0'), 12)
+        self.assertIsNone(queries_from_server_timing(None))
+
+    def test_summary_per_endpoint(self):
+        stats = Stats()
+        stats.record("watch", 0.010, True, 4)
+        stats.record("watch", 0.030, False, 6)
+        stats.record("progress", 0.002, True)
+        rows = {row["endpoint"]: row for row in stats.summary(elapsed=2.0)}
+        self.assertEqual(rows["watch"]["requests"], 2)
+        self.assertEqual(rows["watch"]["errors"], 1)
+        self.assertEqual(rows["watch"]["rps"], 1.0)
+        self.assertEqual(rows["watch"]["p99_ms"], 30.0)
+        self.assertEqual(rows["watch"]["queries_avg"], 5.0)
+        self.assertIsNone(rows["progress"]["queries_avg"])
+
+
+class LoadtestCommandTest(LiveServerTestCase):
+    def test_short_run_against_live_server(self):
+        call_command("seed_loadtest", "--films", "3", "--users", "2", stdout=io.StringIO())
+        # testView usuwa katalog tymczasowy
+        os.makedirs(tempfile.gettempdir(), exist_ok=True)
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        output = os.path.join(output_dir, "loadtest.json")
+        # Jeden widz - serwer testowy dzieli jedno połączenie z bazą między wątki
+        call_command("loadtest", "--base-url", self.live_server_url, "--users", "1",
+                     "--duration", "1", "--heartbeats", "2", "--rate-probability", "1",
+                     "--json", output, stdout=io.StringIO())
+        with open(output) as f:
+            rows = {row["endpoint"]: row for row in json.load(f)["endpoints"]}
+        for endpoint in ("catalogue", "watch", "progress", "rate"):
+            self.assertGreater(rows[endpoint]["requests"], 0)
+            self.assertEqual(rows[endpoint]["errors"], 0)
+        self.assertIsNotNone(rows["watch"]["queries_avg"])
+        self.assertTrue(Ratings.objects.filter(comments="loadtest").exists())
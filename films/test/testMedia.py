@@ -0,0 +1,97 @@
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.http import http_date
+from ..media import serve_media
+import os
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServeMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, "videos", "hls", "1", "360p"), exist_ok=True)
+        os.makedirs(os.path.join(MEDIA_ROOT, "videos", "uploads"), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, "videos", "hls", "1", "360p", "segment0.ts"), "wb") as f:
+            f.write(bytes(range(100)))
+        with open(os.path.join(MEDIA_ROOT, "videos", "hls", "1", "master.m3u8"), "w") as f:
+            f.write("#EXTM3U\n")
+        with open(os.path.join(MEDIA_ROOT, "videos", "uploads", "x.part"), "wb") as f:
+            f.write(b"secret")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    segment_url = "/media/videos/hls/1/360p/segment0.ts"
+
+    def test_full_segment_is_immutable(self):
+        response = self.client.get(self.segment_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response["Content-Type"], "video/mp2t")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_playlist_has_short_ttl(self):
+        response = self.client.get("/media/videos/hls/1/master.m3u8")
+        self.assertEqual(response["Cache-Control"], "public, max-age=5")
+        self.assertEqual(response["Content-Type"], "application/vnd.apple.mpegurl")
+
+    def test_byte_range(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+
+    def test_suffix_range(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(95, 100)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE="bytes=200-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_stale_if_range_returns_full_file(self):
+        response = self.client.get(
+            self.segment_url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.segment_url)["ETag"]
+        response = self.client.get(self.segment_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.segment_url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_traversal_and_private_files(self):
+        self.assertEqual(self.client.get("/media/videos/nope.ts").status_code, 404)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/videos/uploads/x.part").status_code, 404)
+
+    def test_private_files_after_normalization(self):
+        for path in ("videos//uploads/x.part", "videos/./uploads/x.part",
+                     "./videos/uploads/x.part", "videos/hls/../uploads/x.part"):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                serve_media(RequestFactory().get("/media/" + path), path)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT="/protected-media/")
+    def test_accel_redirect_offload(self):
+        response = self.client.get(self.segment_url)
+        self.assertEqual(response["X-Accel-Redirect"],
+                         "/protected-media/videos/hls/1/360p/segment0.ts")
+        self.assertEqual(response.content, b"")
+
+    @override_settings(MEDIA_ACCEL_REDIRECT="/protected-media/")
+    def test_accel_redirect_uses_normalized_path(self):
+        path = "videos/./hls/1//360p/segment0.ts"
+        response = serve_media(RequestFactory().get("/media/" + path), path)
+        self.assertEqual(response["X-Accel-Redirect"],
+                         "/protected-media/videos/hls/1/360p/segment0.ts")
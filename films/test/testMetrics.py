@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.urls import reverse
+from ..middleware import (RequestMetrics, RequestStats, _current,
+                          instrument_cache, metrics)
+from ..management.commands.loadtest import queries_from_server_timing
+from ..models import Film
+
+
+class CacheInstrumentationTest(SimpleTestCase):
+    def setUp(self):
+        instrument_cache(caches["default"])
+        self.addCleanup(cache.delete_many, ["a", "b", "missing", "none", "counter"])
+        self.stats = RequestStats()
+        self.token = _current.set(self.stats)
+        self.addCleanup(_current.reset, self.token)
+
+    def test_counts_hits_and_misses(self):
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("missing", "default"), "default")
+        self.assertEqual(cache.get_many(["a", "b"]), {"a": 1})
+        self.assertEqual(self.stats.cache.hits, 2)
+        self.assertEqual(self.stats.cache.misses, 2)
+        self.assertEqual(self.stats.cache.calls, 4)
+
+    def test_cached_none_is_a_hit(self):
+        cache.set("none", None)
+        self.assertIsNone(cache.get("none"))
+        self.assertEqual(self.stats.cache.hits, 1)
+
+    def test_nested_calls_counted_once(self):
+        cache.set("counter", 1)
+        cache.incr("counter")
+        self.assertEqual(self.stats.cache.calls, 2)
+        self.assertEqual(self.stats.cache.hits, 0)
+
+
+class RequestMetricsTest(SimpleTestCase):
+    def test_renders_prometheus_text(self):
+        registry = RequestMetrics(buckets=(0.1, 1.0))
+        stats = RequestStats()
+        stats.db.count = 3
+        stats.cache.hits = 2
+        registry.observe("watch", "GET", 200, 0.5, stats)
+        registry.observe("watch", "GET", 200, 0.05, stats)
+        text = registry.render()
+        self.assertIn('http_requests_total{view="watch",method="GET",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="watch",le="0.1"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="watch",le="1.0"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="watch",le="+Inf"} 2', text)
+        self.assertIn('db_queries_total{view="watch"} 6', text)
+        self.assertIn('cache_hits_total{view="watch"} 4', text)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+
+
+class MiddlewareTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.film = Film.objects.create(name="film", description="opis")
+
+    def test_requests_are_aggregated_per_view(self):
+        self.client.get(reverse("film_catalogue"))
+        self.client.get(reverse("film_catalogue"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'http_requests_total{view="film_catalogue",method="GET",status="200"} 2',
+            response.content.decode())
+
+    @override_settings(METRICS_ALLOWED_IPS=())
+    def test_metrics_require_allowed_ip_or_staff(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        User.objects.create_user(username="admin", password="password", is_staff=True)
+        self.client.login(username="admin", password="password")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    async def test_async_view_queries_are_counted(self):
+        user = await User.objects.acreate_user(username="viewer", password="password")
+        await sync_to_async(self.client.force_login)(user)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse("watch", args=[self.film.id]))
+        self.assertEqual(response.status_code, 200)
+        # Zapytania z wątków sync_to_async też trafiają do nagłówka
+        self.assertGreaterEqual(queries_from_server_timing(response["Server-Timing"]), 1)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_logs_sql(self):
+        with self.assertLogs("films.middleware", level="WARNING") as logs:
+            self.client.get(reverse("film_progress", args=[self.film.id]))
+        self.assertIn(f"Wolne żądanie GET /film_progress/{self.film.id}/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
@@ -0,0 +1,99 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.cache import cache
+from PIL import Image
+from unittest.mock import patch
+from ..caching import get_catalogue_page
+from ..models import Film
+from ..tasks import generate_previews_task
+from ..previews import (build_sprite_vtt, make_thumbnail_variants, poster_url,
+                        sprite_layout, thumbnail_formats, thumbnail_srcsets)
+import os
+import tempfile
+import shutil
+
+
+class SpriteLayoutTest(SimpleTestCase):
+    def test_evenly_spaced_frames(self):
+        layout = sprite_layout(600, 1920, 1080, frames=100)
+        self.assertEqual(layout['interval'], 6)
+        self.assertEqual(layout['count'], 100)
+        self.assertEqual((layout['tile_width'], layout['tile_height']), (160, 90))
+
+    def test_short_video_one_frame_per_second(self):
+        layout = sprite_layout(12, 1280, 720, frames=100)
+        self.assertEqual(layout['interval'], 1)
+        self.assertEqual(layout['count'], 12)
+
+    def test_vtt_points_into_sheets(self):
+        layout = sprite_layout(250, 1280, 720, frames=250)
+        vtt = build_sprite_vtt(250, layout).splitlines()
+        self.assertEqual(vtt[0], "WEBVTT")
+        self.assertIn("00:00:11.000 --> 00:00:12.000", vtt)
+        self.assertIn("sprite_000.jpg#xywh=160,90,160,90", vtt)
+        # cue 100 opens the second sheet
+        self.assertIn("sprite_001.jpg#xywh=0,0,160,90", vtt)
+
+
+@override_settings(THUMBNAIL_WIDTHS=[100, 400], MEDIA_URL='/media/')
+class ThumbnailVariantsTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_variants_in_every_width_and_format(self):
+        source = os.path.join(self.directory, "thumb.png")
+        Image.new("RGBA", (500, 250), "red").save(source)
+        variants = make_thumbnail_variants(source, self.directory)
+        self.assertEqual(variants, {image_format: [100, 400]
+                                    for image_format in thumbnail_formats()})
+        with Image.open(os.path.join(self.directory, "thumb_100.webp")) as image:
+            self.assertEqual(image.size, (100, 50))
+
+    def test_narrow_source_is_saved_at_its_own_width(self):
+        source = os.path.join(self.directory, "thumb.png")
+        Image.new("RGBA", (300, 200), "red").save(source)
+        variants = make_thumbnail_variants(source, self.directory)
+        # smaller sources are not upscaled and the name carries the real width
+        self.assertEqual(variants['webp'], [100, 300])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "thumb_400.webp")))
+        with Image.open(os.path.join(self.directory, "thumb_300.webp")) as image:
+            self.assertEqual(image.size, (300, 200))
+
+    def test_srcset_lists_only_saved_variants(self):
+        # the web node may have AVIF support the worker lacked
+        srcsets = thumbnail_srcsets(7, {'webp': [100, 300]})
+        self.assertEqual(srcsets, {'webp': "/media/videos/previews/7/thumb_100.webp 100w, "
+                                           "/media/videos/previews/7/thumb_300.webp 300w"})
+        self.assertEqual(poster_url(7, {'webp': [100, 300]}),
+                         "/media/videos/previews/7/thumb_300.webp")
+        self.assertIsNone(poster_url(7, {}))
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(THUMBNAIL_WIDTHS=[100, 400], MEDIA_ROOT=MEDIA_ROOT, MEDIA_URL='/media/')
+class PreviewsTaskTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @patch('films.tasks.probe_source', return_value={'duration': 0, 'width': 0, 'height': 0})
+    def test_catalogue_srcset_follows_saved_variants(self, mock_probe):
+        cache.clear()
+        os.makedirs(os.path.join(MEDIA_ROOT, "thumbnails"), exist_ok=True)
+        os.makedirs(os.path.join(MEDIA_ROOT, "videos"), exist_ok=True)
+        Image.new("RGB", (300, 200), "red").save(os.path.join(MEDIA_ROOT, "thumbnails", "t.png"))
+        open(os.path.join(MEDIA_ROOT, "videos", "v.mp4"), "wb").close()
+        film = Film.objects.create(name="Film", description="Opis",
+                                   link="videos/v.mp4", thumbnail="thumbnails/t.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(generate_previews_task(film.id))
+        film.refresh_from_db()
+        self.assertEqual(film.thumbnail_variants['webp'], [100, 300])
+        srcsets = get_catalogue_page()['films'][0]['srcsets']
+        self.assertEqual(set(srcsets), set(film.thumbnail_variants))
+        self.assertTrue(srcsets['webp'].endswith("thumb_300.webp 300w"))
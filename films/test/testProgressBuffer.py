@@ -0,0 +1,165 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django_redis import get_redis_connection
+from ..models import Film, VideoProgress
+from ..progress_buffer import (PENDING_KEY, abuffer_progress, aget_progress,
+                               continue_watching, continue_watching_keys,
+                               flush_progress)
+import json
+
+# Widoki wołają wersje asynchroniczne - testy synchroniczne przez async_to_sync
+buffer = async_to_sync(abuffer_progress)
+position = async_to_sync(aget_progress)
+
+
+class ProgressBufferTest(TestCase):
+    def setUp(self):
+        get_redis_connection("default").delete(PENDING_KEY)
+        self.user = User.objects.create_user(
+            username="testuser", password="password")
+        self.film = Film.objects.create(
+            name="test film",
+            description="test description",
+            link="test.mp4",
+            thumbnail='thumbnail.jpg'
+        )
+
+    def test_latest_position_wins_and_is_flushed(self):
+        buffer(self.user.id, self.film.id, 10.0)
+        buffer(self.user.id, self.film.id, 42.5)
+        # nothing hits the database until the flush
+        self.assertFalse(VideoProgress.objects.exists())
+        self.assertEqual(position(self.user.id, self.film.id), 42.5)
+
+        self.assertEqual(flush_progress(), 1)
+        self.assertEqual(VideoProgress.objects.get(
+            user=self.user, film=self.film).last_watched, 42.5)
+        self.assertEqual(flush_progress(), 0)
+
+    def test_flush_updates_existing_rows(self):
+        VideoProgress.objects.create(
+            user=self.user, film=self.film, last_watched=5)
+        buffer(self.user.id, self.film.id, 99.0)
+        flush_progress()
+        self.assertEqual(VideoProgress.objects.count(), 1)
+        self.assertEqual(VideoProgress.objects.get().last_watched, 99.0)
+
+    def test_flush_skips_deleted_films(self):
+        buffer(self.user.id, self.film.id + 1000, 10.0)
+        buffer(self.user.id, self.film.id, 20.0)
+        self.assertEqual(flush_progress(), 1)
+
+    def test_progress_view_buffers_position(self):
+        self.client.login(username="testuser", password="password")
+        self.client.get(reverse('watch', args=[self.film.id]))
+        response = self.client.post(
+            reverse('progress'), json.dumps({'currentTime': 12.5}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(VideoProgress.objects.exists())
+        flush_progress()
+        self.assertEqual(VideoProgress.objects.get().last_watched, 12.5)
+
+    async def test_async_progress_view_buffers_position(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+        await self.async_client.get(reverse('watch', args=[self.film.id]))
+        response = await self.async_client.post(
+            reverse('progress'), {'currentTime': 30.0},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # async i sync klient piszą do tego samego bufora
+        self.assertEqual(await aget_progress(self.user.id, self.film.id), 30.0)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    async def test_async_buffer_without_redis_writes_to_database(self):
+        await abuffer_progress(self.user.id, self.film.id, 7.5)
+        progress = await VideoProgress.objects.aget(user=self.user, film=self.film)
+        self.assertEqual(progress.last_watched, 7.5)
+
+
+class ContinueWatchingTest(TestCase):
+    def setUp(self):
+        conn = get_redis_connection("default")
+        conn.delete(PENDING_KEY)
+        self.user = User.objects.create_user(
+            username="testuser", password="password")
+        conn.delete(*continue_watching_keys(self.user.id))
+        self.films = [Film.objects.create(
+            name=f"film {i}", description="test description",
+            link="test.mp4", thumbnail='thumbnail.jpg') for i in range(3)]
+        self.client.login(username="testuser", password="password")
+
+    def watch(self, film, position):
+        self.client.get(reverse('watch', args=[film.id]))
+        self.client.post(reverse('progress'), json.dumps({'currentTime': position}),
+                         content_type='application/json')
+
+    def test_most_recent_first_without_queries(self):
+        self.watch(self.films[0], 10.0)
+        self.watch(self.films[1], 20.0)
+        self.watch(self.films[0], 15.0)
+        with self.assertNumQueries(0):
+            row = continue_watching(self.user.id)
+        self.assertEqual([entry['id'] for entry in row],
+                         [self.films[0].id, self.films[1].id])
+        self.assertEqual(row[0]['position'], 15.0)
+        self.assertEqual(row[0]['name'], "film 0")
+
+    def test_row_is_trimmed(self):
+        with self.settings(CONTINUE_WATCHING_SIZE=2):
+            for film in self.films:
+                self.watch(film, 5.0)
+            self.assertEqual([entry['id'] for entry in continue_watching(self.user.id)],
+                             [self.films[2].id, self.films[1].id])
+
+    def test_rebuilt_from_database_when_redis_is_empty(self):
+        VideoProgress.objects.create(user=self.user, film=self.films[1], last_watched=30)
+        VideoProgress.objects.create(user=self.user, film=self.films[2], last_watched=40)
+        with self.assertNumQueries(1):
+            row = continue_watching(self.user.id)
+        self.assertEqual([entry['id'] for entry in row],
+                         [self.films[2].id, self.films[1].id])
+        with self.assertNumQueries(0):
+            self.assertEqual(continue_watching(self.user.id), row)
+
+    def test_player_and_api_return_resume_position(self):
+        self.watch(self.films[0], 42.0)
+        response = self.client.get(reverse('watch', args=[self.films[0].id]))
+        self.assertEqual(response.context['resume_position'], 42.0)
+        self.assertContains(response, '<script id="resume-position" type="application/json">42.0</script>', html=True)
+        response = self.client.get(reverse('resume_position', args=[self.films[0].id]))
+        self.assertEqual(response.json(), {'film_id': self.films[0].id, 'position': 42.0})
+        response = self.client.get(reverse('continue_watching'))
+        self.assertEqual(response.json()['results'][0]['position'], 42.0)
+
+    def test_start_page_shows_row(self):
+        self.watch(self.films[1], 12.0)
+        response = self.client.get(reverse('start'))
+        self.assertContains(response, "Oglądaj dalej")
+        self.assertEqual(response.context['continue_row'][0]['id'], self.films[1].id)
+
+    def test_deleted_film_leaves_the_row(self):
+        self.watch(self.films[0], 10.0)
+        flush_progress()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.films[0].delete()
+        self.assertEqual(continue_watching(self.user.id), [])
+
+    def test_api_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('continue_watching')).status_code, 401)
+        self.assertEqual(self.client.get(
+            reverse('resume_position', args=[self.films[0].id])).status_code, 401)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_database_path_without_redis(self):
+        buffer(self.user.id, self.films[0].id, 10.0)
+        buffer(self.user.id, self.films[2].id, 20.0)
+        with self.assertNumQueries(1):
+            row = continue_watching(self.user.id)
+        self.assertEqual([entry['position'] for entry in row], [20.0, 10.0])
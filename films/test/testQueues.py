@@ -0,0 +1,118 @@
+from ..models import Film, VideoUpload
+from ..queues import (TRANSCODE_CHUNKS_QUEUE, TRANSCODE_HEAVY_QUEUE,
+                      transcode_admission_open)
+from ..tasks import DEFAULT_HLS_LOCK_TIMEOUT, enqueue_film_processing
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from unittest.mock import patch
+from types import SimpleNamespace
+from mysite.celery import limit_worker_concurrency
+import json
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class AdmissionTests(TestCase):
+    @override_settings(TRANSCODE_BACKLOG_LIMIT=3)
+    @patch('films.queues.transcode_backlog', return_value=2)
+    def test_open_below_limit(self, mock_backlog):
+        self.assertTrue(transcode_admission_open())
+
+    @override_settings(TRANSCODE_BACKLOG_LIMIT=3)
+    @patch('films.queues.transcode_backlog', return_value=3)
+    def test_closed_at_limit(self, mock_backlog):
+        self.assertFalse(transcode_admission_open())
+
+
+    @override_settings(TRANSCODE_BACKLOG_LIMIT=3)
+    def test_chunks_of_one_film_do_not_close_admission(self):
+        # Jeden długi film rozbity na 40 części, brak innych konwersji
+        lengths = {TRANSCODE_CHUNKS_QUEUE: 40, TRANSCODE_HEAVY_QUEUE: 0}
+        with patch('films.queues.queue_length', side_effect=lengths.get):
+            self.assertTrue(transcode_admission_open())
+        self.assertEqual(
+            settings.CELERY_TASK_ROUTES['films.tasks.transcode_chunk_task']['queue'],
+            TRANSCODE_CHUNKS_QUEUE)
+
+
+class WorkerConcurrencyTests(TestCase):
+    def start_worker(self, **options):
+        conf = SimpleNamespace(task_default_queue='celery', worker_concurrency=None)
+        limit_worker_concurrency(sender='worker@host', conf=conf, options=options)
+        return conf.worker_concurrency
+
+    @override_settings(QUEUE_CONCURRENCY={'transcode_heavy': 2, 'transcode_chunks': 3, 'io': 8})
+    def test_smallest_cap_of_consumed_queues(self):
+        self.assertEqual(self.start_worker(queues=['transcode_heavy', 'transcode_chunks']), 2)
+        self.assertEqual(self.start_worker(queues='io,celery'), 8)
+        self.assertIsNone(self.start_worker(queues=None))
+
+    def test_explicit_concurrency_wins(self):
+        self.assertIsNone(self.start_worker(queues=['transcode_heavy'], concurrency=6))
+
+
+class AcksLateTests(TestCase):
+    def test_unacked_tasks_outlive_longest_conversion(self):
+        # Redis oddałby niepotwierdzoną konwersję drugiemu workerowi
+        visibility_timeout = settings.CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout']
+        self.assertTrue(settings.CELERY_TASK_ACKS_LATE)
+        self.assertGreaterEqual(settings.CELERY_TASK_TIME_LIMIT, DEFAULT_HLS_LOCK_TIMEOUT)
+        self.assertGreater(visibility_timeout, settings.CELERY_TASK_TIME_LIMIT)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PriorityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username='admin', password='adminpassword')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='admin', password='adminpassword')
+
+    def create(self, **overrides):
+        payload = {'video_name': 'Test Video', 'video_description': 'Test Description',
+                   'filename': 'video.mp4', 'size': 100}
+        payload.update(overrides)
+        return self.client.post(reverse('upload_create'), json.dumps(payload),
+                                content_type='application/json')
+
+    @patch('films.tasks.generate_previews_task.apply_async')
+    @patch('films.tasks.convert_to_hls_task.apply_async')
+    def test_enqueue_uses_film_priority(self, mock_convert, mock_previews):
+        film = Film.objects.create(
+            name='Film', description='Opis', link='videos/film.mp4',
+            thumbnail='thumbnails/film.jpg', priority=Film.PRIORITY_HIGH)
+        enqueue_film_processing(film)
+        job = film.transcode_jobs.get()
+        mock_convert.assert_called_once_with(
+            (film.id,), priority=Film.PRIORITY_HIGH, task_id=job.task_id)
+        mock_previews.assert_called_once_with((film.id,), priority=Film.PRIORITY_HIGH)
+
+    @patch('films.views.transcode_admission_open', return_value=True)
+    def test_upload_stores_priority(self, mock_open):
+        response = self.create(priority=Film.PRIORITY_LOW)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(VideoUpload.objects.get().priority, Film.PRIORITY_LOW)
+
+    @patch('films.views.transcode_admission_open', return_value=True)
+    def test_upload_rejects_unknown_priority(self, mock_open):
+        response = self.create(priority=42)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(VideoUpload.objects.count(), 0)
+
+    @patch('films.views.transcode_admission_open', return_value=False)
+    def test_upload_refused_when_queue_full(self, mock_open):
+        response = self.create()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(VideoUpload.objects.count(), 0)
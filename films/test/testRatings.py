@@ -0,0 +1,70 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from ..models import Film, Ratings
+from ..ratings import add_rating, reconcile_film_ratings
+import io
+
+
+class FilmRatingAggregatesTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(
+            username=f"user{i}", password="password") for i in range(3)]
+        self.film = Film.objects.create(
+            name="test film", description="test description",
+            link="test.mp4", thumbnail='thumbnail.jpg')
+
+    def aggregates(self):
+        self.film.refresh_from_db()
+        return self.film.rating_sum, self.film.rating_count, self.film.rating_average
+
+    def test_create_update_and_delete_keep_aggregates(self):
+        add_rating(self.users[0].id, self.film.id, 4, "dobry")
+        rating = add_rating(self.users[1].id, self.film.id, 1, "słaby")
+        self.assertEqual(self.aggregates(), (5, 2, 2.5))
+
+        rating.rating = 3
+        rating.save()
+        self.assertEqual(self.aggregates(), (7, 2, 3.5))
+
+        rating.delete()
+        self.assertEqual(self.aggregates(), (4, 1, 4.0))
+        Ratings.objects.all().delete()
+        self.assertEqual(self.aggregates(), (0, 0, 0.0))
+
+    def test_view_updates_aggregates(self):
+        self.client.login(username="user0", password="password")
+        self.client.post(reverse('watch', args=[self.film.id]), {'comments': 'super'})
+        self.assertEqual(self.aggregates(), (5, 1, 5.0))
+
+    def test_deleting_film_with_ratings(self):
+        add_rating(self.users[0].id, self.film.id, 4, "dobry")
+        self.film.delete()
+        self.assertFalse(Ratings.objects.exists())
+
+    def test_reconcile_fixes_drift(self):
+        Ratings.objects.bulk_create([
+            Ratings(user=self.users[0], film=self.film, rating=2, comments="a"),
+            Ratings(user=self.users[1], film=self.film, rating=5, comments="b")])
+        other = Film.objects.create(
+            name="other", description="test description",
+            link="other.mp4", thumbnail='thumbnail.jpg')
+        Film.objects.filter(id=other.id).update(rating_sum=9, rating_count=3)
+
+        self.assertEqual(len(reconcile_film_ratings(dry_run=True)), 2)
+        self.assertEqual(self.aggregates(), (0, 0, 0.0))
+
+        changes = reconcile_film_ratings()
+        self.assertEqual(sorted(changes), [
+            (self.film.id, (0, 0), (7, 2)), (other.id, (9, 3), (0, 0))])
+        self.assertEqual(self.aggregates(), (7, 2, 3.5))
+        self.assertEqual(reconcile_film_ratings(), [])
+
+    def test_command_reports_changes(self):
+        Ratings.objects.bulk_create([
+            Ratings(user=self.users[0], film=self.film, rating=3, comments="a")])
+        out = io.StringIO()
+        call_command("reconcile_ratings", stdout=out)
+        self.assertIn(f"Film {self.film.id}: suma 0 -> 3, liczba 0 -> 1", out.getvalue())
+        self.assertEqual(self.aggregates(), (3, 1, 3.0))
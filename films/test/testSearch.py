@@ -0,0 +1,98 @@
+from django.test import SimpleTestCase, TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from ..models import Film
+from ..search import (InvertedIndex, PrefixIndex, fold, search_films,
+                      suggest_titles, tokenize)
+import io
+from unittest import mock
+
+
+class SearchHelpersTest(SimpleTestCase):
+    def test_fold_and_tokenize(self):
+        self.assertEqual(fold("Łódź Kaliska"), "lodz kaliska")
+        self.assertEqual(tokenize("Gwiezdne wojny: Część V"), ["gwiezdne", "wojny", "część", "v"])
+
+    def test_inverted_index_matches_all_terms_and_prefix(self):
+        index = InvertedIndex([
+            (1, "Gwiezdne wojny", "kosmos"),
+            (2, "Wojna i pokój", "gwiezdne tło"),
+            (3, "Rejs", "statek"),
+        ])
+        self.assertEqual(index.search(["gwiezdne", "woj"], 10), [1, 2])
+        # Trafienie w nazwie waży więcej niż w opisie
+        self.assertEqual(index.search(["gwiezd"], 10), [1, 2])
+        self.assertEqual(index.search(["rejs", "kosmos"], 10), [])
+
+    def test_prefix_index_matches_any_word_of_title(self):
+        index = PrefixIndex([(1, "Gwiezdne wojny"), (2, "Wojna i pokój"), (3, "Łódź")])
+        self.assertEqual([s["id"] for s in index.suggest("woj", 10)], [2, 1])
+        self.assertEqual(index.suggest("lod", 10), [{"id": 3, "name": "Łódź"}])
+        self.assertEqual(len(index.suggest("woj", 1)), 1)
+
+
+class SearchViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.star_wars = Film.objects.create(
+            name="Gwiezdne wojny", description="Saga w odległej galaktyce")
+        self.war = Film.objects.create(name="Wojna i pokój", description="Rosja, 1812")
+        self.cruise = Film.objects.create(name="Rejs", description="Statek po Wiśle")
+
+    def ids(self, results):
+        return [film["id"] for film in results]
+
+    def test_full_text_search(self):
+        self.assertEqual(self.ids(search_films("gwiezdne woj")), [self.star_wars.id])
+        self.assertEqual(self.ids(search_films("galaktyce")), [self.star_wars.id])
+        self.assertEqual(self.ids(search_films("statek galaktyce")), [])
+        self.assertEqual(search_films("  "), [])
+
+    def test_in_memory_index_without_database_support(self):
+        with mock.patch("films.search.search_backend", return_value="memory"):
+            self.assertEqual(self.ids(search_films("gwiezdne woj")), [self.star_wars.id])
+            with self.captureOnCommitCallbacks(execute=True):
+                Film.objects.create(name="Galaktyka", description="")
+            self.assertEqual(len(search_films("galakty")), 2)
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.ids(suggest_titles("gwiez")), [self.star_wars.id])
+        self.cruise.name = "Rejs po galaktyce"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cruise.save()
+        self.assertEqual(set(self.ids(search_films("galaktyce"))),
+                         {self.star_wars.id, self.cruise.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.star_wars.delete()
+        self.assertEqual(self.ids(search_films("galaktyce")), [self.cruise.id])
+        self.assertEqual(self.ids(suggest_titles("gwiez")), [])
+
+    def test_suggestions(self):
+        self.assertEqual(suggest_titles("woj"), [
+            {"id": self.war.id, "name": "Wojna i pokój"},
+            {"id": self.star_wars.id, "name": "Gwiezdne wojny"}])
+        with self.captureOnCommitCallbacks(execute=True):
+            Film.objects.create(name="Wojownik", description="")
+        self.assertEqual(suggest_titles("wojo")[0]["name"], "Wojownik")
+
+    def test_suggestions_beyond_latin(self):
+        potter = Film.objects.create(name="Гарри Поттер", description="")
+        tokyo = Film.objects.create(name="東京物語", description="")
+        self.assertEqual(self.ids(suggest_titles("г")), [potter.id])
+        self.assertEqual(self.ids(suggest_titles("Гар")), [potter.id])
+        self.assertEqual(self.ids(suggest_titles("пот")), [potter.id])
+        self.assertEqual(self.ids(suggest_titles("東")), [tokyo.id])
+
+    def test_api(self):
+        response = self.client.get(reverse("film_search"), {"q": "rejs"})
+        self.assertEqual(self.ids(response.json()["results"]), [self.cruise.id])
+        self.assertEqual(self.client.get(reverse("film_search"), {"limit": "x"}).status_code, 400)
+        response = self.client.get(reverse("film_suggest"), {"q": "Rej"})
+        self.assertEqual(response.json()["results"], [{"id": self.cruise.id, "name": "Rejs"}])
+
+    def test_rebuild_command(self):
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indeks pełnotekstowy", out.getvalue())
+        self.assertEqual(self.ids(search_films("pokoj")), [self.war.id])
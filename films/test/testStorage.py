@@ -0,0 +1,145 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, default_storage
+from unittest import mock, skipUnless
+from ..cleanup import cleanup_film_media, film_media
+from ..models import Film
+from ..storage import (OutputDirectory, delete_tree, local_copy, move_into_storage,
+                       tree_size)
+from ..tasks import convert_to_hls_task
+import importlib.util
+import os
+import tempfile
+
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+SOURCE = {'duration': 5.0, 'width': 640, 'height': 360, 'has_audio': False,
+          'video_codec': 'mpeg4', 'pix_fmt': 'yuv420p', 'audio_codec': None}
+
+
+def write(path, content=b"x", mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class RemoteStorageHelpersTest(SimpleTestCase):
+    def setUp(self):
+        os.makedirs(tempfile.gettempdir(), exist_ok=True)
+        self.storage = InMemoryStorage()
+
+    def test_local_copy_downloads_and_cleans_up(self):
+        self.storage.save("videos/source.mp4", ContentFile(b"video"))
+        with local_copy("videos/source.mp4", self.storage) as path:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"video")
+        self.assertFalse(os.path.exists(path))
+        with self.assertRaises(FileNotFoundError):
+            with local_copy("videos/missing.mp4", self.storage):
+                pass
+
+    def test_segments_are_uploaded_while_encoding_and_playlists_last(self):
+        with OutputDirectory("videos/hls/abc", self.storage, workers=2) as outputs:
+            write(outputs.path("360p/segment0.ts"), mtime=100)
+            write(outputs.path("360p/segment1.ts"), mtime=200)
+            write(outputs.path("360p/index.m3u8"), b"#EXTM3U", mtime=200)
+            outputs.sync()
+            outputs.wait()
+            # Najnowszy segment i playlisty mogą być jeszcze zapisywane
+            self.assertEqual(self.storage.listdir("videos/hls/abc/360p")[1], ["segment0.ts"])
+            write(outputs.path("master.m3u8"), b"#EXTM3U")
+        self.assertEqual(sorted(self.storage.listdir("videos/hls/abc/360p")[1]),
+                         ["index.m3u8", "segment0.ts", "segment1.ts"])
+        self.assertTrue(self.storage.exists("videos/hls/abc/master.m3u8"))
+        self.assertEqual(outputs.size, len(b"x") * 2 + len(b"#EXTM3U") * 2)
+        self.assertFalse(os.path.exists(outputs.directory))
+
+    def test_failed_encoding_uploads_nothing_more(self):
+        with self.assertRaises(RuntimeError):
+            with OutputDirectory("videos/hls/abc", self.storage) as outputs:
+                write(outputs.path("360p/index.m3u8"), b"#EXTM3U")
+                raise RuntimeError("ffmpeg")
+        self.assertFalse(self.storage.exists("videos/hls/abc/360p/index.m3u8"))
+        self.assertFalse(os.path.exists(outputs.directory))
+
+    def test_tree_helpers_and_move(self):
+        self.storage.save("videos/hls/abc/360p/segment0.ts", ContentFile(b"123"))
+        self.storage.save("videos/hls/abc/master.m3u8", ContentFile(b"45"))
+        self.assertEqual(tree_size("videos/hls/abc", self.storage), 5)
+        delete_tree("videos/hls/abc", self.storage)
+        self.assertEqual(tree_size("videos/hls/abc", self.storage), 0)
+
+        path = os.path.join(tempfile.mkdtemp(), "upload.part")
+        write(path, b"video")
+        name = move_into_storage(path, "videos/before/film.mp4", self.storage)
+        self.assertEqual(name, "videos/before/film.mp4")
+        self.assertFalse(os.path.exists(path))
+
+
+def fake_ffmpeg(command, duration=None, on_progress=None, outputs=None):
+    """ Zapisuje pliki HLS tam, gdzie zrobiłby to FFmpeg """
+    output_dir = os.path.dirname(os.path.dirname(command[-1]))
+    write(os.path.join(output_dir, "360p", "segment0.ts"), b"segment")
+    write(os.path.join(output_dir, "360p", "index.m3u8"), b"#EXTM3U")
+    write(os.path.join(output_dir, "master.m3u8"), b"#EXTM3U")
+    outputs.sync()
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class RemoteStorageConversionTest(TestCase):
+    def setUp(self):
+        os.makedirs(tempfile.gettempdir(), exist_ok=True)
+        cache.clear()
+        default_storage.save("videos/before/source.mp4", ContentFile(b"video"))
+        self.film = Film.objects.create(
+            name='Film', description='Opis', link='videos/before/source.mp4',
+            thumbnail='thumbnails/film.jpg')
+
+    @mock.patch('films.tasks.run_ffmpeg', side_effect=fake_ffmpeg)
+    @mock.patch('films.tasks.probe_source', return_value=SOURCE)
+    def test_conversion_writes_hls_to_storage(self, mock_probe, mock_ffmpeg):
+        playlist = convert_to_hls_task(self.film.id)
+        self.film.refresh_from_db()
+        prefix = f"videos/hls/{self.film.content_hash}"
+        self.assertEqual(playlist, f"/media/{prefix}/master.m3u8")
+        self.assertTrue(default_storage.exists(f"{prefix}/360p/segment0.ts"))
+        self.assertTrue(default_storage.exists(f"{prefix}/360p/index.m3u8"))
+        # FFmpeg dostał lokalną kopię źródła
+        self.assertTrue(mock_probe.call_args.args[0].startswith(tempfile.gettempdir()))
+        self.assertEqual(self.film.transcode_jobs.get().output_size, len(b"segment#EXTM3U#EXTM3U"))
+
+    def test_cleanup_removes_files_from_storage(self):
+        default_storage.save(f"videos/hls/{self.film.id}/master.m3u8", ContentFile(b"#EXTM3U"))
+        media = film_media(self.film)
+        self.film.delete()
+        cleanup_film_media(media)
+        self.assertFalse(default_storage.exists("videos/before/source.mp4"))
+        self.assertFalse(default_storage.exists(f"videos/hls/{media['film_id']}/master.m3u8"))
+
+
+@skipUnless(importlib.util.find_spec("moto") and importlib.util.find_spec("storages"),
+            "wymaga moto i django-storages")
+class S3StorageTest(SimpleTestCase):
+    def test_output_directory_against_s3(self):
+        import boto3
+        from moto import mock_aws
+        from storages.backends.s3 import S3Storage
+
+        with mock_aws():
+            boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="media")
+            storage = S3Storage(bucket_name="media", region_name="us-east-1",
+                                querystring_auth=False)
+            with OutputDirectory("videos/hls/abc", storage) as outputs:
+                write(outputs.path("360p/segment0.ts"), b"segment")
+                write(outputs.path("master.m3u8"), b"#EXTM3U")
+            self.assertEqual(tree_size("videos/hls/abc", storage), len(b"segment#EXTM3U"))
+            with local_copy("videos/hls/abc/360p/segment0.ts", storage) as path:
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), b"segment")
+            delete_tree("videos/hls/abc", storage)
+            self.assertFalse(storage.exists("videos/hls/abc/master.m3u8"))
@@ -0,0 +1,126 @@
+from ..models import Film, VideoUpload
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+import json
+import os
+import tempfile
+import shutil
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(
+            username='admin', password='adminpassword')
+        cls.normal_user = User.objects.create_user(
+            username='testuser', password='testpassword')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='admin', password='adminpassword')
+        self.data = b"0123456789" * 10
+
+    def create(self, **overrides):
+        payload = {'video_name': 'Test Video', 'video_description': 'Test Description',
+                   'filename': 'video.mp4', 'size': len(self.data)}
+        payload.update(overrides)
+        return self.client.post(reverse('upload_create'), json.dumps(payload),
+                                content_type='application/json')
+
+    def send(self, location, offset, chunk):
+        return self.client.patch(location, chunk,
+                                 content_type='application/offset+octet-stream',
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_non_admin_cannot_create_upload(self):
+        self.client.login(username='testuser', password='testpassword')
+        response = self.create()
+        self.assertEqual(response.status_code, 403)
+
+    def test_rejects_non_mp4(self):
+        response = self.create(filename='video.avi')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(VideoUpload.objects.count(), 0)
+
+    @patch('films.views.enqueue_film_processing')
+    def test_resumable_upload_and_finalize(self, mock_enqueue):
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        location = response['Location']
+
+        response = self.send(location, 0, self.data[:40])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], '40')
+
+        # A client resuming with a stale offset learns the real one
+        response = self.send(location, 0, self.data[:40])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '40')
+
+        response = self.client.head(location)
+        self.assertEqual(response['Upload-Offset'], '40')
+        self.assertEqual(response['Upload-Length'], str(len(self.data)))
+
+        # Finalizing before the last chunk is refused
+        response = self.client.post(f"{location}finalize/")
+        self.assertEqual(response.status_code, 409)
+
+        self.send(location, 40, self.data[40:])
+        thumbnail = SimpleUploadedFile(
+            "thumbnail.jpg", b"file_content", content_type="image/jpeg")
+        response = self.client.post(f"{location}finalize/", {'thumbnail': thumbnail})
+        self.assertEqual(response.status_code, 201)
+
+        film = Film.objects.get()
+        self.assertEqual(response.json()['film_id'], film.id)
+        with open(os.path.join(MEDIA_ROOT, film.link.name), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(VideoUpload.objects.count(), 0)
+        mock_enqueue.assert_called_once_with(film)
+
+    def complete_upload(self):
+        location = self.create()['Location']
+        self.send(location, 0, self.data)
+        return location
+
+    def finalize(self, location):
+        thumbnail = SimpleUploadedFile(
+            "thumbnail.jpg", b"file_content", content_type="image/jpeg")
+        return self.client.post(f"{location}finalize/", {'thumbnail': thumbnail})
+
+    @patch('films.views.enqueue_film_processing')
+    def test_concurrent_finalize_is_refused(self, mock_enqueue):
+        location = self.complete_upload()
+        # The second request read the session before the first one finished it
+        stale = VideoUpload.objects.get()
+        self.assertEqual(self.finalize(location).status_code, 201)
+        with patch('films.views.get_object_or_404', return_value=stale):
+            response = self.finalize(location)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Film.objects.count(), 1)
+        mock_enqueue.assert_called_once()
+
+    @patch('films.views.enqueue_film_processing')
+    def test_finalize_without_part_file_is_refused(self, mock_enqueue):
+        location = self.complete_upload()
+        os.remove(VideoUpload.objects.get().part_path)
+        response = self.finalize(location)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Film.objects.count(), 0)
+        mock_enqueue.assert_not_called()
+
+    def test_chunk_larger_than_declared_size(self):
+        location = self.create()['Location']
+        response = self.send(location, 0, self.data + b"extra")
+        self.assertEqual(response.status_code, 413)
@@ -7,6 +7,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 import tempfile
 import shutil
 from django.core.cache import cache
+from asgiref.sync import sync_to_async
 
 
 # Temporary directory for test files
@@ -254,6 +255,12 @@ class VideoViewerTestCase(TestCase):
         self.assertEqual(Ratings.objects.filter(
             film=self.film, user=self.user).count(), 1)
 
+    async def test_async_client_renders_player(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(self.url)
+        self.assertContains(response, self.film.name)
+
     def test_post_request_without_login(self):
         # Try to submit a rating without being logged in
         data = {'comments': 'Nice film!'}
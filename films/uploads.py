@@ -0,0 +1,44 @@
+""" Skróty SHA-256 przesyłanych plików, liczone w trakcie zapisu na dysk """
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """ Liczy skrót każdego pliku i przekazuje dane dalej bez zmian
+
+    Musi stać pierwszy w settings.FILE_UPLOAD_HANDLERS - zapis pliku
+    zostawia kolejnym handlerom. Skróty trafiają do
+    `request.upload_hashes` (nazwa pola -> hex).
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, "upload_hashes"):
+            self.request.upload_hashes = {}
+        self.request.upload_hashes[self.field_name] = self.hash.hexdigest()
+        return None
+
+
+def upload_hash(request, field_name):
+    """ Skrót przesłanego pliku albo "", gdy handler nie był aktywny """
+    return getattr(request, "upload_hashes", {}).get(field_name, "")
+
+
+def file_sha256(path):
+    """ Skrót pliku już leżącego na dysku (np. złożonego z części uploadu) """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
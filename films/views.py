@@ -1,27 +1,40 @@
 from .models import Film
 from django.shortcuts import render
 from django.views.generic import TemplateView
-from .models import Film, Ratings, VideoProgress
+from .models import Film, Ratings, TranscodeJob, VideoUpload
 from .forms import VideoForm, RatingForm
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, HttpResponse
 from django.shortcuts import render
 from django.contrib import messages
 from django.shortcuts import redirect
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 import json
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.conf import settings
 import os
 import subprocess
 import ffmpeg
-from .tasks import convert_to_hls_task
+from .tasks import enqueue_film_processing
+from .queues import transcode_admission_open
+from .uploads import upload_hash
+from .hls import get_encoder_profiles
+from .progress_buffer import (abuffer_progress, aget_progress, aremember_watching,
+                              continue_watching)
+from .caching import aget_film_ratings, get_catalogue_page
+from .previews import poster_url, previews_url
+from .ratings import add_rating
+from .search import search_films, suggest_titles
+from .storage import move_into_storage
+from .middleware import metrics
 from django.http import JsonResponse
 from celery.result import AsyncResult
 from django.http import JsonResponse
@@ -30,24 +43,93 @@ from .models import Film
 from celery.result import AsyncResult
 
 
+DEFAULT_METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+
+
 class startView(TemplateView):
     template_name_logged = 'films/startLogged.html'
     template_name_notlogged = 'films/start_notLogged.html'
 
     def get(self, request):
+        # Strona katalogu z cache'u, tak samo dla zalogowanych i gości
+        page = get_catalogue_page(parse_cursor(request.GET.get('cursor')))
+        all = page['films']
+        next_cursor = page['next_cursor']
         if request.user.is_authenticated:
             form = RatingForm()
-            all = cache.get('films_list')
-            if not all:
-                all = Film.objects.select_related().all()
-                cache.set('films_list', all, timeout=3600)
+            # Jedno przesłanie do Redisa, bez zapytań per film
+            continue_row = continue_watching(request.user.id)
             return render(request, self.template_name_logged, locals())
         else:
-            all = Film.objects.select_related().all()
-
             return render(request, self.template_name_notlogged, locals())
 
 
+def parse_cursor(value):
+    """ Kursor stronicowania (id ostatniego filmu poprzedniej strony) albo None """
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+async def is_authenticated(request):
+    """ request.user w widoku asynchronicznym
+
+    Odczyt użytkownika (sesja i zapytanie do bazy) jest synchroniczny -
+    wykonujemy go raz w wątku, potem request.user i sesja są już wczytane.
+    """
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+class FilmCatalogueApi(View):
+    """ Katalog filmów w JSON, stronicowany kursorem ?cursor=<id> """
+
+    def get(self, request):
+        cursor = request.GET.get('cursor')
+        if cursor is not None and parse_cursor(cursor) is None:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+        page = get_catalogue_page(parse_cursor(cursor))
+        return JsonResponse({'results': page['films'], 'next_cursor': page['next_cursor']})
+
+
+class FilmSearchApi(View):
+    """ Wyszukiwanie pełnotekstowe ?q=...&limit=... (nazwa i opis filmu) """
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.GET.get('limit', 0)), 0), 100) or None
+        except ValueError:
+            return JsonResponse({'error': 'invalid limit'}, status=400)
+        return JsonResponse({'results': search_films(request.GET.get('q', ''), limit)})
+
+
+class FilmSuggestApi(View):
+    """ Podpowiedzi tytułów dla pola wyszukiwania ?q=<początek> """
+
+    def get(self, request):
+        return JsonResponse({'results': suggest_titles(request.GET.get('q', ''))})
+
+
+class ContinueWatchingApi(View):
+    """ Ostatnio oglądane filmy zalogowanego użytkownika z pozycjami wznowienia """
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'login required'}, status=401)
+        return JsonResponse({'results': continue_watching(request.user.id)})
+
+
+class ResumePositionApi(View):
+    """ Pozycja wznowienia filmu - odtwarzacz przewija do niej od razu po starcie """
+
+    async def get(self, request, film_id):
+        if not await is_authenticated(request):
+            return JsonResponse({'error': 'login required'}, status=401)
+        position = await aget_progress(request.user.id, film_id)
+        return JsonResponse({'film_id': film_id, 'position': position})
+
+
 class Add_Video(UserPassesTestMixin, TemplateView):
     template_name = 'films/add_films.html'
 
@@ -69,16 +151,21 @@ class Add_Video(UserPassesTestMixin, TemplateView):
                     request, messages.ERROR, "upload an mp4 file!")
                 return render(request, self.template_name, {'form': form})
 
+            if not transcode_admission_open():
+                messages.add_message(
+                    request, messages.ERROR, "conversion queue is full, try again later")
+                return render(request, self.template_name, {'form': form})
+
             insert = Film(name=name, description=description,
-                          link=link, thumbnail=thumbnail)
+                          link=link, thumbnail=thumbnail,
+                          priority=form.cleaned_data['priority'],
+                          encoder_profile=form.cleaned_data['encoder_profile'],
+                          content_hash=upload_hash(request, 'link'))
             insert.save()
  ####
-            task = convert_to_hls_task.delay(insert.id)
-
-            cache.delete('films_list')
-            films = Film.objects.select_related().all()
-            cache.set('films_list', films, timeout=3600)
-            cache.set(f"task_{insert.id}", task.id, timeout=3600)
+            # Stan konwersji zapisuje TranscodeJob, pierwszą stronę
+            # katalogu unieważnia sygnał post_save filmu
+            enqueue_film_processing(insert)
 
             # Send response to frontend with the task_id and film_id
             return redirect('film_progress', film_id=insert.id)
@@ -87,60 +174,224 @@ class Add_Video(UserPassesTestMixin, TemplateView):
 
     def get(self, request):
         form = VideoForm()
-        active_task = None
-        for film in Film.objects.all():
-            task_key = f"film_converting_{film.id}"
-            active_task = cache.get(task_key)
-            if active_task:
-                break
-
-        if active_task:
-            # dodaj tutaj redirecta zeby nie wracalo add_video
-            print("wypierdalaj")
+        # Trwające konwersje jednym zapytaniem po indeksie (status, created_at)
+        active_jobs = TranscodeJob.objects.filter(
+            status__in=TranscodeJob.ACTIVE_STATUSES).select_related(
+            'film').order_by('created_at')
         return render(request, self.template_name, locals())
 
 
-class VideoViewer(LoginRequiredMixin, TemplateView):
+# Rozmiar bloku, w jakim strumieniujemy części pliku na dysk
+UPLOAD_READ_SIZE = 1024 * 1024
+
 
-    def get(self, request, id):
+class ChunkedUploadCreate(UserPassesTestMixin, View):
+    """ Tworzy sesję wznawialnego wysyłania filmu (odpowiednik tus "creation") """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+            name = data['video_name']
+            description = data['video_description']
+            filename = os.path.basename(data['filename'])
+            size = int(data['size'])
+            priority = int(data.get('priority', Film.PRIORITY_NORMAL))
+            encoder_profile = str(data.get('encoder_profile') or '')
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'video_name, video_description, filename and size are required'}, status=400)
+
+        if priority not in dict(Film.PRIORITY_CHOICES):
+            return JsonResponse({'error': 'invalid priority'}, status=400)
+        if encoder_profile and encoder_profile not in get_encoder_profiles():
+            return JsonResponse({'error': 'unknown encoder profile'}, status=400)
+        if not name or len(name) > 30 or len(description) > 255 or size <= 0:
+            return JsonResponse({'error': 'invalid upload metadata'}, status=400)
+        if filename.rsplit('.', 1)[-1].lower() != 'mp4':
+            return JsonResponse({'error': 'upload an mp4 file!'}, status=400)
+
+        # Odrzucamy przed wysłaniem gigabajtów, a nie po
+        if not transcode_admission_open():
+            response = JsonResponse({'error': 'conversion queue is full'}, status=503)
+            response['Retry-After'] = '300'
+            return response
+
+        upload = VideoUpload.objects.create(
+            user=request.user, name=name, description=description,
+            filename=filename, size=size, priority=priority,
+            encoder_profile=encoder_profile)
+        os.makedirs(os.path.dirname(upload.part_path), exist_ok=True)
+        open(upload.part_path, 'wb').close()
+
+        location = reverse('upload_chunk', args=[upload.id])
+        response = JsonResponse(
+            {'upload_id': str(upload.id), 'location': location, 'offset': 0}, status=201)
+        response['Location'] = location
+        response['Upload-Offset'] = '0'
+        return response
+
+
+class ChunkedUploadChunk(UserPassesTestMixin, View):
+    """ Przyjmuje kolejne części pliku (PATCH z nagłówkiem Upload-Offset) """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def head(self, request, upload_id):
+        upload = get_object_or_404(VideoUpload, id=upload_id, user=request.user)
+        response = HttpResponse()
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def patch(self, request, upload_id):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset header required'}, status=400)
+
+        with transaction.atomic():
+            # Blokada wiersza - równoległe PATCH-e tej samej sesji czekają
+            upload = get_object_or_404(
+                VideoUpload.objects.select_for_update(), id=upload_id, user=request.user)
+            if offset != upload.offset:
+                response = JsonResponse(
+                    {'error': 'offset mismatch', 'offset': upload.offset}, status=409)
+                response['Upload-Offset'] = str(upload.offset)
+                return response
+
+            remaining = upload.size - upload.offset
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if length > remaining:
+                return JsonResponse({'error': 'chunk exceeds declared size'}, status=413)
+
+            # Strumieniujemy ciało żądania prosto na dysk, bez buforowania w pamięci
+            mode = 'r+b' if os.path.exists(upload.part_path) else 'wb'
+            with open(upload.part_path, mode) as f:
+                f.seek(upload.offset)
+                f.truncate()
+                while length > 0:
+                    block = request.read(min(UPLOAD_READ_SIZE, length))
+                    if not block:
+                        break
+                    f.write(block)
+                    length -= len(block)
+                upload.offset = f.tell()
+            upload.save(update_fields=['offset'])
+
+        response = HttpResponse(status=204)
+        response['Upload-Offset'] = str(upload.offset)
+        return response
+
+
+class ChunkedUploadFinalize(UserPassesTestMixin, View):
+    """ Zamienia kompletny plik w Film i zleca konwersję do HLS """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def post(self, request, upload_id):
+        upload = get_object_or_404(VideoUpload, id=upload_id, user=request.user)
+        if not upload.is_complete:
+            return JsonResponse(
+                {'error': 'upload incomplete', 'offset': upload.offset, 'size': upload.size}, status=409)
+        thumbnail = request.FILES.get('thumbnail')
+        if thumbnail is None:
+            return JsonResponse({'error': 'thumbnail required'}, status=400)
+
+        with transaction.atomic():
+            # Blokada wiersza - równoległe zakończenie tej samej sesji czeka,
+            # a po nim wiersza już nie ma
+            upload = VideoUpload.objects.select_for_update().filter(id=upload.id).first()
+            if upload is None:
+                return JsonResponse({'error': 'upload already finalized'}, status=409)
+
+            # Przeniesienie pliku na miejsce docelowe (lokalnie bez kopiowania)
+            link_field = Film._meta.get_field('link')
+            try:
+                name = move_into_storage(
+                    upload.part_path, link_field.generate_filename(None, upload.filename))
+            except FileNotFoundError:
+                # Bazy bez blokad wierszy (SQLite) - plik zabrało drugie żądanie
+                return JsonResponse({'error': 'upload already finalized'}, status=409)
+
+            insert = Film(name=upload.name, description=upload.description,
+                          thumbnail=thumbnail, priority=upload.priority,
+                          encoder_profile=upload.encoder_profile)
+            insert.link.name = name
+            insert.save()
+            upload.delete()
+
+        enqueue_film_processing(insert)
+
+        return JsonResponse({
+            'film_id': insert.id,
+            'progress_url': reverse('film_progress', args=[insert.id]),
+        }, status=201)
+
+
+class VideoViewer(View):
+    """ Odtwarzacz - widok asynchroniczny, pod ASGI nie zajmuje wątku na czas żądania """
+    template_name = 'films/VideoViewer.html'
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Odpowiednik LoginRequiredMixin, który sprawdza request.user synchronicznie
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, id):
         request.session["video_id"] = id
-        template_name = 'films/VideoViewer.html'
 
-        film = Film.objects.get(id=id)
+        film = await Film.objects.aget(id=id)
 
         form = RatingForm()
 
-        ratings = cache.get('ratings')
-        if not ratings:
-            ratings = Ratings.objects.filter(film_id=id).select_related('user')
-            cache.set('ratings', ratings, timeout=3600)
+        # Odtwarzacz zaczyna od ostatniej pozycji, film wskakuje na początek "oglądaj dalej"
+        resume_position = await aget_progress(request.user.id, id)
+        await aremember_watching(request.user.id, film, resume_position)
 
-        return render(request, template_name, {"film": film, "form": form, "ratings": ratings})
+        # Oceny tego filmu (wiersze + średnia), unieważniane sygnałami Ratings
+        film_ratings = await aget_film_ratings(id)
 
-    def post(self, request, id):
-        form = RatingForm(request.POST)
+        return render(request, self.template_name, {
+            "film": film, "form": form, "ratings": film_ratings['ratings'],
+            "previews_url": previews_url(film.id) if film.has_previews else None,
+            "poster_url": poster_url(film.id, film.thumbnail_variants),
+            "rating_average": film_ratings['average'],
+            "rating_count": film_ratings['count'],
+            "resume_position": resume_position})
 
-        if request.user.is_authenticated:
+    async def post(self, request, id):
+        form = RatingForm(request.POST)
 
-            if Ratings.objects.filter(user_id=request.user.id).select_related('user'):
-                return redirect('watch', id)
+        if await Ratings.objects.filter(user_id=request.user.id).aexists():
+            return redirect('watch', id)
 
-            else:
-                if form.is_valid():
-                    comment = form.cleaned_data['comments']
-                    # ustaw tu pozniej z fronta
-                    rating = Ratings(rating=5, film_id=id,
-                                     user_id=request.user.id, comments=comment)
-                    rating.save()
-                return redirect('watch', id)
+        if form.is_valid():
+            comment = form.cleaned_data['comments']
+            # ustaw tu pozniej z fronta
+            # Ocena i agregaty filmu (rating_sum/rating_count) w jednej transakcji
+            await sync_to_async(add_rating)(request.user.id, id, 5, comment)
+        return redirect('watch', id)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class VProgress(View):
-    def post(self, request, *args, **kwargs):
+    """ Zapis pozycji odtwarzania wysyłany przez odtwarzacz co kilka sekund
+
+    Widok asynchroniczny: pod ASGI tysiące równoczesnych widzów obsługuje
+    jeden proces, a zapis trafia do Redisa przez klienta asyncio.
+    """
+
+    async def post(self, request, *args, **kwargs):
         try:
-            user_id = request.user.id
-            video_id = request.session["video_id"]
+            # Sesja i użytkownik w jednym przejściu do wątku
+            user_id, video_id = await sync_to_async(
+                lambda: (request.user.id, request.session["video_id"]))()
 
             data = json.loads(request.body)
 
@@ -150,10 +401,8 @@ class VProgress(View):
             if user_id is None:
                 return None
             else:
-                video_progress, created = VideoProgress.objects.update_or_create(
-                    film_id=video_id, user_id=user_id, defaults={
-                        'last_watched': progress_time}
-                )
+                # Zapis trafia do bufora w Redisie, do bazy zrzuca go Celery beat
+                await abuffer_progress(user_id, video_id, float(progress_time))
 
             return JsonResponse({'status': 'success', 'progress_time': progress_time})
         except Exception as e:
@@ -167,4 +416,21 @@ class FilmProgressView(TemplateView):
         context = super().get_context_data(**kwargs)
         # Przekazanie film_id do template
         context['film_id'] = kwargs['film_id']
+        # Ostatni zapisany stan - strona pokazuje go przed pierwszą wiadomością WebSocket
+        context['job'] = TranscodeJob.objects.filter(
+            film_id=kwargs['film_id']).order_by('-created_at').first()
         return context
+
+
+class MetricsView(View):
+    """ Metryki żądań (films.middleware) w formacie Prometheusa
+
+    Dostępne z adresów z METRICS_ALLOWED_IPS albo dla administratorów.
+    """
+
+    def get(self, request):
+        allowed_ips = getattr(settings, "METRICS_ALLOWED_IPS", DEFAULT_METRICS_ALLOWED_IPS)
+        if request.META.get("REMOTE_ADDR") not in allowed_ips and not request.user.is_staff:
+            return HttpResponse(status=403)
+        return HttpResponse(metrics.render(),
+                            content_type="text/plain; version=0.0.4; charset=utf-8")
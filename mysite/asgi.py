@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Produkcyjnie np. `daphne -b 0.0.0.0 -p 8000 mysite.asgi:application` lub
+`uvicorn mysite.asgi:application --workers 4` - odtwarzacz i zapis postępu
+(VideoViewer, VProgress) są asynchroniczne, więc jeden proces obsługuje
+tysiące równoczesnych widzów.
 """
 
 import os
@@ -13,4 +18,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
-application = get_asgi_application()
+# Django musi być zainicjalizowane przed importem consumerów
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from films.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+})
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 
 # Ustaw zmienną środowiskową na plik settings.py
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
@@ -12,6 +13,34 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 # Automatyczne ładowanie zadań z aplikacji Django
 app.autodiscover_tasks()
 
+# Osobne workery na kolejki (trasy w settings.CELERY_TASK_ROUTES); liczbę
+# procesów bierze z settings.QUEUE_CONCURRENCY, -c ją nadpisuje:
+#   celery -A mysite worker -Q transcode_heavy,transcode_chunks -n heavy@%h
+#   celery -A mysite worker -Q transcode_light -n light@%h
+#   celery -A mysite worker -Q io,celery -n io@%h
+
+
+def queue_concurrency(queues):
+    """ Najmniejszy limit procesów spośród kolejek workera (None - brak limitu) """
+    from django.conf import settings
+    limits = getattr(settings, "QUEUE_CONCURRENCY", {})
+    caps = [limits[queue] for queue in queues if queue in limits]
+    return min(caps) if caps else None
+
+
+@celeryd_init.connect
+def limit_worker_concurrency(sender=None, conf=None, options=None, **kwargs):
+    """ Ustawia worker_concurrency według kolejek podanych w -Q """
+    options = options or {}
+    if options.get("concurrency"):
+        return
+    queues = options.get("queues") or [conf.task_default_queue]
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    concurrency = queue_concurrency(queues)
+    if concurrency:
+        conf.worker_concurrency = concurrency
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -0,0 +1,10 @@
+""" Wspólne połączenie z Redisem cache'u dla aplikacji projektu """
+from django_redis import get_redis_connection
+
+
+def redis_connection():
+    """ Połączenie z Redisem cache'u albo None, gdy cache nie stoi na Redisie """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
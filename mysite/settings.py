@@ -22,15 +22,133 @@ SECRET_KEY = config('SECRET_KEY')
 DEBUG = True
 LOGIN_URL = '/login'
 ALLOWED_HOSTS = []
-MEDIA_ROOT = os.path.join(BASE_DIR, 'films\\files')
+MEDIA_ROOT = os.path.join(BASE_DIR, 'films', 'files')
 MEDIA_URL = '/media/'
+# Źródła, miniatury, HLS i podglądy idą przez default storage (films.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# S3/MinIO (django-storages i boto3) - serwery www i workery kodujące bez
+# wspólnego dysku. Playlisty HLS wskazują segmenty względnie, więc bucket
+# musi być czytelny bez podpisu (querystring_auth) albo stać za CDN.
+# STORAGES['default'] = {
+#     'BACKEND': 'storages.backends.s3.S3Storage',
+#     'OPTIONS': {
+#         'bucket_name': config('MEDIA_BUCKET'),
+#         'endpoint_url': config('MEDIA_ENDPOINT_URL', default=None),
+#         'querystring_auth': False,
+#         'file_overwrite': True,
+#     },
+# }
+# Liczba równoległych wysyłek segmentów do storage
+# MEDIA_UPLOAD_WORKERS = 8
+# Przekazanie wysyłki plików serwerowi www: prefiks lokalizacji "internal"
+# nginx (np. '/protected-media/') albo X-Sendfile dla Apache
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_X_SENDFILE = False
+# Skrót SHA-256 przesyłanych plików liczony w trakcie zapisu (films.uploads)
+FILE_UPLOAD_HANDLERS = [
+    'films.uploads.ContentHashUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+# Kodowanie, lżejsze zadania po kodowaniu i zapisy do bazy mają osobne
+# kolejki, żeby długie konwersje nie blokowały reszty (films.queues)
+CELERY_TASK_ROUTES = {
+    'films.tasks.convert_to_hls_task': {'queue': 'transcode_heavy'},
+    'films.tasks.transcode_chunk_task': {'queue': 'transcode_chunks'},
+    'films.tasks.finalize_chunks_task': {'queue': 'transcode_light'},
+    'films.tasks.generate_previews_task': {'queue': 'transcode_light'},
+    'films.tasks.flush_video_progress_task': {'queue': 'io'},
+    'films.tasks.cleanup_film_media_task': {'queue': 'io'},
+    'films.tasks.sweep_orphaned_media_task': {'queue': 'io'},
+    'users.tasks.send_emails_task': {'queue': 'io'},
+    'users.tasks.flush_emails_task': {'queue': 'io'},
+}
+# Priorytety 0-9 w Redisie (0 = najwyższy, Film.PRIORITY_*).
+# Niepotwierdzone zadanie Redis oddaje innemu workerowi po visibility_timeout
+# (domyślnie 1 h) - musi on być dłuższy niż najdłuższa konwersja, inaczej
+# długi film byłby kodowany drugi raz równolegle
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    'visibility_timeout': 7 * 3600,
+}
+# Liczba procesów workera, gdy nie podano -c: najmniejszy limit spośród
+# obsługiwanych kolejek (mysite/celery.py); ogranicza równoległe FFmpeg-i
+QUEUE_CONCURRENCY = {
+    'transcode_heavy': 2,
+    'transcode_chunks': 2,
+    'transcode_light': 4,
+    'io': 8,
+}
+# Worker kodujący bierze tylko jedno zadanie naraz, resztę zostawia w kolejce
+# dla wolnych workerów; zadanie jest potwierdzane dopiero po zakończeniu
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+# Twardy limit czasu zadania - równy blokadzie konwersji (HLS_LOCK_TIMEOUT)
+# i krótszy niż visibility_timeout
+CELERY_TASK_TIME_LIMIT = 6 * 3600
+# Powyżej tylu oczekujących konwersji nowe filmy są odrzucane
+# TRANSCODE_BACKLOG_LIMIT = 20
+CELERY_BEAT_SCHEDULE = {
+    # Zrzut zbuforowanego postępu oglądania do bazy
+    'flush-video-progress': {
+        'task': 'films.tasks.flush_video_progress_task',
+        'schedule': 30.0,
+    },
+    # Maile z kolejki (users.tasks.queue_emails) paczkami po jednym połączeniu SMTP
+    'flush-emails': {
+        'task': 'users.tasks.flush_emails_task',
+        'schedule': 10.0,
+    },
+    # Pliki w storage, których nie używa żaden film (films.cleanup)
+    'sweep-orphaned-media': {
+        'task': 'films.tasks.sweep_orphaned_media_task',
+        'schedule': 24 * 3600.0,
+    },
+}
+# Przegląd pomija pliki młodsze niż tyle sekund
+# MEDIA_SWEEP_MIN_AGE = 86400
+# Długość rzędu "oglądaj dalej" na stronie startowej
+# CONTINUE_WATCHING_SIZE = 20
+# Liczba wyników wyszukiwania i podpowiedzi tytułów (films.search)
+# SEARCH_RESULTS = 20
+# SEARCH_SUGGESTIONS = 10
+
+# Drabinka jakości HLS (name, height, video_bitrate, maxrate, bufsize,
+# audio_bitrate); domyślnie films.hls.DEFAULT_HLS_RENDITIONS
+# HLS_RENDITIONS = [...]
+# Profile kodowania (codec, preset, crf, segment_time, threads, ...);
+# domyślnie films.hls.DEFAULT_ENCODER_PROFILES i profil 'balanced'
+# HLS_ENCODER_PROFILES = {...}
+# HLS_DEFAULT_PROFILE = 'balanced'
+# Filmy dłuższe niż HLS_PARALLEL_MIN_DURATION (s) są kodowane równolegle
+# w częściach po ok. HLS_CHUNK_SECONDS (s); domyślnie 600 i 120
+# HLS_PARALLEL_MIN_DURATION = 600
+# HLS_CHUNK_SECONDS = 120
+# Maksymalny czas (s) blokady konwersji danego źródła; domyślnie 6 h
+# HLS_LOCK_TIMEOUT = 21600
+# Źródła H.264/AAC z klatką kluczową co najwyżej co
+# HLS_REMUX_MAX_KEYFRAME_INTERVAL (s) są przepakowywane bez rekompresji,
+# o ile film nie ma wybranego profilu kodowania
+# HLS_REMUX = True
+# HLS_REMUX_MAX_KEYFRAME_INTERVAL = 10
 
 INSTALLED_APPS = [
+    # Serwer ASGI także dla runserver (widoki async i WebSockety)
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -76,7 +194,19 @@ EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = 30
+# Odstęp (s) pierwszego ponowienia nieudanej wysyłki, kolejne są dwa razy dłuższe
+# EMAIL_RETRY_BACKOFF = 30
+# Najwięcej maili wysyłanych jednym połączeniem SMTP
+# EMAIL_BATCH_SIZE = 100
+# Żądania dłuższe niż tyle sekund są logowane razem z SQL-em; None wyłącza
+# SLOW_REQUEST_THRESHOLD = 1.0
+# Adresy (np. Prometheusa), z których /metrics jest dostępne bez logowania
+# METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
 MIDDLEWARE = [
+    # Pierwszy, żeby mierzyć całą obsługę żądania (nagłówek Server-Timing,
+    # metryki pod /metrics i log wolnych żądań)
+    'films.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -4,13 +4,20 @@ from django.urls import path
 from users.views import *
 from films.views import *
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
+from django.urls import re_path
+from films.media import serve_media
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('start', startView.as_view(), name='start'),
+    path('api/films', FilmCatalogueApi.as_view(), name='film_catalogue'),
+    path('api/search', FilmSearchApi.as_view(), name='film_search'),
+    path('api/search/suggest', FilmSuggestApi.as_view(), name='film_suggest'),
+    path('api/continue-watching', ContinueWatchingApi.as_view(),
+         name='continue_watching'),
+    path('api/progress/<int:film_id>', ResumePositionApi.as_view(),
+         name='resume_position'),
     path('watch/<int:id>', VideoViewer.as_view(), name='watch'),
     path('register', Register.as_view(), name='register'),
     path('activate/<uidb64>/<token>/',
@@ -26,11 +33,20 @@ urlpatterns = [
          VProgress.as_view(), name='progress'),
     path('film_progress/<int:film_id>/',
          FilmProgressView.as_view(), name='film_progress'),
+    path('upload/', ChunkedUploadCreate.as_view(), name='upload_create'),
+    path('upload/<uuid:upload_id>/',
+         ChunkedUploadChunk.as_view(), name='upload_chunk'),
+    path('upload/<uuid:upload_id>/finalize/',
+         ChunkedUploadFinalize.as_view(), name='upload_finalize'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
 
 
 
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+# Pliki multimedialne z obsługą Range/ETag; w produkcji najlepiej z
+# MEDIA_ACCEL_REDIRECT (nginx) lub MEDIA_X_SENDFILE (Apache)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'),
+            serve_media, name='media'),
+]
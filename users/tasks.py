@@ -0,0 +1,106 @@
+from celery import shared_task
+import json
+import logging
+import smtplib
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from mysite.redis_connection import redis_connection
+logger = logging.getLogger(__name__)
+
+# Ponowienia wysyłki: 30 s, 60 s, 120 s... (settings.EMAIL_RETRY_BACKOFF)
+DEFAULT_EMAIL_RETRY_BACKOFF = 30
+EMAIL_MAX_RETRIES = 5
+# Lista Redisa z mailami czekającymi na zbiorczą wysyłkę (flush_emails_task)
+OUTBOX_KEY = "emails:outbox"
+# Najwięcej maili wysyłanych jednym połączeniem SMTP (settings.EMAIL_BATCH_SIZE)
+DEFAULT_EMAIL_BATCH_SIZE = 100
+
+
+def email_message(subject, body, to):
+    """ Wiadomość w postaci, którą da się przesłać do Celery jako JSON """
+    return {"subject": subject, "body": body, "to": list(to)}
+
+
+def queue_emails(messages):
+    """ Odkłada wiadomości do kolejki wysyłanej paczkami przez Celery beat
+
+    Bez Redisa wiadomości od razu trafiają do osobnego zadania.
+    """
+    conn = redis_connection()
+    if conn is None:
+        send_emails_task.delay(list(messages))
+        return
+    conn.rpush(OUTBOX_KEY, *(json.dumps(message) for message in messages))
+
+
+def _take_batch(conn, size):
+    pipe = conn.pipeline(transaction=True)
+    pipe.lrange(OUTBOX_KEY, 0, size - 1)
+    pipe.ltrim(OUTBOX_KEY, size, -1)
+    return pipe.execute()[0]
+
+
+@shared_task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def send_emails_task(self, messages):
+    """ Wysyła paczkę wiadomości jednym połączeniem SMTP
+
+    Wiadomości, których nie udało się wysłać, są ponawiane z rosnącym
+    odstępem - wysłane nie trafiają do ponowienia, więc nikt nie dostaje
+    tego samego maila dwa razy.
+    """
+    failed = []
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            try:
+                connection.send_messages([EmailMessage(
+                    message["subject"], message["body"],
+                    settings.EMAIL_HOST_USER, message["to"],
+                    connection=connection)])
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning(f"⚠️ Nie wysłano maila do {message['to']}: {e}")
+                failed.append(message)
+    except (smtplib.SMTPException, OSError) as e:
+        # Serwer pocztowy niedostępny - ponawiamy całą paczkę
+        logger.warning(f"⚠️ Brak połączenia z serwerem pocztowym: {e}")
+        failed = list(messages)
+    finally:
+        connection.close()
+
+    sent = len(messages) - len(failed)
+    if sent:
+        logger.info(f"📧 Wysłano {sent} maili")
+    if failed:
+        backoff = getattr(settings, "EMAIL_RETRY_BACKOFF", DEFAULT_EMAIL_RETRY_BACKOFF)
+        try:
+            raise self.retry(args=(failed,),
+                             countdown=backoff * 2 ** self.request.retries)
+        except self.MaxRetriesExceededError:
+            logger.error(f"❌ Porzucono {len(failed)} maili po {self.max_retries} próbach")
+    return sent
+
+
+@shared_task
+def flush_emails_task():
+    """ Okresowo (Celery beat) dzieli kolejkę maili na paczki po EMAIL_BATCH_SIZE
+
+    Każda paczka to jedno zadanie send_emails_task, czyli jedno połączenie SMTP.
+    """
+    conn = redis_connection()
+    if conn is None:
+        return 0
+    size = getattr(settings, "EMAIL_BATCH_SIZE", DEFAULT_EMAIL_BATCH_SIZE)
+    queued = 0
+    while True:
+        batch = _take_batch(conn, size)
+        if not batch:
+            break
+        try:
+            send_emails_task.delay([json.loads(message) for message in batch])
+        except Exception:
+            # Broker niedostępny - maile wracają na początek kolejki
+            conn.lpush(OUTBOX_KEY, *reversed(batch))
+            raise
+        queued += len(batch)
+    return queued
@@ -3,13 +3,21 @@ from django.test import TestCase
 from users.tokens import account_activation_token
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from unittest.mock import patch
 from django.contrib.messages import get_messages
 from .forms import RegisterForm, LoginForm, EmailForm
 from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from celery.exceptions import Retry
+from .tasks import OUTBOX_KEY, email_message, flush_emails_task, send_emails_task
+from mysite.redis_connection import redis_connection
+import json
+import smtplib
 
 
 class RegisterViewTest(TestCase):
@@ -243,3 +251,70 @@ class TokenValidationTests(TestCase):
                         for m in messages))
 
         self.assertTemplateUsed(response, 'users/register.html')
+
+
+class SendEmailsTaskTest(TestCase):
+    def setUp(self):
+        redis_connection().delete(OUTBOX_KEY)
+
+    def test_token_queues_email_instead_of_sending(self):
+        for i in range(2):
+            User.objects.create_user(
+                username=f'testuser{i}', email=f'test{i}@example.com',
+                password='StrongPass123!')
+        with patch('users.tasks.send_emails_task.delay') as mock_delay:
+            for i in range(2):
+                self.client.post(reverse('email_for_password_change'),
+                                 {'email': f'test{i}@example.com'})
+            mock_delay.assert_not_called()
+            self.assertEqual(flush_emails_task(), 2)
+        # Obie wiadomości w jednej paczce, czyli jednym połączeniu SMTP
+        mock_delay.assert_called_once()
+        messages = mock_delay.call_args[0][0]
+        self.assertEqual([m['to'] for m in messages],
+                         [['test0@example.com'], ['test1@example.com']])
+        self.assertIn('/reset/', messages[0]['body'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(redis_connection().llen(OUTBOX_KEY), 0)
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_flush_splits_outbox_into_batches(self):
+        redis_connection().rpush(OUTBOX_KEY, *(json.dumps(email_message('S', 'B', [f'u{i}@example.com']))
+                                     for i in range(5)))
+        with patch('users.tasks.send_emails_task.delay') as mock_delay:
+            self.assertEqual(flush_emails_task(), 5)
+        self.assertEqual([len(call.args[0]) for call in mock_delay.call_args_list], [2, 2, 1])
+
+    def test_outbox_kept_when_broker_is_down(self):
+        redis_connection().rpush(OUTBOX_KEY, json.dumps(email_message('S', 'B', ['u@example.com'])))
+        with patch('users.tasks.send_emails_task.delay', side_effect=OSError):
+            with self.assertRaises(OSError):
+                flush_emails_task()
+        self.assertEqual(redis_connection().llen(OUTBOX_KEY), 1)
+
+    def test_batch_sent_over_one_connection(self):
+        messages = [email_message('Subject', 'Body', [f'user{i}@example.com'])
+                    for i in range(3)]
+        with patch('users.tasks.get_connection', wraps=get_connection) as mock_connection:
+            sent = send_emails_task(messages)
+        self.assertEqual(sent, 3)
+        mock_connection.assert_called_once()
+        self.assertEqual([m.to for m in mail.outbox],
+                         [[f'user{i}@example.com'] for i in range(3)])
+
+    def test_only_failed_messages_are_retried(self):
+        messages = [email_message('Subject', 'Body', [address])
+                    for address in ('ok@example.com', 'bad@example.com')]
+        original = locmem.EmailBackend.send_messages
+
+        def flaky_send(backend, email_messages):
+            if email_messages[0].to == ['bad@example.com']:
+                raise smtplib.SMTPRecipientsRefused({})
+            return original(backend, email_messages)
+
+        with patch.object(locmem.EmailBackend, 'send_messages', flaky_send), \
+                patch.object(send_emails_task, 'retry', side_effect=Retry()) as mock_retry:
+            with self.assertRaises(Retry):
+                send_emails_task(messages)
+        self.assertEqual([m.to for m in mail.outbox], [['ok@example.com']])
+        self.assertEqual(mock_retry.call_args.kwargs['args'], ([messages[1]],))
@@ -3,7 +3,6 @@ from django.views.generic import TemplateView
 from .models import User
 from .forms import RegisterForm, LoginForm, ResetForm, EmailForm, ResetForm
 from django.shortcuts import render
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -16,14 +15,16 @@ from django.contrib.auth import logout
 import json
 from .exceptions import *
 from .tokens import *
+from .tasks import email_message, queue_emails
 
 
 def token(request, insert, email, title, message, what_type):
     token = account_activation_token.make_token(insert)
     uid = urlsafe_base64_encode(force_bytes(insert.pk))
     activation_link = f"{request.scheme}://{request.get_host()}/{what_type}/{uid}/{token}/"
-    send_mail(f'{title}',  f"{message}: {activation_link}",
-              settings.EMAIL_HOST_USER, [email])
+    # Wysyłka w tle, paczkami - odpowiedź nie czeka na serwer pocztowy
+    queue_emails(
+        [email_message(f'{title}', f"{message}: {activation_link}", [email])])
 
     #####################
 